@@ -1,5 +1,7 @@
+import hashlib
 import json
 import os
+import warnings
 
 import pandas as pd
 import numpy as np
@@ -43,3 +45,449 @@ def detect_zscore_anomalies(series, threshold):
     z_scores = (series - mean) / std
     anomalies = z_scores.abs() > threshold
     return anomalies
+
+
+# ----------- Rolling detection per cell -----------
+
+ROLLING_WINDOW = 96  # one day of 15-minute intervals
+
+
+def _cell_arrays(df, kpi, cell_col, date_col):
+    """KPI values, cell codes and int64 dates of a frame, as numpy arrays."""
+    values = pd.to_numeric(df[kpi], errors='coerce').to_numpy(dtype=np.float64)
+    codes = pd.factorize(df[cell_col])[0]
+    dates = pd.to_datetime(df[date_col]).to_numpy(dtype='datetime64[ns]').view(np.int64)
+    return values, codes, dates
+
+
+def rolling_stats_arrays(values, codes, dates, window=ROLLING_WINDOW):
+    """
+    Array version of `rolling_cell_stats`.
+
+    Args:
+        values (np.ndarray): float64 KPI values
+        codes (np.ndarray): int cell codes (-1 for a missing cell)
+        dates (np.ndarray): int64 timestamps
+        window (int): number of previous intervals
+
+    Returns:
+        mean, std, count (np.ndarray): in the order of the inputs
+    """
+    if not len(values):
+        return np.array([]), np.array([]), np.array([])
+
+    # Cells one after the other, each in date order
+    order = np.lexsort((dates, codes))
+    v = values[order]
+    g = codes[order]
+    valid = ~np.isnan(v)
+
+    # Values are centred on their cell mean to keep the cumulative sums accurate
+    n_cells = codes.max() + 2
+    cell_count = np.bincount(g + 1, weights=valid, minlength=n_cells)
+    cell_sum = np.bincount(g + 1, weights=np.where(valid, v, 0.0), minlength=n_cells)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        center = np.nan_to_num(cell_sum / cell_count)[g + 1]
+    x = np.where(valid, v - center, 0.0)
+
+    # Cumulative sums restart at each cell (exclusive of the current row)
+    terms = np.column_stack((valid.astype(np.float64), x, x * x))
+    cumulative = pd.DataFrame(terms).groupby(g, sort=False).cumsum().to_numpy() - terms
+    c, s, q = cumulative[:, 0], cumulative[:, 1], cumulative[:, 2]
+
+    # Window [lo, i) clipped to the start of the cell
+    positions = np.arange(len(v))
+    cell_start = np.flatnonzero(np.r_[True, g[1:] != g[:-1]])
+    starts = np.repeat(cell_start, np.diff(np.r_[cell_start, len(v)]))
+    lo = np.maximum(starts, positions - window)
+
+    n = np.rint(c - c[lo])
+    total = s - s[lo]
+    squares = q - q[lo]
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = total / n
+        var = np.maximum(squares - total * mean, 0.0) / (n - 1)
+    mean[n == 0] = np.nan
+    var[n < 2] = np.nan
+
+    mean_out, std_out, count_out = np.empty(len(v)), np.empty(len(v)), np.empty(len(v))
+    mean_out[order] = mean + center
+    std_out[order] = np.sqrt(var)
+    count_out[order] = n
+    return mean_out, std_out, count_out
+
+
+def rolling_cell_stats(df, kpi, window=ROLLING_WINDOW, cell_col='Cell Name', date_col='Date'):
+    """
+    Trailing mean and standard deviation of a KPI, per cell.
+
+    For each row, the statistics cover the `window` previous rows of the same
+    cell (the row itself excluded), in date order. All cells are handled in one
+    grouped cumulative sum (restarted at each cell), so the cost is linear in
+    the number of rows whatever the window and the number of cells.
+
+    Args:
+        df (pd.DataFrame): cleaned data (any number of sites and cells)
+        kpi (str): KPI column
+        window (int): number of previous intervals
+        cell_col (str): cell column
+        date_col (str): date column
+
+    Returns:
+        stats (pd.DataFrame): 'mean', 'std' and 'count' columns, aligned on df.index
+    """
+    mean, std, count = rolling_stats_arrays(*_cell_arrays(df, kpi, cell_col, date_col), window)
+    return pd.DataFrame({'mean': mean, 'std': std, 'count': count}, index=df.index)
+
+
+def rolling_zscore_mask(values, codes, dates, threshold=3.0, window=ROLLING_WINDOW, min_periods=None):
+    """Array version of `detect_rolling_zscore_anomalies`; also returns the Z-scores."""
+    if min_periods is None:
+        min_periods = max(window // 4, 2)
+
+    mean, std, count = rolling_stats_arrays(values, codes, dates, window)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        z_scores = (values - mean) / np.where(std > 0, std, np.nan)
+    return (np.abs(z_scores) > threshold) & (count >= min_periods), z_scores
+
+
+def moving_average_mask(values, codes, dates, threshold=2.0, window=5):
+    """Array version of `detect_moving_average_anomalies`; also returns the deviations (in std)."""
+    # Mean and std of the same trailing window: no later row changes a verdict
+    mean, std, _ = rolling_stats_arrays(values, codes, dates, window)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        deviations = (values - mean) / np.where(std > 0, std, np.nan)
+    return np.abs(deviations) > threshold, deviations
+
+
+def detect_rolling_zscore_anomalies(df, kpi, threshold=3.0, window=ROLLING_WINDOW, min_periods=None, cell_col='Cell Name', date_col='Date'):
+    """
+    Detects anomalies with a trailing Z-score computed per cell.
+
+    Each value is compared with the mean and std of the previous `window`
+    values of its own cell, instead of one mean over the mixed cells of a site.
+
+    Args :
+        df (pd.DataFrame): cleaned data
+        kpi (str): KPI column
+        threshold (float): Z-score threshold
+        window (int): number of previous intervals
+        min_periods (int): minimum number of previous values (default: window // 4)
+
+    Returns:
+        anomalies (pd.Series): boolean, aligned on df.index
+    """
+    mask, _ = rolling_zscore_mask(*_cell_arrays(df, kpi, cell_col, date_col), threshold, window, min_periods)
+    return pd.Series(mask, index=df.index)
+
+
+def detect_moving_average_anomalies(df, kpi, threshold=2.0, window=5, cell_col='Cell Name', date_col='Date'):
+    """
+    Detects deviations from the trailing moving average of each cell.
+
+    A value is anomalous when it is more than `threshold` standard deviations
+    away from the mean of the previous `window` values of its cell, both
+    computed on that same trailing window (no later value is used).
+
+    Args :
+        df (pd.DataFrame): cleaned data
+        kpi (str): KPI column
+        threshold (float): deviation threshold, in standard deviations
+        window (int): moving average window
+
+    Returns:
+        anomalies (pd.Series): boolean, aligned on df.index
+    """
+    mask, _ = moving_average_mask(*_cell_arrays(df, kpi, cell_col, date_col), threshold, window)
+    return pd.Series(mask, index=df.index)
+
+
+# ----------- Fleet-wide threshold detection -----------
+
+DIRECTION_MAX = "Maximum à ne pas dépasser"
+DIRECTION_MIN = "Minimum à respecter"
+ID_COLUMNS = ['Date', 'eNodeB Name', 'Cell Name']
+CHUNK_SIZE = 200_000
+
+
+def normalize_direction(direction):
+    """
+    Canonical form of a threshold direction.
+
+    Accepts the French labels of threshold_config.json as well as "max"/"min"
+    and ">"/"<" spellings.
+
+    Returns:
+        direction (str): "max", "min", or None if not recognised
+    """
+    if direction is None:
+        return None
+    text = str(direction).strip().lower()
+    if text in ("max", "maximum", ">", ">=") or text.startswith("maximum"):
+        return "max"
+    if text in ("min", "minimum", "<", "<=") or text.startswith("minimum"):
+        return "min"
+    return None
+
+
+def threshold_rules(config, columns):
+    """
+    Active threshold rules of a config, as arrays.
+
+    Args:
+        config (dict): output of `load_threshold_config()`
+        columns (list): available KPI columns
+
+    Returns:
+        kpis (list), thresholds (np.ndarray), is_max (np.ndarray of bool)
+    """
+    kpis = [
+        kpi for kpi, rule in config.items()
+        if kpi in columns and rule.get("threshold") and normalize_direction(rule.get("direction"))
+    ]
+    thresholds = np.array([float(config[kpi]["threshold"]) for kpi in kpis])
+    is_max = np.array([normalize_direction(config[kpi]["direction"]) == "max" for kpi in kpis], dtype=bool)
+    return kpis, thresholds, is_max
+
+
+def detect_threshold_anomalies(df, config, id_columns=None, chunk_size=CHUNK_SIZE):
+    """
+    Checks every KPI of every site and cell against its threshold at once.
+
+    The KPIs of `config` are compared as one (rows x KPIs) matrix against the
+    vector of thresholds, chunk by chunk to bound memory. As in the plot
+    functions, "Maximum à ne pas dépasser" flags values above the threshold,
+    "Minimum à respecter" values below it, and a threshold of 0 (the dashboard
+    default) means no threshold.
+
+    Args:
+        df (pd.DataFrame): cleaned data of the whole network
+        config (dict): output of `load_threshold_config()`
+        id_columns (list): columns copied to the anomaly table (default: date, site, cell)
+        chunk_size (int): number of rows compared at a time
+
+    Returns:
+        anomalies (pd.DataFrame): one row per anomaly with the id columns and
+            'KPI', 'Value', 'Threshold', 'Direction'
+    """
+    if id_columns is None:
+        id_columns = [col for col in ID_COLUMNS if col in df.columns]
+
+    kpis, thresholds, is_max = threshold_rules(config, df.columns)
+
+    # KPI columns left as text by the cleaning (missing values) are compared numerically
+    values = df[kpis]
+    text_cols = values.select_dtypes(exclude=['number']).columns
+    if len(text_cols):
+        values = values.assign(**{col: pd.to_numeric(values[col], errors='coerce') for col in text_cols})
+
+    rows, cols, hits = [np.array([], dtype=np.int64)], [np.array([], dtype=np.int64)], [np.array([])]
+    for start in range(0, len(df), chunk_size):
+        block = values.iloc[start:start + chunk_size].to_numpy(dtype=np.float64)
+        with np.errstate(invalid='ignore'):
+            mask = np.where(is_max, block > thresholds, block < thresholds)
+        block_rows, block_cols = np.nonzero(mask)
+        rows.append(block_rows + start)
+        cols.append(block_cols)
+        hits.append(block[block_rows, block_cols])
+
+    rows, cols = np.concatenate(rows), np.concatenate(cols)
+
+    anomalies = df[id_columns].take(rows).reset_index(drop=True)
+    anomalies["KPI"] = pd.Categorical.from_codes(cols, categories=kpis)
+    anomalies["Value"] = np.concatenate(hits)
+    anomalies["Threshold"] = thresholds[cols]
+    anomalies["Direction"] = pd.Categorical(
+        np.where(is_max[cols], DIRECTION_MAX, DIRECTION_MIN), categories=[DIRECTION_MAX, DIRECTION_MIN]
+    )
+    return anomalies
+
+
+# ----------- Isolation Forest (multivariate, per site) -----------
+
+MODEL_DIR = os.path.join(".cache", "models")
+SCORE_BATCH_SIZE = 50_000
+
+
+def _training_window(df, date_col):
+    dates = pd.to_datetime(df[date_col])
+    return (dates.min().date().isoformat(), dates.max().date().isoformat())
+
+
+def _model_path(group, features, window, model_dir):
+    """Models are keyed by group, feature set (in order) and training window; the parameters are in the bundle."""
+    key = json.dumps([str(group), list(features), list(window)], default=str)
+    digest = hashlib.sha256(key.encode("utf-8")).hexdigest()[:16]
+    safe_group = "".join(ch if ch.isalnum() or ch in "-_" else "_" for ch in str(group))
+    return os.path.join(model_dir, f"{safe_group}-{digest}.joblib")
+
+
+def load_site_model(group, features, window, model_dir=MODEL_DIR):
+    """
+    Persisted Isolation Forest of a group, or None if it was not trained.
+
+    Returns:
+        bundle (dict): 'model' (IsolationForest), 'medians' (imputation values)
+            and 'params' (IsolationForest parameters of the training)
+    """
+    import joblib
+
+    path = _model_path(group, list(features), window, model_dir)
+    return joblib.load(path) if os.path.exists(path) else None
+
+
+def check_site_models(groups, features, window, model_dir=MODEL_DIR):
+    """
+    Groups without a persisted model for these features and training window.
+
+    Warns when some groups are missing (their rows are not scored) and raises
+    when none has a model, instead of returning unscored rows silently.
+
+    Returns:
+        missing (set): groups without a model
+    """
+    groups = list(groups)
+    missing = {group for group in groups if not os.path.exists(_model_path(group, list(features), window, model_dir))}
+    if groups and len(missing) == len(groups):
+        raise FileNotFoundError(
+            f"Aucun modèle Isolation Forest pour la fenêtre {tuple(window)} et ces KPIs (voir train_isolation_forests)."
+        )
+    if missing:
+        preview = ", ".join(sorted(map(str, missing))[:5])
+        warnings.warn(
+            f"{len(missing)} groupe(s) sans modèle Isolation Forest pour la fenêtre {tuple(window)}, non scorés : {preview}",
+            stacklevel=2,
+        )
+    return missing
+
+
+def _feature_matrix(df, features):
+    return df[features].apply(pd.to_numeric, errors='coerce').to_numpy(dtype=np.float64)
+
+
+def _fit_forest(X, forest_params):
+    """Worker: fits one Isolation Forest (missing values replaced by the training medians)."""
+    from sklearn.ensemble import IsolationForest
+
+    medians = np.nanmedian(X, axis=0)
+    medians = np.where(np.isnan(medians), 0.0, medians)
+    X = np.where(np.isnan(X), medians, X)
+
+    model = IsolationForest(n_jobs=1, **forest_params).fit(X)
+    return {"model": model, "medians": medians, "params": dict(forest_params)}
+
+
+def train_isolation_forests(df, features, group_col='eNodeB Name', date_col='Date', window=None,
+                            n_jobs=None, model_dir=MODEL_DIR, **forest_params):
+    """
+    Trains one multivariate Isolation Forest per site (or per cluster) in a process pool.
+
+    Each (cell, interval) row is a sample whose features are its KPI values.
+    Fitted models are written to `model_dir` with joblib, keyed by group,
+    feature set and training window, with their parameters in the bundle (so
+    scoring only needs the window); groups that already have a model for the
+    same key and parameters are not retrained.
+
+    Args:
+        df (pd.DataFrame): training data
+        features (list): KPI columns
+        group_col (str): one model per value of this column (site, cluster, ...)
+        date_col (str): date column
+        window (tuple): (first day, last day) of the training data (default: from df)
+        n_jobs (int): number of worker processes (default: number of CPUs)
+        model_dir (str): model directory
+        **forest_params: IsolationForest parameters (n_estimators, contamination, random_state, ...)
+
+    Returns:
+        window (tuple): training window to pass to `score_isolation_forests`
+    """
+    import joblib
+    from concurrent.futures import ProcessPoolExecutor
+
+    features = list(features)
+    if window is None:
+        window = _training_window(df, date_col)
+    os.makedirs(model_dir, exist_ok=True)
+
+    jobs = {}
+    for group, group_df in df.groupby(group_col, observed=True, sort=False):
+        path = _model_path(group, features, window, model_dir)
+        if not os.path.exists(path) or joblib.load(path).get("params") != forest_params:
+            jobs[path] = _feature_matrix(group_df, features)
+
+    n_jobs = min(n_jobs or os.cpu_count() or 1, len(jobs))
+    if n_jobs <= 1:
+        fitted = {path: _fit_forest(X, forest_params) for path, X in jobs.items()}
+    else:
+        with ProcessPoolExecutor(max_workers=n_jobs) as pool:
+            futures = {path: pool.submit(_fit_forest, X, forest_params) for path, X in jobs.items()}
+            fitted = {path: future.result() for path, future in futures.items()}
+
+    for path, bundle in fitted.items():
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        joblib.dump(bundle, tmp_path)
+        os.replace(tmp_path, path)
+
+    return window
+
+
+def score_isolation_forests(df, features, window, group_col='eNodeB Name', model_dir=MODEL_DIR,
+                            batch_size=SCORE_BATCH_SIZE):
+    """
+    Scores rows with the persisted per-site Isolation Forests, without retraining.
+
+    Args:
+        df (pd.DataFrame): data to score (e.g. a new day)
+        features (list): KPI columns, same order as for training
+        window (tuple): training window returned by `train_isolation_forests`
+        group_col (str): column the models were trained on
+        model_dir (str): model directory
+        batch_size (int): number of rows per `score_samples` call
+
+    Returns:
+        scores (pd.DataFrame): 'Score' (lower is more abnormal) and 'Anomaly'
+            columns aligned on df.index; rows of groups without a model are NaN / False
+            (a warning lists those groups, see `check_site_models`)
+    """
+    features = list(features)
+    score_values = np.full(len(df), np.nan)
+    anomalies = np.zeros(len(df), dtype=bool)
+
+    groups = df.groupby(group_col, observed=True, sort=False).indices
+    missing = check_site_models(groups, features, window, model_dir)
+
+    for group, positions in groups.items():
+        if group in missing:
+            continue
+        bundle = load_site_model(group, features, window, model_dir)
+
+        X = _feature_matrix(df.iloc[positions], features)
+        X = np.where(np.isnan(X), bundle["medians"], X)
+
+        group_scores = np.concatenate([
+            bundle["model"].score_samples(X[start:start + batch_size])
+            for start in range(0, len(X), batch_size)
+        ])
+        score_values[positions] = group_scores
+        anomalies[positions] = group_scores < bundle["model"].offset_
+
+    return pd.DataFrame({"Score": score_values, "Anomaly": anomalies}, index=df.index)
+
+
+"""
+Usage (morning check of the whole network) :
+    python anomaly_detector.py 2025-05-01 2025-05-02
+"""
+if __name__ == "__main__":
+    import sys
+    from kpi_store import query_store
+    from anomaly_store import save_anomalies
+    from incidents import build_incidents
+
+    df = query_store(sys.argv[1], sys.argv[-1])
+    anomalies = detect_threshold_anomalies(df, load_threshold_config())
+    save_anomalies(anomalies, detector="Seuil", start=sys.argv[1], end=sys.argv[-1])
+    print(f"{len(anomalies)} anomalies sur {df['eNodeB Name'].nunique() if len(df) else 0} sites")
+    incidents, _ = build_incidents(anomalies)
+    print(f"{len(incidents)} incidents")
+    print(incidents.drop(columns=['Cell Names']).head(30).to_string(index=False))
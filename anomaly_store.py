@@ -0,0 +1,253 @@
+import os
+import sqlite3
+from datetime import date, datetime, timedelta
+
+import pandas as pd
+import numpy as np
+
+# ----------- Indexed anomaly store (SQLite) -----------
+
+ANOMALY_DB = os.path.join("data", "anomalies.sqlite")
+CACHE_KIB = 64 * 1024  # SQLite page cache of a connection
+
+# Columns of the detector tables -> columns of the database
+COLUMNS = {
+    'Date': 'timestamp',
+    'eNodeB Name': 'site',
+    'Cell Name': 'cell',
+    'KPI': 'kpi',
+    'Method': 'detector',
+    'Rule': 'rule',
+    'Value': 'value',
+    'Threshold': 'reference',
+    'Reference': 'reference',
+    'Score': 'score',
+}
+TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS anomalies (
+    timestamp TEXT NOT NULL,
+    site      TEXT NOT NULL DEFAULT '',
+    cell      TEXT NOT NULL DEFAULT '',
+    kpi       TEXT NOT NULL DEFAULT '',
+    detector  TEXT NOT NULL,
+    rule      TEXT NOT NULL DEFAULT '',
+    value     REAL,
+    reference REAL,
+    score     REAL,
+    UNIQUE (cell, kpi, detector, rule, timestamp)
+);
+CREATE INDEX IF NOT EXISTS idx_anomalies_site_cell_kpi ON anomalies (site, cell, kpi, timestamp);
+CREATE INDEX IF NOT EXISTS idx_anomalies_kpi ON anomalies (kpi, timestamp);
+CREATE INDEX IF NOT EXISTS idx_anomalies_detector ON anomalies (detector, timestamp);
+"""
+
+
+def connect(path=ANOMALY_DB):
+    """Opens the anomaly database, creating the file and its indexes if needed."""
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    connection = sqlite3.connect(path)
+    connection.execute("PRAGMA journal_mode=WAL")
+    connection.execute(f"PRAGMA cache_size=-{CACHE_KIB}")
+    connection.executescript(_SCHEMA)
+    return connection
+
+
+def _as_timestamp(value):
+    """Bound of a date range as stored text; a bare day covers the whole day."""
+    if isinstance(value, str):
+        value = pd.Timestamp(value)
+    if isinstance(value, date) and not isinstance(value, datetime):
+        value = datetime.combine(value, datetime.min.time())
+    return pd.Timestamp(value).strftime(TIMESTAMP_FORMAT)
+
+
+def _end_timestamp(value):
+    """Exclusive upper bound: the day after a bare day, else the timestamp itself."""
+    if isinstance(value, str) and len(value) == 10:
+        value = date.fromisoformat(value)
+    if isinstance(value, date) and not isinstance(value, datetime):
+        return _as_timestamp(value + timedelta(days=1))
+    return _as_timestamp(pd.Timestamp(value) + pd.Timedelta(seconds=1))
+
+
+def save_anomalies(anomalies, detector=None, start=None, end=None, detectors=None, sites=None, path=ANOMALY_DB):
+    """
+    Saves the output of a detector to the anomaly store.
+
+    Accepts the tables of `detect_threshold_anomalies`, `detect_anomalies_parallel`,
+    `OnlineDetector.process` and `RulePlan.evaluate`. Saving the same anomaly
+    twice keeps one row (the latest values). When the detection window is given,
+    the previous anomalies of the detectors that were run are replaced in that
+    window, even for a detector with no hit this time, so a rerun with new
+    thresholds does not leave stale rows behind. The replace covers the whole
+    network unless `sites` lists the sites the detection ran on: rerunning one
+    site must pass `sites=[site]`, or the other sites lose their anomalies.
+
+    Args:
+        anomalies (pd.DataFrame): detector output
+        detector (str): detector name, required when the table has no 'Method' column
+        start, end: detection window (dates or timestamps, end included)
+        detectors (list): detectors that were run on the window, required with
+            start/end when the table has a 'Method' column (default: [detector])
+        sites (list): sites the detection ran on, to which the replace is
+            limited (default: every site)
+        path (str): database file
+
+    Returns:
+        n_rows (int): number of rows written
+    """
+    if 'Method' not in anomalies.columns and detector is None:
+        raise ValueError("Nom du détecteur requis (pas de colonne 'Method').")
+
+    replace = start is not None or end is not None
+    if replace:
+        if detectors is None and detector is not None:
+            detectors = [detector]
+        if not detectors:
+            raise ValueError("Détecteurs requis pour remplacer les anomalies d'une fenêtre (detectors=...).")
+        detectors = [str(name) for name in detectors]
+
+    n_rows = len(anomalies)
+    table = pd.DataFrame(index=range(n_rows))
+    for column, name in COLUMNS.items():
+        if column in anomalies.columns and name not in table.columns:
+            table[name] = anomalies[column].to_numpy()
+    if 'detector' not in table.columns:
+        table['detector'] = detector
+
+    table['timestamp'] = pd.to_datetime(table['timestamp']).dt.strftime(TIMESTAMP_FORMAT)
+    for name in ['site', 'cell', 'kpi', 'rule']:
+        if name in table.columns:
+            table[name] = table[name].astype(object).where(table[name].notna(), '').astype(str)
+        else:
+            table[name] = ''
+    for name in ['value', 'reference', 'score']:
+        if name in table.columns:
+            table[name] = pd.to_numeric(table[name], errors='coerce').astype(np.float64)
+        else:
+            table[name] = np.nan
+    table['detector'] = table['detector'].astype(str)
+    table = table.dropna(subset=['timestamp'])
+
+    if replace:
+        # A detector missing from the list would keep its stale rows in the window
+        unlisted = sorted(set(table['detector'].unique()) - set(detectors))
+        if unlisted:
+            raise ValueError(f"Détecteurs absents de detectors : {', '.join(unlisted)}")
+        if sites is not None:
+            sites = sorted({str(site) for site in sites})
+            outside = sorted(set(table['site'].unique()) - set(sites))
+            if outside:
+                raise ValueError(f"Sites absents de sites : {', '.join(outside[:10])}")
+
+    # Inserting in key order keeps the B-tree updates local (NaN is stored as NULL)
+    names = ['timestamp', 'site', 'cell', 'kpi', 'detector', 'rule', 'value', 'reference', 'score']
+    table = table.sort_values(['cell', 'kpi', 'detector', 'rule', 'timestamp'], kind='stable')
+    records = list(zip(*(table[name].tolist() for name in names)))
+
+    connection = connect(path)
+    try:
+        with connection:
+            if replace:
+                _delete(connection, detectors, start, end, sites)
+            connection.executemany(
+                f"INSERT OR REPLACE INTO anomalies ({', '.join(names)}) VALUES ({', '.join('?' * len(names))})",
+                records,
+            )
+    finally:
+        connection.close()
+    return len(records)
+
+
+SITES_PER_DELETE = 500  # below the SQLite limit of bound parameters
+
+
+def _delete(connection, detectors, start, end, sites=None):
+    clauses, params = [f"detector IN ({', '.join('?' * len(detectors))})"], list(detectors)
+    if start is not None:
+        clauses.append("timestamp >= ?")
+        params.append(_as_timestamp(start))
+    if end is not None:
+        clauses.append("timestamp < ?")
+        params.append(_end_timestamp(end))
+    if sites is None:
+        connection.execute(f"DELETE FROM anomalies WHERE {' AND '.join(clauses)}", params)
+        return
+    for i in range(0, len(sites), SITES_PER_DELETE):
+        chunk = sites[i:i + SITES_PER_DELETE]
+        connection.execute(
+            f"DELETE FROM anomalies WHERE {' AND '.join(clauses)} AND site IN ({', '.join('?' * len(chunk))})",
+            params + chunk,
+        )
+
+
+def query_anomalies(start=None, end=None, site=None, cells=None, kpi=None, detector=None, path=ANOMALY_DB):
+    """
+    Reads anomalies from the store; every filter is answered by an index.
+
+    Example, all CSSR anomalies of the week:
+        query_anomalies("2025-05-05", "2025-05-11", kpi="CSSR(%)")
+
+    Args:
+        start, end: date range (end included; a bare day covers the whole day)
+        site (str): site name
+        cells (list): cell names
+        kpi (str or list): KPI name(s)
+        detector (str or list): detector name(s) ("Seuil", "Z-score", "EWMA", ...)
+        path (str): database file
+
+    Returns:
+        anomalies (pd.DataFrame): 'Date', 'eNodeB Name', 'Cell Name', 'KPI',
+            'Method', 'Rule', 'Value', 'Reference', 'Score', sorted by date
+    """
+    clauses, params = [], []
+    if start is not None:
+        clauses.append("timestamp >= ?")
+        params.append(_as_timestamp(start))
+    if end is not None:
+        clauses.append("timestamp < ?")
+        params.append(_end_timestamp(end))
+    if site is not None:
+        clauses.append("site = ?")
+        params.append(str(site))
+    for name, values in [("cell", cells), ("kpi", kpi), ("detector", detector)]:
+        if values is None:
+            continue
+        values = [values] if isinstance(values, str) else list(values)
+        clauses.append(f"{name} IN ({', '.join('?' * len(values))})")
+        params.extend(str(value) for value in values)
+
+    where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+    connection = connect(path)
+    try:
+        table = pd.read_sql_query(
+            f"SELECT timestamp, site, cell, kpi, detector, rule, value, reference, score "
+            f"FROM anomalies {where} ORDER BY timestamp, site, cell, kpi",
+            connection, params=params,
+        )
+    finally:
+        connection.close()
+
+    table['timestamp'] = pd.to_datetime(table['timestamp'], format=TIMESTAMP_FORMAT)
+    for name in ['value', 'reference', 'score']:
+        table[name] = table[name].astype(np.float64)
+    return table.rename(columns={
+        'timestamp': 'Date', 'site': 'eNodeB Name', 'cell': 'Cell Name', 'kpi': 'KPI',
+        'detector': 'Method', 'rule': 'Rule', 'value': 'Value', 'reference': 'Reference', 'score': 'Score',
+    })
+
+
+"""
+Usage :
+    anomalies = detect_threshold_anomalies(df, load_threshold_config())
+    save_anomalies(anomalies, detector="Seuil", start=df['Date'].min(), end=df['Date'].max())
+
+    found = detect_anomalies_parallel(df, config, detectors=['threshold', 'zscore'])
+    save_anomalies(found, start=df['Date'].min(), end=df['Date'].max(), detectors=["Seuil", "Z-score"])
+
+    cssr_week = query_anomalies("2025-05-05", "2025-05-11", kpi="CSSR(%)")
+"""
@@ -0,0 +1,144 @@
+import time
+
+import pandas as pd
+import numpy as np
+
+from preprocessing import clean_data1, clean_data2, parse_timestamps
+
+# ----------- Synthetic OSS export -----------
+
+def make_oss_export(n_sites=50, cells_per_site=3, n_intervals=96, n_kpis=100, seed=0):
+    """
+    Builds a raw 15-minute OSS export as it comes out of the Excel file:
+    KPIs stored as strings with decimal commas, "%" suffixes and a few "/0" cells.
+
+    Args:
+        n_sites (int): number of eNodeBs
+        cells_per_site (int): number of cells per eNodeB
+        n_intervals (int): number of 15-minute intervals
+        n_kpis (int): number of KPI columns
+        seed (int): random seed
+
+    Returns:
+        df (pd.DataFrame)
+    """
+    rng = np.random.default_rng(seed)
+
+    dates = pd.date_range("2025-05-01", periods=n_intervals, freq="15min").strftime("%Y-%m-%d %H:%M")
+    sites = [f"CoMPT_AGA{1000 + s}_999_Site" for s in range(n_sites)]
+    cells = [f"{site}_{c + 1}" for site in sites for c in range(cells_per_site)]
+    n_rows = len(cells) * n_intervals
+
+    df = pd.DataFrame({
+        "Date": np.tile(dates, len(cells)),
+        "eNodeB Name": np.repeat([cell.rsplit("_", 1)[0] for cell in cells], n_intervals),
+        "eNodeB Function Name": np.repeat([cell.rsplit("_", 1)[0] for cell in cells], n_intervals),
+        "Cell Name": np.repeat(cells, n_intervals),
+        "LocalCell Id": np.repeat(np.tile(np.arange(cells_per_site), n_sites), n_intervals),
+        "Cell FDD TDD Indication": "CELL_FDD",
+    })
+
+    kpis = {}
+    for k in range(n_kpis):
+        values = np.round(rng.uniform(0, 100, n_rows), 2).astype(str)
+        if k % 3 == 0:
+            values = np.char.replace(values, ".", ",")
+        if k % 5 == 0:
+            values = np.char.add(values, "%")
+        values = values.astype(object)
+        values[rng.random(n_rows) < 0.0005] = "0/0"
+        values[rng.random(n_rows) < 0.01] = np.nan
+        kpis[f"KPI {k}"] = values
+    df = pd.concat([df, pd.DataFrame(kpis)], axis=1)
+
+    # A few exact duplicated rows, as produced by overlapping exports
+    return pd.concat([df, df.iloc[:n_intervals]], ignore_index=True)
+
+
+# ----------- Reference (column-by-column) cleaning -----------
+
+def _legacy_clean(df, non_numeric_cols, reset_index):
+    df_clean = df.copy()
+    df_clean = df_clean.drop_duplicates()
+    df_clean = df_clean.dropna(axis='columns', how='all')
+
+    numeric_cols = [col for col in df_clean.columns if col not in non_numeric_cols]
+
+    for col in numeric_cols:
+        if df_clean[col].dtype == 'object':
+            mask = df_clean[col].astype(str).str.contains('/0', regex=False)
+            df_clean = df_clean[~mask]
+
+    for col in df_clean.columns:
+        if df_clean[col].dtype == 'object':
+            df_clean[col] = (
+                df_clean[col]
+                .astype(str)
+                .str.replace(',', '.', regex=False)
+                .str.replace('%', '', regex=False)
+                .str.replace(' ', '', regex=False)
+                .replace('', np.nan)
+            )
+            try:
+                df_clean[col] = pd.to_numeric(df_clean[col], errors='raise')
+            except ValueError:
+                pass
+
+    if reset_index:
+        df_clean.reset_index(drop=True, inplace=True)
+
+    return df_clean
+
+
+def legacy_clean_data1(df):
+    non_numeric_cols = ['Date', 'eNodeB Name', 'eNodeB Function Name', 'Cell Name', 'Cell FDD TDD Indication']
+    return _legacy_clean(df, non_numeric_cols, reset_index=True)
+
+
+def legacy_clean_data2(df):
+    non_numeric_cols = ['Time', 'Game time', 'eNodeB Name', 'Cell Name', 'Cell FDD TDD Indication', 'Cell Name', 'sector', 'Beam', 'LocalCell Id', 'eNodeB Function Name', 'Frequency band', 'LTECell Tx and Rx Mode', 'eNodeB identity']
+    df_clean = _legacy_clean(df, non_numeric_cols, reset_index=False)
+    return df_clean.rename(columns={'Time': 'Date'})
+
+
+# ----------- Timing -----------
+
+def time_call(func, *args, repeat=3):
+    """Returns the best wall-clock time (s) of `repeat` calls and the last result."""
+    best = float("inf")
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func(*args)
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def benchmark_cleaning(df, repeat=3):
+    """
+    Compares the cleaning engine against the column-by-column reference and checks
+    that both produce the same frame. The reference glues date and time together
+    ("YYYY-MM-DDHH:MM"): its dates are parsed and sorted before the comparison.
+    """
+    stadium_df = df.rename(columns={'Date': 'Time', 'LocalCell Id': 'Sector'})
+    stadium_df.insert(1, 'Game time', "1st half")
+
+    for label, legacy, engine, data, reset_index in [
+        ("clean_data1", legacy_clean_data1, clean_data1, df, True),
+        ("clean_data2", legacy_clean_data2, clean_data2, stadium_df, False),
+    ]:
+        legacy_time, expected = time_call(legacy, data, repeat=repeat)
+        engine_time, result = time_call(engine, data, repeat=repeat)
+
+        expected['Date'] = parse_timestamps(expected['Date'])
+        expected = expected.sort_values('Date', kind='stable')
+        if reset_index:
+            expected = expected.reset_index(drop=True)
+        pd.testing.assert_frame_equal(result, expected)
+        print(f"{label}: legacy {legacy_time:.2f}s | engine {engine_time:.2f}s | x{legacy_time / engine_time:.1f}")
+
+
+if __name__ == "__main__":
+    raw_df = make_oss_export()
+    print(f"Export : {raw_df.shape[0]} lignes x {raw_df.shape[1]} colonnes")
+    benchmark_cleaning(raw_df)
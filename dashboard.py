@@ -4,9 +4,16 @@ import numpy as np
 import matplotlib.pyplot as plt
 import os
 
-from preprocessing import clean_data
-from graph_generator import plot_kpi_time_series, plot_kpi_histogram, plot_dual_axis_kpi_time_series, plot_kpi_bar_chart, plot_kpi_anomaly_scatter
-from anomaly_detector import load_threshold_config, save_threshold_config
+from data_cache import load_cleaned_upload, upload_cache_key, cache_key, frame_key, FigureCache
+from kpi_store import append_to_store, list_store_dates, load_store_cube, query_store, store_version
+from kpi_cube import KPICube
+from graph_generator import PreparedSiteView, plot_kpi_time_series, plot_kpi_histogram, plot_dual_axis_kpi_time_series, plot_kpi_bar_chart, plot_kpi_anomaly_scatter, plot_kpi_correlation_heatmap, plot_fleet_heatmap
+from kpi_utils import kpi_correlation
+from anomaly_detector import load_threshold_config, save_threshold_config, detect_threshold_anomalies
+from anomaly_store import save_anomalies, query_anomalies
+from incidents import build_incidents
+from fleet_overview import fleet_anomaly_matrix
+from utils import SiteIndex
 
 threshold_config = load_threshold_config()
 
@@ -23,6 +30,69 @@ def set_page_config():
     st.markdown("<style> footer {visibility: hidden;} </style>", unsafe_allow_html=True)
 
 set_page_config()
+
+# ----------- Caching -----------
+# Reruns only rebuild what changed: frames, site index and figures are keyed by
+# the data version (`data_key`) and the exact arguments.
+
+@st.cache_resource(max_entries=2, show_spinner=False)
+def load_upload(data_key, _file_bytes):
+    """Cleaned upload kept in memory between reruns (backed by the Parquet cache)."""
+    return load_cleaned_upload(_file_bytes, compact=True)
+
+@st.cache_resource(max_entries=2, show_spinner=False)
+def load_history(data_key, start, end):
+    """History range; `data_key` changes when one of its partitions is rewritten."""
+    return query_store(start, end)
+
+@st.cache_resource(max_entries=4, show_spinner=False)
+def get_site_index(data_key, site_col, _df):
+    return SiteIndex(_df, site_col=site_col)
+
+@st.cache_resource(max_entries=8, show_spinner=False)
+def get_site_view(data_key, site, cells, _df, _site_index):
+    """Site rows prepared once for all the figures of the selected KPIs."""
+    return PreparedSiteView(_df, site, list(cells), site_index=_site_index)
+
+@st.cache_resource(max_entries=16, show_spinner=False)
+def get_site_cube(data_key, site, kpis, _df_site):
+    return KPICube(_df_site, kpis=list(kpis))
+
+@st.cache_resource(max_entries=2, show_spinner=False)
+def get_fleet_cube(data_key, kpis, history_range, _df):
+    """Daily (cell) rollup of the fleet: read from the history store, or built from the upload."""
+    if history_range:
+        return load_store_cube(history_range[0], history_range[-1])
+    return KPICube(_df, kpis=list(kpis), levels=['day'], scopes=['cell'])
+
+@st.cache_resource
+def get_figure_cache():
+    """Figures shared by all sessions, bounded in memory (see FigureCache)."""
+    return FigureCache()
+
+def cached_figure(plot, frame, *args, **kwargs):
+    """plot(frame, *args, **kwargs), reused while the data and the arguments are unchanged."""
+    key_part = frame.key if isinstance(frame, PreparedSiteView) else frame_key(frame)
+    key = cache_key(data_key, plot.__name__, key_part, args, kwargs)
+    return get_figure_cache().get_or_create(key, lambda: plot(frame, *args, **kwargs))
+
+def correlation_figure(frame, kpis, method, title):
+    return plot_kpi_correlation_heatmap(kpi_correlation(frame, kpis, method=method), title=title)
+
+def open_site(site):
+    """Drill-down: `site` becomes the site of the per-site charts."""
+    if site_index is not None and site in site_index.site_ranges:
+        st.session_state["selected_site"] = site
+
+def open_clicked_site():
+    selection = st.session_state["fleet_heatmap"].selection
+    if selection.points:
+        open_site(selection.points[0]["y"])
+
+def open_chosen_site():
+    if st.session_state["fleet_site"]:
+        open_site(st.session_state["fleet_site"])
+
 st.title("Analyse des Performances Radio 2G/3G/4G")
 
 # Image of stadium
@@ -39,25 +109,58 @@ with col_img[1]:
 left_col, right_col = st.columns([1, 3])
 
 df = None
+data_key = None
 df_site = None
+site_index = None
+site_view = None
 site_col = None
 selected_site = None
 selected_kpis = []
+numeric_cols = []
 normalize = True
+use_zscore = False
+zscore_threshold = 3.0
+use_moving_avg = False
+moving_avg_window = 5
 
 # ----------- Left Side -----------
 with left_col:
     st.markdown("### 📥 Chargement du rapport")
-    uploaded_file = st.file_uploader("Charger le rapport contenant les KPIs", type=["xlsx"])
+    data_source = st.radio("Source des données", ["Rapport importé", "Historique KPI"], horizontal=True)
+
+    uploaded_file = None
+    history_range = None
+    if data_source == "Rapport importé":
+        uploaded_file = st.file_uploader("Charger le rapport contenant les KPIs", type=["xlsx"])
+    else:
+        store_dates = list_store_dates()
+        if store_dates:
+            history_range = st.date_input(
+                "📅 Période",
+                value=(store_dates[0], store_dates[-1]),
+                min_value=store_dates[0],
+                max_value=store_dates[-1]
+            )
+        else:
+            st.info("L'historique est vide : importez un rapport puis ajoutez-le à l'historique.")
 
     graph_type = st.selectbox("📊 Type de graphique", 
         ["Graphique temporel", "Graphique 2 axes (double KPI)", "Graphique à barres", "Scatter Anomalies", "Histogramme"]
     )
 
-    if uploaded_file is not None:
+    if uploaded_file is not None or history_range:
         try:
-            df = pd.read_excel(uploaded_file)
-            df = clean_data(df)
+            if uploaded_file is not None:
+                file_bytes = uploaded_file.getvalue()
+                data_key = upload_cache_key(file_bytes, compact=True)
+                df = load_upload(data_key, file_bytes)
+
+                if st.button("💾 Ajouter le rapport à l'historique"):
+                    n_rows = append_to_store(df)
+                    st.success(f"{n_rows} lignes enregistrées dans l'historique.")
+            else:
+                data_key = store_version(history_range[0], history_range[-1])
+                df = load_history(data_key, history_range[0], history_range[-1])
 
             site_column = ["eNodeB Name", "Cell Name", "LocalCell Id"]
             for col in site_column:
@@ -66,9 +169,9 @@ with left_col:
                     break
 
             if site_col:
-                sites = df[site_col].dropna().unique()
-                selected_site = st.selectbox("🏗️ Sélectionner un site", sites)
-                df_site = df[df[site_col] == selected_site]
+                site_index = get_site_index(data_key, site_col, df)
+                selected_site = st.selectbox("🏗️ Sélectionner un site", site_index.sites, key="selected_site")
+                df_site = site_index.site_frame(selected_site)
             else:
                 st.warning("Aucune colonne de site reconnue.")
                 df_site = df
@@ -87,6 +190,7 @@ with left_col:
                 cell_options = ["Toutes les cellules", "Moyenne du site"] + list(available_cells)
                 default_selection = [available_cells[0]] if available_cells.size > 0 else []
                 selected_cells = st.multiselect("📶 Cellules à afficher", cell_options, default=default_selection)
+                site_view = get_site_view(data_key, selected_site, tuple(selected_cells), df, site_index)
             else:
                 selected_cells = []
             
@@ -111,6 +215,7 @@ with left_col:
             threshold_direction = {}
 
             if threshold_input:
+                updated_config = dict(threshold_config)
                 for kpi in selected_kpis:
                     existing = threshold_config.get(kpi, {})
                     default_thresh = existing.get("threshold", 0.0)
@@ -135,12 +240,31 @@ with left_col:
                     thresholds[kpi] = threshold_value
                     threshold_direction[kpi] = direction
 
-                    threshold_config[kpi] = {
+                    updated_config[kpi] = {
                         "threshold": threshold_value,
                         "direction": direction
                     }
-                
-                save_threshold_config(threshold_config)
+
+                # Written only when a value actually changed
+                if updated_config != threshold_config:
+                    save_threshold_config(updated_config)
+                    threshold_config = updated_config
+
+            if st.button("🗂️ Détecter et enregistrer les anomalies (seuils)"):
+                anomalies = detect_threshold_anomalies(df, threshold_config)
+                # Only the sites of these data are replaced in the store
+                sites = df["eNodeB Name"].unique() if "eNodeB Name" in df.columns else None
+                n_rows = save_anomalies(anomalies, detector="Seuil", start=df["Date"].min(), end=df["Date"].max(), sites=sites)
+                st.success(f"{n_rows} anomalies enregistrées.")
+
+            if graph_type == "Scatter Anomalies":
+                use_zscore = st.checkbox("📉 Z-score glissant par cellule", value=False)
+                if use_zscore:
+                    zscore_threshold = st.number_input("Seuil Z-score", value=3.0, min_value=0.5, step=0.5)
+
+                use_moving_avg = st.checkbox("〰️ Écart à la moyenne mobile par cellule", value=False)
+                if use_moving_avg:
+                    moving_avg_window = int(st.number_input("Fenêtre de la moyenne mobile", value=5, min_value=2, step=1))
             
 
         except Exception as e:
@@ -148,19 +272,46 @@ with left_col:
 
 # ----------- Right Side -----------
 with right_col:
-    if uploaded_file is not None and df is not None:
+    if df is not None:
         st.subheader("Aperçu des données")
         st.dataframe(df.head())
 
-        if selected_site and graph_type == "Graphique 2 axes (double KPI)":
+        # ----------- Fleet overview -----------
+        if site_col == "eNodeB Name" and st.checkbox("🗺️ Vue d'ensemble du parc", value=False):
+            fleet_kpis = tuple(kpi for kpi in threshold_config if kpi in df.columns and pd.api.types.is_numeric_dtype(df[kpi]))
+            if not fleet_kpis:
+                st.info("Aucun seuil configuré pour les KPIs des données.")
+            else:
+                columns = st.radio("Colonnes", ["Jours", "KPIs"], horizontal=True)
+                cube = get_fleet_cube(data_key, fleet_kpis, tuple(history_range or ()), df)
+                counts, health = fleet_anomaly_matrix(cube, threshold_config, by="day" if columns == "Jours" else "kpi")
+
+                if counts.empty:
+                    st.info("Aucune donnée journalière pour les KPIs à seuil sur cette période.")
+                else:
+                    n_sites = int(st.number_input("Sites affichés (les plus touchés)", min_value=1,
+                                                  max_value=len(counts), value=min(50, len(counts)), step=10))
+                    top_counts, top_health = counts.head(n_sites), health.head(n_sites)
+                    st.markdown(f"**{int((counts.sum(axis=1) > 0).sum())} sites** hors seuil sur {len(counts)}")
+
+                    # Clicking a cell of the heatmap, or choosing a site below, opens its charts
+                    title = ("Couples (cellule, KPI) hors seuil par site et par jour (extrêmes journaliers)" if columns == "Jours"
+                             else "Jours x cellules hors seuil par site et par KPI (extrêmes journaliers)")
+                    st.plotly_chart(plot_fleet_heatmap(top_counts, top_health, title=title),
+                                    use_container_width=True, key="fleet_heatmap",
+                                    on_select=open_clicked_site, selection_mode="points")
+                    st.selectbox("🔎 Ouvrir un site", [None] + list(top_counts.index), key="fleet_site",
+                                 on_change=open_chosen_site, format_func=lambda site: "—" if site is None else site)
+
+        if site_view is not None and graph_type == "Graphique 2 axes (double KPI)":
             kpi_duo = st.multiselect("Sélectionner exactement 2 KPIs", numeric_cols, max_selections=2)
             if len(kpi_duo) == 2:
-                fig = plot_dual_axis_kpi_time_series(df, selected_site, kpi_duo[0], kpi_duo[1], selected_cells, y_range=custom_y_range, thresholds=thresholds,threshold_directions=threshold_direction)
+                fig = cached_figure(plot_dual_axis_kpi_time_series, site_view, kpi_duo[0], kpi_duo[1], y_range=custom_y_range, thresholds=thresholds,threshold_directions=threshold_direction)
                 st.plotly_chart(fig, use_container_width=True)
             else:
                 st.warning("Veuillez sélectionner 2 KPIs pour le graphique à deux axes.")
         
-        elif selected_kpis:
+        elif selected_kpis and site_view is not None:
             # Define how many graphs per line based on the total number
             default_cols = 1 if len(selected_kpis) == 1 else 2
 
@@ -184,22 +335,55 @@ with right_col:
                         st.markdown(f"### 📈 {kpi}")
                 
                 
+                        # One figure per KPI, all drawn from the same prepared site view
                         if graph_type == "Graphique temporel":
-                            fig = plot_kpi_time_series(df, selected_site, kpi, selected_cells, y_range=custom_y_range, threshold=thresholds.get(kpi, None), threshold_direction=threshold_direction.get(kpi, None))
+                            fig = cached_figure(plot_kpi_time_series, site_view, kpi, y_range=custom_y_range, threshold=thresholds.get(kpi, None), threshold_direction=threshold_direction.get(kpi, None))
                             st.plotly_chart(fig, use_container_width=True)
 
                         elif graph_type == "Histogramme":
-                            fig = plot_kpi_histogram(df_site, selected_site, kpi, selected_cells)
+                            fig = cached_figure(plot_kpi_histogram, site_view, kpi)
                             st.pyplot(fig)
 
                         elif graph_type == "Graphique à barres":
-                            fig = plot_kpi_bar_chart(df_site, selected_site, kpi, selected_cells)
+                            fig = cached_figure(plot_kpi_bar_chart, site_view, kpi)
                             st.plotly_chart(fig, use_container_width=True)
                         
                         elif graph_type == "Scatter Anomalies":
-                            for kpi in selected_kpis:
-                                fig = plot_kpi_anomaly_scatter(df, selected_site, kpi, selected_cells,
-                                    threshold=thresholds.get(kpi),
-                                    threshold_direction=threshold_direction.get(kpi)
-                                )
-                                st.plotly_chart(fig, use_container_width=True)
+                            fig = cached_figure(plot_kpi_anomaly_scatter, site_view, kpi,
+                                threshold=thresholds.get(kpi),
+                                threshold_direction=threshold_direction.get(kpi),
+                                use_zscore=use_zscore, zscore_threshold=zscore_threshold,
+                                use_moving_avg=use_moving_avg, moving_avg_window=moving_avg_window
+                            )
+                            st.plotly_chart(fig, use_container_width=True)
+
+        # ----------- Daily / weekly trend -----------
+        if site_col == "eNodeB Name" and selected_kpis:
+            trend_kpis = [kpi for kpi in selected_kpis if pd.api.types.is_numeric_dtype(df_site[kpi])]
+            if trend_kpis and st.checkbox("📅 Afficher les moyennes journalières / hebdomadaires du site", value=False):
+                resolution = st.radio("Résolution", ["Jour", "Semaine"], horizontal=True)
+                level = "day" if resolution == "Jour" else "week"
+
+                cube = get_site_cube(data_key, selected_site, tuple(trend_kpis), df_site)
+                st.line_chart(cube.mean(level, "site").loc[selected_site])
+
+        # ----------- KPI correlation -----------
+        if df_site is not None and len(numeric_cols) > 1:
+            if st.checkbox("🔗 Afficher la corrélation des KPIs du site", value=False):
+                method = st.radio("Méthode", ["Pearson", "Spearman"], horizontal=True)
+                corr_kpis = selected_kpis if len(selected_kpis) > 1 else numeric_cols
+                fig = cached_figure(correlation_figure, df_site, corr_kpis, method.lower(), f"Corrélation des KPIs - {selected_site}")
+                st.plotly_chart(fig, use_container_width=True)
+
+        # ----------- Saved anomalies -----------
+        if site_col == "eNodeB Name" and selected_site is not None:
+            if st.checkbox("🗂️ Afficher les anomalies enregistrées du site", value=False):
+                saved = query_anomalies(df["Date"].min(), df["Date"].max(), site=selected_site, kpi=selected_kpis or None)
+                if saved.empty:
+                    st.info("Aucune anomalie enregistrée pour ce site sur la période.")
+                else:
+                    incidents, saved["Incident"] = build_incidents(saved)
+                    st.markdown(f"**{len(incidents)} incidents** ({len(saved)} anomalies)")
+                    st.dataframe(incidents)
+                    if st.checkbox("Afficher le détail des anomalies", value=False):
+                        st.dataframe(saved)
@@ -0,0 +1,196 @@
+import hashlib
+import io
+import json
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+from preprocessing import clean_data, CLEANING_VERSION
+
+# ----------- Cleaned upload cache -----------
+
+CACHE_DIR = os.path.join(".cache", "cleaned")
+CACHE_MAX_BYTES = 2 * 1024 ** 3  # 2 GB
+
+
+def upload_cache_key(file_bytes, version=CLEANING_VERSION, compact=False):
+    """
+    Content address of an uploaded report: hash of its bytes plus the cleaning version.
+
+    Args:
+        file_bytes (bytes): raw content of the uploaded file
+        version (str): cleaning version tag
+        compact (bool): cleaned in compact mode
+
+    Returns:
+        key (str)
+    """
+    digest = hashlib.sha256(file_bytes).hexdigest()
+    suffix = "-compact" if compact else ""
+    return f"{digest}-v{version}{suffix}"
+
+
+def _cache_path(key, cache_dir):
+    return os.path.join(cache_dir, f"{key}.parquet")
+
+
+def evict_cache(cache_dir=CACHE_DIR, max_bytes=CACHE_MAX_BYTES):
+    """
+    Deletes the least recently used cached files until the cache fits in `max_bytes`.
+
+    Args:
+        cache_dir (str): cache directory
+        max_bytes (int): maximum total size of the cache
+    """
+    if not os.path.isdir(cache_dir):
+        return
+
+    entries = []
+    for name in os.listdir(cache_dir):
+        if name.endswith(".parquet"):
+            stat = os.stat(os.path.join(cache_dir, name))
+            entries.append((stat.st_mtime, stat.st_size, name))
+
+    total = sum(size for _, size, _ in entries)
+    for _, size, name in sorted(entries):
+        if total <= max_bytes:
+            break
+        try:
+            os.remove(os.path.join(cache_dir, name))
+        except FileNotFoundError:
+            pass  # Already evicted by another session
+        total -= size
+
+
+def load_cleaned_upload(file_bytes, compact=False, cache_dir=CACHE_DIR, max_bytes=CACHE_MAX_BYTES):
+    """
+    Returns the cleaned DataFrame of an uploaded Excel report.
+
+    The cleaned frame is stored as Parquet under the content address of the upload,
+    so a repeat upload (or a Streamlit rerun) skips both the Excel parsing and the
+    cleaning. Cache hits refresh the file modification time, which drives the LRU
+    eviction.
+
+    Args:
+        file_bytes (bytes): raw content of the uploaded .xlsx file
+        compact (bool): categorical identifiers and float32 KPIs (see `compact_frame`)
+        cache_dir (str): cache directory
+        max_bytes (int): maximum total size of the cache
+
+    Returns:
+        df (pd.DataFrame): cleaned data
+    """
+    path = _cache_path(upload_cache_key(file_bytes, compact=compact), cache_dir)
+
+    if os.path.exists(path):
+        try:
+            df = pd.read_parquet(path)
+            os.utime(path)
+            return df
+        except (ImportError, OSError, ValueError):
+            pass  # Unreadable entry: rebuild it below
+
+    df = clean_data(pd.read_excel(io.BytesIO(file_bytes)), compact=compact)
+
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        df.to_parquet(tmp_path)
+        os.replace(tmp_path, path)
+        evict_cache(cache_dir, max_bytes)
+    except (ImportError, OSError, ValueError, TypeError) as e:
+        # The cache is best-effort: the cleaned frame is still returned
+        print(f"Could not cache cleaned file: {e}")
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+    return df
+
+
+# ----------- In-memory figure cache -----------
+
+FIGURE_CACHE_BYTES = 256 * 1024 ** 2  # 256 MB
+FIGURE_BASE_BYTES = 64 * 1024  # layout, and figures whose data is not inspected
+TRACE_ARRAYS = ["x", "y", "z", "text", "hovertext", "customdata", "marker.color"]
+
+
+def cache_key(*parts):
+    """
+    Stable key of a call: data version plus the exact arguments.
+
+    Lists, tuples and dicts are compared by content (dict keys sorted); other
+    values by their string form.
+    """
+    text = json.dumps(parts, sort_keys=True, default=str)
+    return hashlib.sha256(text.encode()).hexdigest()
+
+
+def frame_key(df):
+    """Content hash of a DataFrame (values, index and column names), to key derived results."""
+    hashes = pd.util.hash_pandas_object(df, index=True).to_numpy()
+    return hashlib.sha256(hashes.tobytes() + "|".join(map(str, df.columns)).encode()).hexdigest()
+
+
+def figure_nbytes(fig):
+    """Approximate memory held by a figure (data arrays of its Plotly traces)."""
+    size = FIGURE_BASE_BYTES
+    for trace in getattr(fig, "data", ()):
+        for name in TRACE_ARRAYS:
+            try:
+                value = trace[name]
+            except (KeyError, ValueError, TypeError):
+                continue
+            if isinstance(value, np.ndarray):
+                size += value.nbytes
+            elif isinstance(value, (list, tuple)):
+                size += 8 * len(value)
+    return size
+
+
+class FigureCache:
+    """
+    Least-recently-used cache of finished figures, bounded in bytes.
+
+    Figures are looked up by `cache_key(...)`; when the estimated size of the
+    cached figures exceeds `max_bytes`, the least recently used ones are dropped.
+    Safe to share between Streamlit sessions.
+
+    Args:
+        max_bytes (int): memory budget
+    """
+
+    def __init__(self, max_bytes=FIGURE_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get_or_create(self, key, build):
+        """Returns the cached figure of `key`, or builds, stores and returns it."""
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                return self._entries[key][0]
+
+        fig = build()
+        size = figure_nbytes(fig)
+
+        with self._lock:
+            if key not in self._entries and size <= self.max_bytes:
+                self._entries[key] = (fig, size)
+                self.nbytes += size
+                while self.nbytes > self.max_bytes:
+                    _, (_, evicted) = self._entries.popitem(last=False)
+                    self.nbytes -= evicted
+        return fig
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.nbytes = 0
@@ -0,0 +1,116 @@
+import pandas as pd
+import numpy as np
+
+from anomaly_detector import normalize_direction
+
+# ----------- Fleet overview -----------
+
+def threshold_vectors(threshold_config, kpis):
+    """
+    Thresholds of the KPIs that have one, as arrays.
+
+    A threshold of 0 means no threshold, as in the dashboard.
+
+    Args:
+        threshold_config (dict): content of threshold_config.json
+        kpis (list): KPIs available
+
+    Returns:
+        kpis (list): KPIs with a threshold
+        thresholds (np.ndarray): threshold of each KPI
+        is_max (np.ndarray): True for "Maximum à ne pas dépasser", False for a minimum
+    """
+    selected, thresholds, is_max = [], [], []
+    for kpi in kpis:
+        rule = threshold_config.get(kpi, {})
+        direction = normalize_direction(rule.get("direction"))
+        if rule.get("threshold") and direction:
+            selected.append(kpi)
+            thresholds.append(float(rule["threshold"]))
+            is_max.append(direction == "max")
+    return selected, np.array(thresholds, dtype=np.float64), np.array(is_max, dtype=bool)
+
+
+def fleet_anomaly_matrix(cube, threshold_config, by='day', level='day'):
+    """
+    Sites x days (or sites x KPIs) counts of out-of-threshold checks, from the daily rollup.
+
+    One check is a (cell, day, KPI); it is out of threshold when the daily
+    extreme crosses the threshold of the KPI: the maximum for "Maximum à ne pas
+    dépasser", the minimum for "Minimum à respecter". The counts are therefore
+    (cell, KPI) pairs per day, not anomalous intervals: a cell that crosses the
+    threshold once or in every interval of the day counts once. The cell table of the cube is compared with every
+    threshold at once and the counts are accumulated with one bincount, so no
+    raw interval is read and the cost grows with sites x days, not with the
+    sampling rate.
+
+    Args:
+        cube (KPICube): rollup with the min and max of the KPIs (see kpi_cube)
+        threshold_config (dict): content of threshold_config.json
+        by (str): 'day' (one column per bucket) or 'kpi' (one column per KPI)
+        level (str): bucket of the cube ('day' or 'week')
+
+    Returns:
+        counts (pd.DataFrame): out-of-threshold checks per site and column,
+            most affected sites first (empty without data)
+        health (pd.DataFrame): share (%) of the (cell, KPI) checks within
+            threshold, same shape (NaN without data)
+    """
+    if by not in ('day', 'kpi'):
+        raise ValueError(f"Colonnes inconnues : {by}")
+
+    kpis, thresholds, is_max = threshold_vectors(threshold_config, cube.kpis or [])
+    table = cube.tables.get((level, 'cell'))
+    if table is None or not kpis:
+        empty = pd.DataFrame(index=pd.Index([], name=cube.site_col), dtype=np.float64)
+        return empty.astype(np.int64), empty
+
+    site_codes, sites = pd.factorize(table.index.get_level_values(cube.site_col), sort=True)
+    if by == 'day':
+        column_codes, columns = pd.factorize(table.index.get_level_values(cube.date_col), sort=True)
+    else:
+        columns = pd.Index(kpis)
+
+    # (rows x KPIs) comparisons of the daily extremes with the thresholds
+    with np.errstate(invalid='ignore'):
+        breach = np.where(
+            is_max,
+            table['max'][kpis].to_numpy(dtype=np.float64) > thresholds,
+            table['min'][kpis].to_numpy(dtype=np.float64) < thresholds,
+        )
+    checked = table['count'][kpis].to_numpy(dtype=np.float64) > 0
+    breach &= checked
+
+    n_sites, n_columns = len(sites), len(columns)
+    if by == 'day':
+        flat = site_codes * n_columns + column_codes
+        counts = np.bincount(flat, weights=breach.sum(axis=1), minlength=n_sites * n_columns)
+        checks = np.bincount(flat, weights=checked.sum(axis=1), minlength=n_sites * n_columns)
+    else:
+        flat = (site_codes[:, np.newaxis] * n_columns + np.arange(n_columns)).ravel()
+        counts = np.bincount(flat, weights=breach.ravel(), minlength=n_sites * n_columns)
+        checks = np.bincount(flat, weights=checked.ravel(), minlength=n_sites * n_columns)
+    counts = counts.reshape(n_sites, n_columns)
+    checks = checks.reshape(n_sites, n_columns)
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        health = np.where(checks > 0, 100 * (1 - counts / checks), np.nan)
+
+    # Most affected sites first, then the least healthy
+    totals = counts.sum(axis=1)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean_health = np.where(checks.sum(axis=1) > 0, 100 * (1 - totals / checks.sum(axis=1)), 100.0)
+    order = np.lexsort((mean_health, -totals))
+
+    index = pd.Index(np.asarray(sites)[order], name=cube.site_col)
+    counts = pd.DataFrame(counts[order].astype(np.int64), index=index, columns=columns)
+    health = pd.DataFrame(health[order], index=index, columns=columns)
+    return counts, health
+
+
+"""
+Usage :
+    cube = load_store_cube("2025-05-01", "2025-05-31")  # or KPICube(df_clean, levels=['day'], scopes=['cell'])
+    counts, health = fleet_anomaly_matrix(cube, load_threshold_config(), by="day")
+    fig = plot_fleet_heatmap(counts.head(100), health.head(100))
+"""
@@ -1,67 +1,373 @@
 import os
 import matplotlib.pyplot as plt
 import pandas as pd
+import numpy as np
 
 import plotly.express as px
 import plotly.graph_objects as go
 
-from anomaly_detector import detect_zscore_anomalies
+from anomaly_detector import detect_rolling_zscore_anomalies, detect_moving_average_anomalies, normalize_direction, DIRECTION_MAX, ROLLING_WINDOW
+from preprocessing import parse_timestamps
 
-def plot_kpi_time_series(df, site_name, kpi, selected_cells=None, y_range=None, threshold=None, threshold_direction=None, use_zscore=False, zscore_threshold=3.0):
+def _prepare_dates(site_df):
     """
-    Plot interactive time series of a KPI for each cell of a given site.
+    Returns the site rows with a datetime64 date column, and the name of that column.
+
+    Frames cleaned by `clean_data` already carry a parsed and sorted 'Date' column,
+    which is used as is; other frames are parsed and sorted here.
+    """
+    if 'Date' in site_df.columns:
+        date_col = 'Date'
+    elif 'Time' in site_df.columns:
+        date_col = 'Time'
+    else:
+        raise KeyError("Aucune colonne de date trouvée (ni 'Date' ni 'Time').")
+
+    if not pd.api.types.is_datetime64_any_dtype(site_df[date_col]):
+        site_df[date_col] = parse_timestamps(site_df[date_col])
+        site_df = site_df.sort_values(date_col, kind='stable')
+
+    if site_df[date_col].hasnans:
+        site_df = site_df.dropna(subset=[date_col])
+
+    return site_df, date_col
+
+# ----------- Downsampling -----------
+
+MAX_POINTS_PER_TRACE = 1500  # about two points per horizontal pixel of a dashboard chart
+WEBGL_THRESHOLD = 5000       # above this many points a figure is drawn with WebGL
+
+
+def lttb_indices(x, y, n_out):
+    """
+    Largest-Triangle-Three-Buckets downsampling.
+
+    Keeps the first and last points and, in each of `n_out - 2` equal buckets,
+    the point forming the largest triangle with the point kept in the previous
+    bucket and the mean of the next bucket, which preserves peaks and dips.
+    Several series of the same length are processed together (one row each):
+    the loop runs over the buckets only, whatever the number of series.
+
+    Args:
+        x (np.ndarray): increasing float abscissas, (n,) or (series, n)
+        y (np.ndarray): values (no NaN), same shape as x
+        n_out (int): number of points to keep
+
+    Returns:
+        indices (np.ndarray): sorted positions of the kept points, (n_out,) or (series, n_out)
+    """
+    single = np.ndim(y) == 1
+    x, y = np.atleast_2d(x), np.atleast_2d(y)
+    n_series, n = y.shape
+    if n_out >= n or n_out < 3:
+        indices = np.broadcast_to(np.arange(n), (n_series, n))
+        return indices[0] if single else indices
+
+    edges = np.linspace(1, n - 1, n_out - 1).astype(np.int64)
+    starts, stops = edges[:-1], edges[1:]
+
+    # Mean of every bucket (the "next bucket" of the previous one); the last point closes the series
+    cum_x = np.c_[np.zeros(n_series), np.cumsum(x, axis=1)]
+    cum_y = np.c_[np.zeros(n_series), np.cumsum(y, axis=1)]
+    sizes = stops - starts
+    next_x = np.c_[((cum_x[:, stops] - cum_x[:, starts]) / sizes)[:, 1:], x[:, -1]]
+    next_y = np.c_[((cum_y[:, stops] - cum_y[:, starts]) / sizes)[:, 1:], y[:, -1]]
+
+    selected = np.empty((n_series, n_out), dtype=np.int64)
+    selected[:, 0], selected[:, -1] = 0, n - 1
+    rows = np.arange(n_series)
+    a = np.zeros(n_series, dtype=np.int64)
+    for b in range(n_out - 2):
+        lo, hi = starts[b], stops[b]
+        ax, ay = x[rows, a][:, np.newaxis], y[rows, a][:, np.newaxis]
+        area = np.abs((ax - next_x[:, b, np.newaxis]) * (y[:, lo:hi] - ay) - (ax - x[:, lo:hi]) * (next_y[:, b, np.newaxis] - ay))
+        a = lo + area.argmax(axis=1)
+        selected[:, b + 1] = a
+    return selected[0] if single else selected
+
+
+def downsample_rows(site_df, date_col, kpis, group_col=None, max_points=MAX_POINTS_PER_TRACE, keep=None):
+    """
+    Rows of a frame reduced to about `max_points` per series, anomalies kept.
+
+    Each series (each value of `group_col`, or the whole frame) is downsampled
+    with LTTB on every KPI of `kpis`; the union of the kept rows, plus the rows
+    flagged in `keep`, is returned in the original order.
+
+    Args:
+        site_df (pd.DataFrame): rows sorted by date within each series
+        date_col (str): date column
+        kpis (list): KPI columns drawn from these rows
+        group_col (str): series column (e.g. 'Cell Name'), None for one series
+        max_points (int): points per series and KPI (None: no downsampling)
+        keep (np.ndarray): boolean mask of rows that must stay (anomalies)
+
+    Returns:
+        site_df (pd.DataFrame): selected rows
+    """
+    if not max_points or len(site_df) <= max_points:
+        return site_df
+
+    selected = np.zeros(len(site_df), dtype=bool)
+    if keep is not None:
+        selected |= np.asarray(keep, dtype=bool)
+
+    dates = site_df[date_col].to_numpy(dtype='datetime64[ns]').view(np.int64)
+    if group_col is None:
+        groups = {None: np.arange(len(site_df))}
+    else:
+        groups = site_df.groupby(group_col, sort=False, observed=True).indices
+    for rows in groups.values():
+        x = (dates[rows] - dates[rows[0]]) / 1e9 if len(rows) else dates[rows]
+        for kpi in kpis:
+            y = pd.to_numeric(site_df[kpi].iloc[rows], errors='coerce').to_numpy(dtype=np.float64)
+            selected[rows[_series_positions(x, y, max_points)]] = True
+
+    return site_df[selected]
+
+
+def _series_positions(x, y, max_points):
+    """Positions drawn for one series: LTTB points of its non-NaN values."""
+    if not max_points or len(y) <= max_points:
+        return np.arange(len(y))
+    present = np.flatnonzero(~np.isnan(y))
+    return present[lttb_indices(x[present], y[present], max_points)]
+
+
+# ----------- Per-cell traces -----------
+
+def _cell_positions(seconds, y, offsets, max_points, keep=None):
+    """
+    Positions drawn for every cell of a frame whose cells are contiguous row ranges.
+
+    Cells longer than `max_points` are downsampled; those with the same number of
+    values go through one batched `lttb_indices` call, and their `keep` rows are
+    added back.
+    """
+    n_cells = len(offsets) - 1
+    positions = [np.arange(offsets[i], offsets[i + 1]) for i in range(n_cells)]
+    if not max_points:
+        return positions
+
+    by_length = {}
+    for i in range(n_cells):
+        start, stop = offsets[i], offsets[i + 1]
+        if stop - start > max_points:
+            rows = start + np.flatnonzero(~np.isnan(y[start:stop]))
+            by_length.setdefault(len(rows), []).append((i, rows))
+
+    for cells in by_length.values():
+        rows = np.vstack([cell_rows for _, cell_rows in cells])
+        kept = np.take_along_axis(rows, lttb_indices(seconds[rows], y[rows], max_points), axis=1)
+        for (i, _), cell_kept in zip(cells, kept):
+            if keep is not None:
+                cell_kept = np.union1d(cell_kept, offsets[i] + np.flatnonzero(keep[offsets[i]:offsets[i + 1]]))
+            positions[i] = cell_kept
+    return positions
+
+
+def cell_line_traces(view, kpi, max_points=MAX_POINTS_PER_TRACE, keep=None, name="{cell}", colors=None, **style):
+    """
+    One line trace per displayed cell of a view, as plain dicts.
+
+    The rows of a cell are a contiguous slice of the view (`cell_offsets`): the
+    KPI is converted to an array once and every trace is a slice of it,
+    downsampled with LTTB (rows flagged in `keep` always stay). No frame is
+    filtered per cell and cells of equal length are downsampled together.
+
+    Args:
+        view: PreparedSiteView
+        kpi: KPI drawn
+        max_points: points per cell (None: every point)
+        keep: boolean array over view.cells_df of rows always drawn (anomalies)
+        name: trace name, formatted with `cell` and `kpi`
+        colors: optional colors cycled over the cells
+        **style: other trace attributes (mode, line, yaxis, ...)
+
+    Returns:
+        traces (list): trace dicts, without 'type' (see `assemble_figure`)
+    """
+    y = pd.to_numeric(view.cells_df[kpi], errors='coerce').to_numpy(dtype=np.float64)
+    if keep is not None:
+        keep = np.asarray(keep, dtype=bool)
+    traces = []
+    for i, (cell, positions) in enumerate(zip(view.cell_names, _cell_positions(view.seconds, y, view.cell_offsets, max_points, keep))):
+        trace = dict(style, x=view.dates[positions], y=y[positions], name=name.format(cell=cell, kpi=kpi))
+        if colors:
+            trace["line"] = dict(style.get("line", {}), color=colors[i % len(colors)])
+        traces.append(trace)
+    return traces
+
+
+def anomaly_trace(x, y, mask, name, label="⚠", **style):
+    """Markers and value labels of the anomalous points of all the cells, as one trace dict."""
+    positions = np.flatnonzero(np.asarray(mask, dtype=bool))
+    x, y = np.asarray(x)[positions], np.asarray(y, dtype=np.float64)[positions]
+    return dict(
+        style,
+        x=x,
+        y=y,
+        mode='markers+text',
+        name=name,
+        text=[f"{label} {v:.2f}" for v in y],
+        textposition='top center',
+        showlegend=True
+    )
+
+
+def assemble_figure(traces, layout=None):
+    """Figure created in one call, with Scattergl traces above WEBGL_THRESHOLD points in total."""
+    trace_type = "scattergl" if sum(len(trace["x"]) for trace in traces) > WEBGL_THRESHOLD else "scatter"
+    return go.Figure(data=[dict(trace, type=trace_type) for trace in traces], layout=layout)
+
+
+def _select_site(df, site_name, site_index=None):
+    """Rows of a site: taken from the positions of the site index when available, boolean mask otherwise."""
+    if site_index is not None:
+        return site_index.site_frame(site_name)
+    return df[df['eNodeB Name'] == site_name].copy()
+
+# ----------- Prepared site view -----------
+
+class PreparedSiteView:
+    """
+    Rows of one site prepared once for every figure drawn from them.
+
+    Selecting the site, parsing and sorting the dates, applying the date range
+    and grouping the rows by cell is done in the constructor; the plot functions
+    only read the view, so drawing N KPIs costs one preparation instead of N.
+    The view is never modified by the plot functions and can be shared.
 
     Args:
         df: full cleaned dataframe
         site_name: selected eNodeB Name
+        selected_cells: cell names, with the optional "Toutes les cellules" and
+            "Moyenne du site" entries of the dashboard
+        start: optional first date kept
+        end: optional last date kept
+        site_index: optional SiteIndex of df (the site is then an O(1) slice)
+    """
+
+    def __init__(self, df, site_name, selected_cells=None, start=None, end=None, site_index=None):
+        self.site_name = site_name
+        self.selected_cells = list(selected_cells or [])
+        self.site_average = "Moyenne du site" in self.selected_cells
+        self.key = (site_name, self.selected_cells, str(start), str(end))
+
+        site_df = _select_site(df, site_name, site_index)
+        site_df, self.date_col = _prepare_dates(site_df)
+        if start is not None:
+            site_df = site_df[site_df[self.date_col] >= pd.Timestamp(start)]
+        if end is not None:
+            site_df = site_df[site_df[self.date_col] <= pd.Timestamp(end)]
+
+        # Rows of a cell are contiguous and in date order
+        if 'Cell Name' in site_df.columns:
+            site_df = site_df.sort_values(['Cell Name', self.date_col], kind='stable')
+        self.site_df = site_df.reset_index(drop=True)
+
+        # Displayed cells: the real cells of the selection, every cell otherwise
+        cells = [cell for cell in self.selected_cells if cell not in ("Toutes les cellules", "Moyenne du site")]
+        if cells and "Toutes les cellules" not in self.selected_cells:
+            self.cell_mask = self.site_df['Cell Name'].isin(cells).to_numpy()
+            self.cells_df = self.site_df[self.cell_mask]
+        else:
+            self.cell_mask = np.ones(len(self.site_df), dtype=bool)
+            self.cells_df = self.site_df
+
+        # Cell i owns the rows cell_offsets[i]:cell_offsets[i + 1] of cells_df
+        if 'Cell Name' in self.cells_df.columns and len(self.cells_df):
+            codes = pd.factorize(self.cells_df['Cell Name'])[0]
+            starts = np.flatnonzero(np.r_[True, codes[1:] != codes[:-1]])
+            self.cell_names = self.cells_df['Cell Name'].to_numpy()[starts]
+            self.cell_offsets = np.r_[starts, len(codes)]
+        else:
+            self.cell_names = np.array([], dtype=object)
+            self.cell_offsets = np.zeros(1, dtype=np.int64)
+
+        self.dates = self.cells_df[self.date_col].to_numpy(dtype='datetime64[ns]')
+        self.seconds = (self.dates - self.dates[0]) / np.timedelta64(1, 's') if len(self.dates) else np.array([])
+
+        self._means = {}
+
+    @property
+    def empty(self):
+        return self.site_df.empty
+
+    def site_mean(self, kpis):
+        """Average of the KPIs over all the cells of the site, per date (computed once)."""
+        kpis = tuple(kpis)
+        if kpis not in self._means:
+            self._means[kpis] = self.site_df.groupby(self.date_col)[list(kpis)].mean().reset_index()
+        return self._means[kpis]
+
+def plot_kpi_time_series(view, kpi, y_range=None, threshold=None, threshold_direction=None, use_zscore=False, zscore_threshold=3.0, max_points=MAX_POINTS_PER_TRACE):
+    """
+    Plot interactive time series of a KPI for each cell of a given site.
+
+    Dense series are reduced to `max_points` per cell with LTTB (anomalous
+    points are always kept) and drawn with WebGL above WEBGL_THRESHOLD points.
+
+    Args:
+        view: PreparedSiteView of the selected site and cells
         kpi: KPI to plot
-        selected_cells: optional list of selected cell names
-        thresholds: dict containing thresholds {kpi1: value, kpi2: value}
-        threshold_directions: dict containing direction ("max" or "min") for each KPI
+        y_range: optional [min, max] of the Y axis
+        threshold: static threshold
+        threshold_direction: "Maximum à ne pas dépasser" / "Minimum à respecter", or "max" / "min"
+        max_points: points drawn per cell (None: every point)
 
     Returns:
         fig: Plotly figure
     """
-    site_df = df[df['eNodeB Name'] == site_name].copy()
-    if site_df.empty:
-        print(f"[!] Aucune donnée trouvée pour le site: {site_name}")
+    if view.empty:
+        print(f"[!] Aucune donnée trouvée pour le site: {view.site_name}")
         return
-    
-    ### Key step: managing temporal column names 
-    date_col = None
-    if 'Date' in site_df.columns:
-        date_col = 'Date'
-        site_df[date_col] = pd.to_datetime(site_df[date_col])
-    elif 'Time' in site_df.columns:
-        date_col = 'Time'
-        site_df[date_col] = site_df[date_col].astype(str)
-        site_df[date_col] = site_df[date_col].str.replace(r'(\d{4}-\d{2}-\d{2})(\d{2}:\d{2})', r'\1 \2', regex=True)
-        site_df[date_col] = pd.to_datetime(site_df[date_col], errors='coerce')
-        site_df = site_df.dropna(subset=[date_col])
-    else:
-        raise KeyError("Aucune colonne de date trouvée (ni 'Date' ni 'Time').")
-    
-    site_df.sort_values(date_col, inplace=True)
+
+    date_col = view.date_col
+    site_name = view.site_name
+    site_df = view.site_df if view.site_average else view.cells_df
+
+    ### Anomalies are detected on every point, before downsampling
+    threshold_anomalies = None
+    direction = normalize_direction(threshold_direction)
+    if threshold and direction == "max":
+        threshold_anomalies = site_df[kpi] > threshold
+    elif threshold and direction == "min":
+        threshold_anomalies = site_df[kpi] < threshold
+
+    z_anomalies = None
+    if use_zscore :
+        z_anomalies = detect_rolling_zscore_anomalies(site_df, kpi, zscore_threshold, date_col=date_col)
+
+    y = pd.to_numeric(site_df[kpi], errors='coerce').to_numpy(dtype=np.float64)
+    dates = site_df[date_col].to_numpy()
+    overlays = []
+    if threshold_anomalies is not None:
+        overlays.append(anomaly_trace(dates, y, threshold_anomalies, "Anomalies",
+                                      marker=dict(color="red", size=10, symbol="x")))
+    if z_anomalies is not None:
+        overlays.append(anomaly_trace(dates, y, z_anomalies, "Z-score Anomalie", label="Z⚠",
+                                      marker=dict(color='orange', size=9, symbol='triangle-up')))
 
     ### Case : Site average
-    if selected_cells and "Moyenne du site" in selected_cells:
-        mean_df = site_df.groupby(date_col)[kpi].mean().reset_index()
-        fig = px.line(mean_df, x=date_col, y=kpi, title=f"Moyenne {kpi} - {site_name}", markers=True)
-        fig.update_traces(line=dict(color='green'), name="Moyenne")
+    if view.site_average:
+        mean_df = view.site_mean([kpi])
+        plot_df = downsample_rows(mean_df, date_col, [kpi], max_points=max_points)
+        traces = [dict(x=plot_df[date_col].to_numpy(), y=plot_df[kpi].to_numpy(), mode='lines+markers',
+                       name="Moyenne", line=dict(color='green'))]
+        title = f"Moyenne {kpi} - {site_name}"
     
     else : 
         ### Case : normal or "Toutes les cellules"
-        if selected_cells and "Toutes les cellules" not in selected_cells:
-            site_df = site_df[site_df['Cell Name'].isin(selected_cells)]
-
-        fig = px.line(
-            site_df,
-            x=date_col,
-            y=kpi,
-            color="Cell Name",
-            title=f"{kpi} - {site_name}",
-            markers=True
-    )
+        keep = np.zeros(len(site_df), dtype=bool)
+        for mask in (threshold_anomalies, z_anomalies):
+            if mask is not None:
+                keep |= np.asarray(mask, dtype=bool)
+        traces = cell_line_traces(view, kpi, max_points, keep=keep, colors=px.colors.qualitative.Plotly,
+                                  mode='lines+markers')
+        title = f"{kpi} - {site_name}"
+
+    fig = assemble_figure(traces + overlays, layout=dict(title=title))
     fig.update_layout(
         height=500,
         margin=dict(l=30, r=30, t=40, b=30),
@@ -86,160 +392,82 @@ def plot_kpi_time_series(df, site_name, kpi, selected_cells=None, y_range=None,
         padding = (max_val - min_val) * 0.1 if max_val != min_val else 1
         fig.update_yaxes(range=[min_val - padding, max_val + padding])
     
-    if threshold and threshold_direction:
-        if threshold_direction == "Maximum à ne pas dépasser":
-            anomalies = site_df[site_df[kpi] > threshold]
-        elif threshold_direction == "Minimum à respecter":
-            anomalies = site_df[site_df[kpi] < threshold]
+    if threshold_anomalies is not None:
         fig.add_hline(y=threshold, line_dash="dash", line_color="red", annotation_text="Seuil", annotation_position="top left")
-        fig.add_trace(
-            go.Scatter(
-                x = anomalies[date_col],
-                y = anomalies[kpi],
-                mode = "markers+text",
-                name = "Anomalies",
-                marker = dict(color = "red", size = 10, symbol = "x"),
-                text = [f"⚠ {v:.2f}" for v in anomalies[kpi]],
-                textposition='top center',
-                showlegend=True
-            )
-        )
-    
-    if use_zscore :
-        anomalies = detect_zscore_anomalies(site_df[kpi], zscore_threshold)
-        site_df["Z_Anomaly"] = anomalies
-
-        fig.add_trace(
-            go.Scatter(
-                x=site_df[date_col][anomalies],
-                y=site_df[kpi][anomalies],
-                mode='markers+text',
-                name='Z-score Anomalie',
-                marker=dict(color='orange', size=9, symbol='triangle-up'),
-                text=[f"Z⚠ {v:.2f}" for v in site_df[kpi][anomalies]],
-                textposition='top center',
-                showlegend=True
-            )
-        )
-    
 
     return fig
 
-def plot_dual_axis_kpi_time_series(df, site_name, kpi1, kpi2, selected_cells=None, y_range=None, thresholds=None, threshold_directions=None):
+def plot_dual_axis_kpi_time_series(view, kpi1, kpi2, y_range=None, thresholds=None, threshold_directions=None, max_points=MAX_POINTS_PER_TRACE):
     """
     Plot two KPIs with two Y axes (left and right), with per-cell or average display.
 
+    Like `plot_kpi_time_series`, dense series are downsampled with LTTB
+    (threshold anomalies kept) and drawn with WebGL when large.
+
     Args:
-        df: full cleaned dataframe
-        site_name: selected eNodeB Name
+        view: PreparedSiteView of the selected site and cells
         kpi1: KPI to plot on the left Y axis
         kpi2: KPI to plot on the right Y axis
-        selected_cells: optional list of selected cell names
+        y_range: optional [min, max] of the Y axis
         thresholds: dict containing thresholds {kpi1: value, kpi2: value}
-        threshold_directions: dict containing direction ("max" or "min") for each KPI
+        threshold_directions: dict containing the direction of each KPI
+            ("Maximum à ne pas dépasser" / "Minimum à respecter", or "max" / "min")
+        max_points: points drawn per cell and KPI (None: every point)
 
     Returns:
         fig: Plotly figure
     """
-    site_df = df[df['eNodeB Name'] == site_name].copy()
-    if site_df.empty:
-        print(f"[!] Aucune donnée trouvée pour le site: {site_name}")
+    if view.empty:
+        print(f"[!] Aucune donnée trouvée pour le site: {view.site_name}")
         return
-    
-    ### Key step: managing temporal column names 
-    date_col = None
-    if 'Date' in site_df.columns:
-        date_col = 'Date'
-    elif 'Time' in site_df.columns:
-        date_col = 'Time'
-    else:
-        raise KeyError("Aucune colonne de date trouvée (ni 'Date' ni 'Time').")
-    
-    
-    site_df[date_col] = pd.to_datetime(site_df[date_col])
-    site_df.sort_values(date_col, inplace=True)
 
-    fig = go.Figure()
+    date_col = view.date_col
+    site_name = view.site_name
 
-    def add_anomalies(fig, x, y, kpi, axis):
+    def anomaly_mask(y, kpi):
         if thresholds and kpi in thresholds and threshold_directions:
             thresh = thresholds[kpi]
-            direction = threshold_directions.get(kpi, "max")
-            if direction == "max":
-                anomalies = y > thresh
-            else:
-                anomalies = y < thresh
-
-            fig.add_trace(go.Scatter(
-                x=x[anomalies],
-                y=y[anomalies],
-                mode='markers+text',
-                name=f"Anomalies {kpi}",
+            direction = normalize_direction(threshold_directions.get(kpi, DIRECTION_MAX))
+            with np.errstate(invalid='ignore'):
+                if direction == "max":
+                    return y > thresh
+                return y < thresh
+        return None
+
+    traces = []
+    overlays = []
+    axes = [(kpi1, 'y1', 'blue'), (kpi2, 'y2', 'red')]
+
+    if view.site_average:
+        mean_df = view.site_mean([kpi1, kpi2])
+        for (kpi, axis, color), mean_color in zip(axes, ['#355e3b', '#BAB86C']):
+            y = pd.to_numeric(mean_df[kpi], errors='coerce').to_numpy(dtype=np.float64)
+            mask = anomaly_mask(y, kpi)
+            plot_df = downsample_rows(mean_df, date_col, [kpi], max_points=max_points, keep=mask)
+            traces.append(dict(
+                x=plot_df[date_col].to_numpy(),
+                y=plot_df[kpi].to_numpy(),
+                mode='lines+markers',
+                name=f"Moyenne - {kpi}",
                 yaxis=axis,
-                marker=dict(color='blue' if axis == 'y1' else 'red', size=10, symbol='x'),
-                text=[f"⚠ {val:.2f}" for val in y[anomalies]],
-                textposition='top center',
-                showlegend=True
+                line=dict(color=mean_color)
             ))
+            if mask is not None:
+                overlays.append(anomaly_trace(mean_df[date_col].to_numpy(), y, mask, f"Anomalies {kpi}", yaxis=axis,
+                                              marker=dict(color=color, size=10, symbol='x')))
 
-    if selected_cells and "Moyenne du site" in selected_cells:
-        mean_df = site_df.groupby(date_col)[[kpi1, kpi2]].mean().reset_index()
-
-        fig.add_trace(go.Scatter(
-            x=mean_df[date_col],
-            y=mean_df[kpi1],
-            mode='lines+markers',
-            name=f"Moyenne - {kpi1}",
-            yaxis='y1',
-            line=dict(color='#355e3b')
-        ))
-
-        fig.add_trace(go.Scatter(
-            x=mean_df[date_col],
-            y=mean_df[kpi2],
-            mode='lines+markers',
-            name=f"Moyenne - {kpi2}",
-            yaxis='y2',
-            line=dict(color='#BAB86C')
-        ))
-
-        add_anomalies(fig, mean_df[date_col], mean_df[kpi1], kpi1, 'y1')
-        add_anomalies(fig, mean_df[date_col], mean_df[kpi2], kpi2, 'y2')
-    
     else :
-        if selected_cells and "Toutes les cellules" not in selected_cells:
-            site_df = site_df[site_df['Cell Name'].isin(selected_cells)]
-
-
-        for cell in site_df["Cell Name"].unique():
-            cell_data = site_df[site_df["Cell Name"] == cell]
-
-            fig.add_trace(
-                go.Scatter(
-                    x=cell_data[date_col],
-                    y=cell_data[kpi1],
-                    mode="lines",
-                    name=f"{kpi1} - {cell}",
-                    line=dict(color="blue"),
-                    yaxis="y1"
-                )
-            )
-
-            fig.add_trace(
-                go.Scatter(
-                    x=cell_data[date_col],
-                    y=cell_data[kpi2],
-                    mode="lines",
-                    name=f"{kpi2} - {cell}",
-                    line=dict(color="red"),
-                    yaxis="y2"
-                )
-            )
-
-            add_anomalies(fig, cell_data[date_col], cell_data[kpi1], kpi1, 'y1')
-            add_anomalies(fig, cell_data[date_col], cell_data[kpi2], kpi2, 'y2')
-    
-    fig.update_layout(
+        # Every cell is a slice of the view; one anomaly overlay per KPI covers all the cells
+        for kpi, axis, color in axes:
+            y = pd.to_numeric(view.cells_df[kpi], errors='coerce').to_numpy(dtype=np.float64)
+            mask = anomaly_mask(y, kpi)
+            traces += cell_line_traces(view, kpi, max_points, keep=mask, name="{kpi} - {cell}",
+                                       mode="lines", line=dict(color=color), yaxis=axis)
+            if mask is not None:
+                overlays.append(anomaly_trace(view.dates, y, mask, f"Anomalies {kpi}", yaxis=axis,
+                                              marker=dict(color=color, size=10, symbol='x')))
+
+    fig = assemble_figure(traces + overlays, layout=dict(
         title = f"{kpi1} et {kpi2} - {site_name}",
         xaxis_title="Date",
         yaxis=dict(title=kpi1, side='left'),
@@ -247,84 +475,54 @@ def plot_dual_axis_kpi_time_series(df, site_name, kpi1, kpi2, selected_cells=Non
         legend=dict(x=0.01, y=0.99),
         height=500,
         margin=dict(l=30, r=30, t=40, b=30),
-    )
+    ))
     
     return fig
 
-def plot_kpi_histogram(df, site_name, kpi, selected_cells=None):
+def plot_kpi_histogram(view, kpi):
     """
     Generate and save the histogram of values for a given KPI.
     
     Args:
-        df: Cleaned DataFrame
-        site_name: name of site to filter
+        view: PreparedSiteView of the selected site and cells
         kpi: KPI to plot
     """
-
-    site_df = df[df["eNodeB Name"] == site_name] if "eNodeB Name" in df.columns else df
-
     # Verification that the KPI exists
-    if kpi not in df.columns:
+    if kpi not in view.site_df.columns:
         print(f"[!] KPI non trouvé: {kpi}")
         return
     
     # Plot
-    if selected_cells and "Toutes les cellules" not in selected_cells:
-        site_df = site_df[site_df['Cell Name'].isin(selected_cells)]
+    fig, ax = plt.subplots(figsize=(8, 4))
+    ax.hist(pd.to_numeric(view.cells_df[kpi], errors='coerce').dropna(), bins=30, color='steelblue', edgecolor='black', alpha=0.7)
 
-        fig, ax = plt.subplots(figsize=(8, 4))
-        ax.hist(site_df[kpi], bins=30, color='steelblue', edgecolor='black', alpha=0.7)
-
-        ax.set_title(f"{kpi} - {site_name}", fontsize=10)
-        ax.set_xlabel(kpi, fontsize=8)
-        ax.set_ylabel("Fréquence", fontsize=8)
-        ax.legend()
+    ax.set_title(f"{kpi} - {view.site_name}", fontsize=10)
+    ax.set_xlabel(kpi, fontsize=8)
+    ax.set_ylabel("Fréquence", fontsize=8)
 
     return fig
 
-def plot_kpi_bar_chart(df, site_name, kpi, selected_cells = None):
+def plot_kpi_bar_chart(view, kpi):
     """
     Time bar chart of a KPI.
 
     Args:
-        df: full cleaned dataframe
-        site_name: selected eNodeB Name
+        view: PreparedSiteView of the selected site and cells
         kpi: KPI to plot
         
     Returns:
         fig: Plotly figure
     """
-    site_df = df[df['eNodeB Name'] == site_name].copy()
-    if site_df.empty:
-        print(f"[!] Aucune donnée trouvée pour le site: {site_name}")
+    if view.empty:
+        print(f"[!] Aucune donnée trouvée pour le site: {view.site_name}")
         return
-    
-    ### Key step: managing temporal column names 
-    date_col = None
-    if 'Date' in site_df.columns:
-        date_col = 'Date'
-        site_df[date_col] = pd.to_datetime(site_df[date_col])
-    elif 'Time' in site_df.columns:
-        date_col = 'Time'
-        site_df[date_col] = site_df[date_col].astype(str)
-        site_df[date_col] = site_df[date_col].str.replace(r'(\d{4}-\d{2}-\d{2})(\d{2}:\d{2})', r'\1 \2', regex=True)
-        site_df[date_col] = pd.to_datetime(site_df[date_col], errors='coerce')
-        site_df = site_df.dropna(subset=[date_col])
-    else:
-        raise KeyError("Aucune colonne de date trouvée (ni 'Date' ni 'Time').")
-    
-    site_df.sort_values(date_col, inplace=True)
 
     # plot :
-
-    if selected_cells and "Toutes les cellules" not in selected_cells:
-        site_df = site_df[site_df['Cell Name'].isin(selected_cells)]
-
-        fig = px.bar(
-                site_df,
-                x=date_col, 
-                y=kpi, 
-        )
+    fig = px.bar(
+            view.cells_df,
+            x=view.date_col, 
+            y=kpi, 
+    )
     
     fig.update_traces(width=0.5)
 
@@ -339,65 +537,66 @@ def plot_kpi_bar_chart(df, site_name, kpi, selected_cells = None):
 
     return fig
 
-def plot_kpi_anomaly_scatter(df, site_name, kpi, selected_cells = None, threshold=None, 
-                             threshold_direction=None, use_zscore=False, zscore_threshold=3.0,
-                             use_moving_avg=False, moving_avg_window=5, moving_avg_thresh=2.0):
+def plot_kpi_anomaly_scatter(view, kpi, threshold=None, threshold_direction=None, use_zscore=False, zscore_threshold=3.0,
+                             use_moving_avg=False, moving_avg_window=5, moving_avg_thresh=2.0,
+                             zscore_window=ROLLING_WINDOW):
     """
     Scatter plot KPI vs Date with color according to anomaly type.
 
     Args:
-        df: full dataframe
-        site_name: site name
+        view: PreparedSiteView of the selected site and cells
         kpi: KPI to plot
         threshold: static threshold
-        threshold_direction: threshold directito enable Z-scorepour activer Z-score
+        threshold_direction: "Maximum à ne pas dépasser" / "Minimum à respecter", or "max" / "min"
+        use_zscore: bool to enable the rolling Z-score
         zscore_threshold: Z-score threshold value
         use_moving_avg: bool to enable moving average
         moving_avg_window: window size for moving average
         moving_avg_thresh: deviation threshold
+        zscore_window: number of previous intervals of the per-cell Z-score
     """
-    site_df = df[df['eNodeB Name'] == site_name].copy()
-    if 'Date' in site_df.columns:
-        date_col = 'Date'
-    elif 'Time' in site_df.columns:
-        date_col = 'Time'
-    else:
-        raise KeyError("Colonne de temps manquante (Date ou Time)")
-
-    site_df[date_col] = pd.to_datetime(site_df[date_col], errors='coerce')
-    site_df = site_df.dropna(subset=[date_col])
-    site_df.sort_values(date_col, inplace=True)
+    date_col = view.date_col
+    site_df = view.site_df
 
-    site_df["Anomaly Type"] = "Normal"
+    anomaly_type = np.full(len(site_df), "Normal", dtype=object)
 
-    if threshold and threshold_direction:
-        if threshold_direction == "Maximum à ne pas dépasser":
-            site_df.loc[site_df[kpi] > threshold, "Anomaly Type"] = "Seuil dépassé"
-        elif threshold_direction == "Minimum à respecter":
-            site_df.loc[site_df[kpi] < threshold, "Anomaly Type"] = "Sous le minimum"
+    direction = normalize_direction(threshold_direction)
+    if threshold and direction == "max":
+        anomaly_type[(site_df[kpi] > threshold).to_numpy()] = "Seuil dépassé"
+    elif threshold and direction == "min":
+        anomaly_type[(site_df[kpi] < threshold).to_numpy()] = "Sous le minimum"
 
+    # Rolling detectors are computed per cell, before the cell filter
     if use_zscore:
-        z_anomalies = detect_zscore_anomalies(site_df[kpi], zscore_threshold)
-        site_df.loc[z_anomalies, "Anomaly Type"] = "Z-score"
-    
-    if selected_cells and "Toutes les cellules" not in selected_cells:
-        site_df = site_df[site_df['Cell Name'].isin(selected_cells)]
+        z_anomalies = detect_rolling_zscore_anomalies(site_df, kpi, zscore_threshold, window=zscore_window, date_col=date_col)
+        anomaly_type[np.asarray(z_anomalies, dtype=bool)] = "Z-score"
+
+    if use_moving_avg:
+        ma_anomalies = detect_moving_average_anomalies(site_df, kpi, moving_avg_thresh, window=moving_avg_window, date_col=date_col)
+        anomaly_type[np.asarray(ma_anomalies, dtype=bool)] = "Moving Average"
+
+    # The view is shared: the anomaly types go to a new frame of the displayed cells
+    plot_df = pd.DataFrame({
+        date_col: view.cells_df[date_col].to_numpy(),
+        kpi: view.cells_df[kpi].to_numpy(),
+        "Anomaly Type": anomaly_type[view.cell_mask],
+    })
     
-        fig = px.scatter(
-            site_df,
-            x=date_col,
-            y=kpi,
-            color="Anomaly Type",
-            title=f"Scatter Plot Anomalies - {kpi}",
-            color_discrete_map={
-                "Normal": "green",
-                "Seuil dépassé": "red",
-                "Sous le minimum": "red",
-                "Z-score": "orange",
-                "Moving Average": "blue"
-            },
-            hover_data=[kpi]
-        )
+    fig = px.scatter(
+        plot_df,
+        x=date_col,
+        y=kpi,
+        color="Anomaly Type",
+        title=f"Scatter Plot Anomalies - {kpi}",
+        color_discrete_map={
+            "Normal": "green",
+            "Seuil dépassé": "red",
+            "Sous le minimum": "red",
+            "Z-score": "orange",
+            "Moving Average": "blue"
+        },
+        hover_data=[kpi]
+    )
 
     fig.update_layout(
         height=500,
@@ -406,3 +605,73 @@ def plot_kpi_anomaly_scatter(df, site_name, kpi, selected_cells = None, threshol
     )
 
     return fig
+
+def plot_kpi_correlation_heatmap(corr, title="Matrice de corrélation des KPIs"):
+    """
+    Heatmap of a KPI correlation matrix.
+
+    Args:
+        corr: square correlation matrix (see kpi_utils.kpi_correlation)
+        title: figure title
+
+    Returns:
+        fig: Plotly figure
+    """
+    fig = px.imshow(
+        corr,
+        text_auto=".2f",
+        color_continuous_scale="RdBu_r",
+        zmin=-1,
+        zmax=1,
+        aspect="auto",
+    )
+
+    fig.update_layout(
+        height=max(400, 35 * len(corr)),
+        title=title,
+        margin=dict(l=30, r=30, t=50, b=30),
+        xaxis_tickangle=-45,
+        coloraxis_colorbar=dict(title="Corrélation")
+    )
+
+    return fig
+
+def plot_fleet_heatmap(counts, health=None, title="Couples (cellule, KPI) hors seuil par site"):
+    """
+    Sites x days (or sites x KPIs) heatmap of out-of-threshold counts, as one trace.
+
+    Args:
+        counts: (cell, KPI) checks out of threshold, sites as index
+            (see fleet_overview.fleet_anomaly_matrix)
+        health: optional share (%) of checks within threshold, same shape
+        title: figure title
+
+    Returns:
+        fig: Plotly figure
+    """
+    columns = [col.strftime("%Y-%m-%d") if isinstance(col, pd.Timestamp) else str(col) for col in counts.columns]
+    hovertemplate = "Site : %{y}<br>%{x}<br>Hors seuil : %{z}"
+    if health is not None:
+        hovertemplate += "<br>Santé : %{customdata:.0f} %"
+
+    fig = go.Figure(go.Heatmap(
+        z=counts.to_numpy(),
+        x=columns,
+        y=counts.index.astype(str),
+        customdata=None if health is None else health.to_numpy(),
+        colorscale="Reds",
+        hovertemplate=hovertemplate + "<extra></extra>",
+        colorbar=dict(title="Hors seuil"),
+        xgap=1,
+        ygap=1,
+    ))
+
+    fig.update_layout(
+        title=title,
+        height=min(max(400, 18 * len(counts)), 2000),
+        margin=dict(l=30, r=30, t=50, b=30),
+        xaxis=dict(type="category", tickangle=-45),
+        yaxis=dict(type="category", autorange="reversed"),
+    )
+
+    return fig
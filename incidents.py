@@ -0,0 +1,159 @@
+import pandas as pd
+import numpy as np
+
+# ----------- Incident builder -----------
+
+INTERVAL = pd.Timedelta(minutes=15)  # granularity of the OSS exports
+MAX_GAP = pd.Timedelta(minutes=30)   # anomalies closer than this belong to the same episode
+
+
+def _grouped_cummax(values, groups):
+    """Running maximum of `values` restarted at every new value of the sorted `groups`."""
+    return pd.Series(values).groupby(groups, sort=False).cummax().to_numpy()
+
+
+def _joined_names(groups, names, n_groups):
+    """Sorted distinct names of every group, joined with ", " (one reduceat, no per-group call)."""
+    pairs = pd.DataFrame({"group": groups, "name": names.astype(str).to_numpy()}).drop_duplicates()
+    pairs = pairs.sort_values(["group", "name"], kind='stable')
+    if not len(pairs):
+        return np.array([], dtype=object)
+    group_sorted = pairs["group"].to_numpy()
+    starts = np.flatnonzero(np.r_[True, group_sorted[1:] != group_sorted[:-1]])
+    joined = np.add.reduceat((pairs["name"] + ", ").to_numpy(dtype=object), starts)
+    return np.array([text[:-2] for text in joined], dtype=object)
+
+
+def build_episodes(anomalies, max_gap=MAX_GAP, interval=INTERVAL,
+                   site_col='eNodeB Name', cell_col='Cell Name', date_col='Date'):
+    """
+    Merges the anomalous intervals of each (cell, KPI) into episodes.
+
+    Two anomalies of the same cell and KPI belong to the same episode when they
+    are at most `max_gap` apart.
+
+    Args:
+        anomalies (pd.DataFrame): anomaly table (threshold engine, parallel
+            detection, anomaly store, ...) with date, site, cell and 'KPI'
+        max_gap (pd.Timedelta): largest gap inside an episode
+        interval (pd.Timedelta): duration of one sample (end of the last one)
+        site_col, cell_col, date_col (str): column names
+
+    Returns:
+        episodes (pd.DataFrame): site, cell, 'KPI', 'Start', 'End', 'Points'
+            and 'Max Score' (largest |Score|, NaN without scores)
+        episode_of_row (np.ndarray): episode (row of `episodes`) of every anomaly
+    """
+    n = len(anomalies)
+    sites = anomalies[site_col].astype(object).fillna('').to_numpy() if site_col in anomalies.columns else np.full(n, '', dtype=object)
+    cell_codes, cells = pd.factorize(anomalies[cell_col].astype(object).fillna(''))
+    kpi_codes, kpis = pd.factorize(anomalies['KPI'].astype(object).fillna('') if 'KPI' in anomalies.columns else pd.Series([''] * n))
+    dates = pd.to_datetime(anomalies[date_col]).to_numpy(dtype='datetime64[ns]').view(np.int64)
+    scores = pd.to_numeric(anomalies['Score'], errors='coerce').abs().to_numpy(dtype=np.float64) \
+        if 'Score' in anomalies.columns else np.full(n, np.nan)
+
+    order = np.lexsort((dates, kpi_codes, cell_codes))
+    cell_sorted, kpi_sorted, date_sorted = cell_codes[order], kpi_codes[order], dates[order]
+    new_episode = np.ones(n, dtype=bool)
+    new_episode[1:] = (
+        (cell_sorted[1:] != cell_sorted[:-1])
+        | (kpi_sorted[1:] != kpi_sorted[:-1])
+        | (np.diff(date_sorted) > max_gap.value)
+    )
+    starts = np.flatnonzero(new_episode)
+    stops = np.r_[starts[1:], n] if n else starts
+
+    episode_of_row = np.empty(n, dtype=np.int64)
+    episode_of_row[order] = np.cumsum(new_episode) - 1
+
+    score_sorted = scores[order]
+    max_scores = np.fmax.reduceat(score_sorted, starts) if n else np.array([])
+
+    episodes = pd.DataFrame({
+        site_col: sites[order[starts]],
+        cell_col: cells[cell_sorted[starts]] if n else np.array([], dtype=object),
+        'KPI': kpis[kpi_sorted[starts]] if n else np.array([], dtype=object),
+        'Start': pd.to_datetime(date_sorted[starts]),
+        'End': pd.to_datetime(date_sorted[stops - 1] + interval.value),
+        'Points': stops - starts,
+        'Max Score': max_scores,
+    })
+    return episodes, episode_of_row
+
+
+def build_incidents(anomalies, max_gap=MAX_GAP, interval=INTERVAL,
+                    site_col='eNodeB Name', cell_col='Cell Name', date_col='Date'):
+    """
+    Groups anomalies into a ranked list of incidents.
+
+    Anomalies are first merged into episodes per (cell, KPI) (see
+    `build_episodes`). Episodes of the same eNodeB whose time intervals overlap
+    or touch, whatever their KPI or sibling cell, then form one incident: the
+    episodes of a site are swept in start order and a new incident starts when
+    an episode begins after the end of every earlier one. The cost is two sorts
+    of the anomaly table, so the whole fleet is processed at once.
+
+    Incidents are ranked by number of cells, then KPIs, then anomalous points.
+
+    Args:
+        anomalies (pd.DataFrame): anomaly table with date, site, cell and 'KPI'
+        max_gap (pd.Timedelta): largest gap inside an episode
+        interval (pd.Timedelta): duration of one sample
+        site_col, cell_col, date_col (str): column names
+
+    Returns:
+        incidents (pd.DataFrame): 'Incident' (rank, 1 = most severe), site,
+            'Start', 'End', 'Duration', 'Cells', 'KPIs', 'Points', 'Max Score',
+            'Cell Names', 'KPI Names'
+        incident_of_row (np.ndarray): incident number of every anomaly
+    """
+    episodes, episode_of_row = build_episodes(anomalies, max_gap, interval, site_col, cell_col, date_col)
+    n = len(episodes)
+
+    site_codes = pd.factorize(episodes[site_col])[0]
+    start = episodes['Start'].to_numpy(dtype='datetime64[ns]').view(np.int64)
+    end = episodes['End'].to_numpy(dtype='datetime64[ns]').view(np.int64)
+
+    # Interval sweep per site
+    order = np.lexsort((start, site_codes))
+    site_sorted, start_sorted = site_codes[order], start[order]
+    reach = _grouped_cummax(end[order], site_sorted)
+    new_incident = np.ones(n, dtype=bool)
+    new_incident[1:] = (site_sorted[1:] != site_sorted[:-1]) | (start_sorted[1:] > reach[:-1])
+    incident_of_episode = np.empty(n, dtype=np.int64)
+    incident_of_episode[order] = np.cumsum(new_incident) - 1
+
+    grouped = episodes.assign(_incident=incident_of_episode).groupby('_incident', sort=True)
+    incidents = grouped.agg(**{
+        site_col: (site_col, 'first'),
+        'Start': ('Start', 'min'),
+        'End': ('End', 'max'),
+        'Cells': (cell_col, 'nunique'),
+        'KPIs': ('KPI', 'nunique'),
+        'Points': ('Points', 'sum'),
+        'Max Score': ('Max Score', 'max'),
+    })
+    incidents['Cell Names'] = _joined_names(incident_of_episode, episodes[cell_col], len(incidents))
+    incidents['KPI Names'] = _joined_names(incident_of_episode, episodes['KPI'], len(incidents))
+    incidents.insert(3, 'Duration', incidents['End'] - incidents['Start'])
+
+    ranking = np.lexsort((
+        incidents['Start'].to_numpy(),
+        -incidents['Points'].to_numpy(),
+        -incidents['KPIs'].to_numpy(),
+        -incidents['Cells'].to_numpy(),
+    ))
+    rank_of_incident = np.empty(len(incidents), dtype=np.int64)
+    rank_of_incident[ranking] = np.arange(1, len(incidents) + 1)
+
+    incidents = incidents.iloc[ranking].reset_index(drop=True)
+    incidents.insert(0, 'Incident', np.arange(1, len(incidents) + 1))
+    return incidents, rank_of_incident[incident_of_episode[episode_of_row]]
+
+
+"""
+Usage :
+    anomalies = detect_threshold_anomalies(df, load_threshold_config())
+    incidents, anomalies["Incident"] = build_incidents(anomalies)
+    print(incidents.head(20))
+"""
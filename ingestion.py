@@ -0,0 +1,225 @@
+import os
+import sys
+
+import pandas as pd
+import numpy as np
+from pandas.io.parsers import TextParser
+
+from preprocessing import clean_data, get_cleaning_plan
+
+# ----------- Streaming ingestion of large OSS exports -----------
+
+BATCH_SIZE = 50_000
+
+
+def _rows_to_frame(rows, columns):
+    """Builds a batch from openpyxl rows with the same parser (NA values, type inference) as `pd.read_excel`."""
+    with TextParser([columns] + rows, header=0) as parser:
+        return parser.read()
+
+
+def iter_raw_batches(path, batch_size=BATCH_SIZE, **read_kwargs):
+    """
+    Reads an OSS export batch by batch without loading the whole file.
+
+    .xlsx files are read with openpyxl in read-only mode, .csv files with the
+    pandas chunked reader (`read_kwargs` are passed to `pd.read_csv`, e.g. sep=';').
+
+    Args:
+        path (str): path of the export
+        batch_size (int): number of rows per batch
+
+    Yields:
+        batch (pd.DataFrame): raw rows, as `pd.read_excel` / `pd.read_csv` would return them
+    """
+    extension = os.path.splitext(path)[1].lower()
+
+    if extension == ".csv":
+        yield from pd.read_csv(path, chunksize=batch_size, **read_kwargs)
+        return
+
+    if extension != ".xlsx":
+        raise ValueError(f"Format de fichier non supporté : {extension}")
+
+    from openpyxl import load_workbook
+
+    workbook = load_workbook(path, read_only=True, data_only=True)
+    try:
+        rows = workbook.active.iter_rows(values_only=True)
+        header = next(rows, None)
+        if header is None:
+            return
+        columns = [name if name is not None else f"Unnamed: {i}" for i, name in enumerate(header)]
+
+        buffer = []
+        for row in rows:
+            if all(value is None for value in row):
+                continue
+            # Empty cells are read as "" (then NaN) as in the pandas openpyxl reader
+            buffer.append(["" if value is None else value for value in row])
+            if len(buffer) == batch_size:
+                yield _rows_to_frame(buffer, columns)
+                buffer = []
+        if buffer:
+            yield _rows_to_frame(buffer, columns)
+    finally:
+        workbook.close()
+
+
+def _is_numeric_text(values):
+    """True if every non-missing value of a string column parses as a number."""
+    present = values[values.notna() & (values != "nan")]
+    return not present.empty and pd.to_numeric(present, errors="coerce").notna().all()
+
+
+def _infer_schema(cleaned, columns, non_numeric_cols):
+    """
+    Fixes the Arrow schema of the sink from the first cleaned batch.
+
+    Numeric columns (including text columns that only failed conversion because
+    of missing values) are stored as float64 so that later batches fit the same
+    schema. Columns that were empty in the first batch are numeric unless they
+    are identifier columns.
+    """
+    import pyarrow as pa
+
+    fields = []
+    for col in columns:
+        if col in cleaned.columns:
+            dtype = cleaned[col].dtype
+            if pd.api.types.is_datetime64_any_dtype(dtype):
+                arrow_type = pa.timestamp("ns")
+            elif pd.api.types.is_numeric_dtype(dtype) or _is_numeric_text(cleaned[col]):
+                arrow_type = pa.float64()
+            else:
+                arrow_type = pa.string()
+        elif col in non_numeric_cols:
+            arrow_type = pa.string()
+        else:
+            arrow_type = pa.float64()
+        fields.append(pa.field(str(col), arrow_type))
+
+    return pa.schema(fields)
+
+
+def _row_hashes(batch):
+    """
+    Hash of every raw row, comparable across batches.
+
+    Numeric columns are hashed as float64: a column read as int in one batch and
+    as float in another (missing values) holds the same values in the whole file.
+    """
+    columns = {
+        col: values.astype("float64") if pd.api.types.is_numeric_dtype(values) else values
+        for col, values in batch.items()
+    }
+    return pd.util.hash_pandas_object(pd.DataFrame(columns), index=False).to_numpy()
+
+
+def _conform_batch(cleaned, schema):
+    """
+    Casts a cleaned batch to the sink schema (missing columns become empty).
+
+    Raises:
+        ValueError: text in a column stored as float64 (it would be lost)
+    """
+    import pyarrow as pa
+
+    data = {}
+    for field in schema:
+        if field.name in cleaned.columns:
+            values = cleaned[field.name]
+        else:
+            values = pd.Series(np.nan, index=cleaned.index)
+
+        if pa.types.is_timestamp(field.type):
+            data[field.name] = pd.to_datetime(values, errors="coerce")
+        elif pa.types.is_floating(field.type):
+            numbers = pd.to_numeric(values, errors="coerce")
+            lost = numbers.isna() & values.notna() & (values.astype(str) != "nan")
+            if lost.any():
+                raise ValueError(
+                    f"Texte dans la colonne numérique {field.name} : {values[lost].iloc[0]!r} "
+                    "(augmentez batch_size pour que le premier lot contienne ce texte)."
+                )
+            data[field.name] = numbers.astype("float64")
+        else:
+            data[field.name] = values.where(values.isna(), values.astype(str))
+
+    return pa.Table.from_pandas(pd.DataFrame(data), schema=schema, preserve_index=False)
+
+
+def ingest_file(path, sink_path, batch_size=BATCH_SIZE, **read_kwargs):
+    """
+    Cleans an OSS export in bounded memory and writes it to a Parquet file.
+
+    Each batch is cleaned with the same rules as `clean_data` (format detection,
+    duplicates, "/0" rows, decimal commas, "%" and conversion) and appended to the
+    sink as a row group, so peak memory depends on `batch_size` and not on the
+    number of rows. Full-row duplicates are removed across the whole file, as
+    `clean_data` does: the hashes of the raw rows already seen are kept (8 bytes
+    per row), and a row seen in an earlier batch is dropped before cleaning.
+
+    Args:
+        path (str): .xlsx or .csv export
+        sink_path (str): output .parquet file
+        batch_size (int): number of rows per batch
+
+    Returns:
+        n_rows (int): number of cleaned rows written
+
+    Raises:
+        ValueError: empty file, or text in a column the first batch found numeric
+    """
+    import pyarrow.parquet as pq
+
+    writer = None
+    schema = None
+    n_rows = 0
+    tmp_path = f"{sink_path}.tmp"
+    seen = set()
+    done = False
+
+    try:
+        for batch in iter_raw_batches(path, batch_size=batch_size, **read_kwargs):
+            hashes = _row_hashes(batch)
+            repeated = np.fromiter((value in seen for value in hashes.tolist()), dtype=bool, count=len(hashes))
+            seen.update(hashes.tolist())
+            if repeated.any():
+                batch = batch[~repeated]
+
+            plan = get_cleaning_plan(batch.columns)
+            cleaned = clean_data(batch, plan["format"])
+
+            if writer is None:
+                renames = plan["renames"]
+                columns = [renames.get(col, col) for col in batch.columns]
+                identifiers = [renames.get(col, col) for col in plan["identifier_columns"]]
+                schema = _infer_schema(cleaned, columns, identifiers)
+                writer = pq.ParquetWriter(tmp_path, schema)
+
+            if not cleaned.empty:
+                writer.write_table(_conform_batch(cleaned, schema))
+                n_rows += len(cleaned)
+        if writer is None:
+            raise ValueError(f"Fichier vide : {path}")
+        writer.close()
+        os.replace(tmp_path, sink_path)
+        done = True
+    finally:
+        if not done:
+            if writer is not None:
+                writer.close()
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    return n_rows
+
+
+"""
+Usage :
+    python ingestion.py data/raw/4G_KPI_year.xlsx data/4G_KPI_year.parquet
+"""
+if __name__ == "__main__":
+    n = ingest_file(sys.argv[1], sys.argv[2])
+    print(f"{n} lignes nettoyées écrites dans {sys.argv[2]}")
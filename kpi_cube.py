@@ -0,0 +1,180 @@
+import os
+
+import pandas as pd
+import numpy as np
+
+# ----------- Multi-resolution KPI rollup cube -----------
+
+LEVELS = ['hour', 'day', 'week']
+SCOPES = ['cell', 'site', 'network']
+STATS = ['sum', 'count', 'min', 'max']
+
+
+def _bucket(dates, level):
+    """Start of the hour / day / week (Monday) of each timestamp."""
+    if level == 'hour':
+        return dates.dt.floor('h')
+    if level == 'day':
+        return dates.dt.normalize()
+    if level == 'week':
+        return dates.dt.normalize() - pd.to_timedelta(dates.dt.dayofweek, unit='D')
+    raise ValueError(f"Niveau inconnu : {level}")
+
+
+# How partial statistics of the same bucket are merged
+MERGE = {'sum': 'sum', 'count': 'sum', 'min': 'min', 'max': 'max'}
+
+
+def _combine(table, **groupby_kwargs):
+    """Merges the rows of a statistics table that fall in the same group."""
+    return pd.concat({
+        stat: table[stat].groupby(**groupby_kwargs).agg(how)
+        for stat, how in MERGE.items()
+    }, axis=1)
+
+
+class KPICube:
+    """
+    Pre-aggregated KPIs at hour / day / week level and cell / site / network scope.
+
+    Every table keeps the sum, count, min and max of each KPI per bucket, so that
+    means are derived exactly (sum / count) and partial tables can be merged.
+    Raw rows are grouped once into the cell table of the finest level; every
+    other table is rolled up from it. `update` merges new intervals into the
+    touched buckets only.
+
+    Args:
+        df (pd.DataFrame): cleaned data (optional)
+        kpis (list): KPI columns (default: every numeric column of df)
+        site_col (str): site column
+        cell_col (str): cell column
+        date_col (str): datetime64 date column
+        levels (list): levels to build (default: all), e.g. ['day']
+        scopes (list): scopes to build (default: all), e.g. ['cell']
+    """
+
+    def __init__(self, df=None, kpis=None, site_col='eNodeB Name', cell_col='Cell Name', date_col='Date',
+                 levels=LEVELS, scopes=SCOPES):
+        self.site_col = site_col
+        self.cell_col = cell_col
+        self.date_col = date_col
+        self.kpis = list(kpis) if kpis is not None else None
+        self.levels = [level for level in LEVELS if level in levels]
+        self.scopes = [scope for scope in SCOPES if scope in scopes]
+        self.tables = {}
+
+        if df is not None:
+            self.update(df)
+
+    def _keys(self, scope):
+        return {'cell': [self.site_col, self.cell_col], 'site': [self.site_col], 'network': []}[scope]
+
+    def _rollup(self, df):
+        """Partial tables of every (level, scope) for a batch of raw rows."""
+        if self.kpis is None:
+            self.kpis = list(df.select_dtypes(include=['float', 'int']).columns)
+
+        df = df.dropna(subset=[self.date_col])
+        base_level = self.levels[0]
+        buckets = _bucket(df[self.date_col], base_level).rename(self.date_col)
+        keys = [df[col] for col in self._keys('cell')] + [buckets]
+
+        # Sums are accumulated in float64, also for compact (float32) frames
+        values = df[self.kpis].astype('float64')
+
+        # One pass over the raw rows
+        base = values.groupby(keys, observed=True, sort=False).agg(STATS)
+        base = base.swaplevel(axis=1)[STATS]
+
+        partials = {}
+        for level in self.levels:
+            if level == base_level:
+                cell_table = base
+            else:
+                dates = _bucket(base.index.get_level_values(self.date_col).to_series(), level)
+                keys = [base.index.get_level_values(col) for col in self._keys('cell')] + [dates.to_numpy()]
+                cell_table = _combine(base, by=keys, observed=True)
+                cell_table.index.names = self._keys('cell') + [self.date_col]
+            if 'cell' in self.scopes:
+                partials[(level, 'cell')] = cell_table
+
+            for scope in [scope for scope in self.scopes if scope != 'cell']:
+                keys = self._keys(scope) + [self.date_col]
+                partials[(level, scope)] = _combine(cell_table, level=keys, observed=True)
+
+        return partials
+
+    def update(self, df):
+        """
+        Merges new intervals into the cube.
+
+        Only the buckets present in `df` are touched. Rows must not have been added
+        before (the history store deduplicates them upstream).
+
+        Args:
+            df (pd.DataFrame): new cleaned rows
+        """
+        for key, partial in self._rollup(df).items():
+            table = self.tables.get(key)
+            if table is None:
+                self.tables[key] = partial.sort_index()
+                continue
+
+            common = partial.index.intersection(table.index)
+            if len(common):
+                merged = _combine(pd.concat([table.loc[common], partial.loc[common]]), level=list(range(common.nlevels)), observed=True)
+                table.loc[common, merged.columns] = merged
+
+            added = partial.drop(common)
+            if len(added):
+                table = pd.concat([table, added]).sort_index()
+            self.tables[key] = table
+
+    def table(self, level='day', scope='site'):
+        """Raw statistics (sum, count, min, max) of a level and scope."""
+        return self.tables[(level, scope)]
+
+    def mean(self, level='day', scope='site', kpis=None):
+        """
+        Exact KPI means (sum / count) of a level and scope.
+
+        Args:
+            level (str): 'hour', 'day' or 'week'
+            scope (str): 'cell', 'site' or 'network'
+            kpis (list): KPIs to return (default: all)
+
+        Returns:
+            df_mean (pd.DataFrame): indexed by scope keys and bucket start
+        """
+        table = self.table(level, scope)
+        kpis = kpis if kpis is not None else self.kpis
+        return table['sum'][kpis] / table['count'][kpis].replace(0, np.nan)
+
+    def save(self, directory):
+        """Writes every table to `directory` as Parquet (atomic replace per table)."""
+        os.makedirs(directory, exist_ok=True)
+        for (level, scope), table in self.tables.items():
+            flat = table.copy()
+            flat.columns = [f"{stat}|{kpi}" for stat, kpi in flat.columns]
+            path = os.path.join(directory, f"{level}_{scope}.parquet")
+            tmp_path = f"{path}.{os.getpid()}.tmp"
+            flat.reset_index().to_parquet(tmp_path, index=False)
+            os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, directory, site_col='eNodeB Name', cell_col='Cell Name', date_col='Date'):
+        """Reads a cube written by `save`."""
+        cube = cls(site_col=site_col, cell_col=cell_col, date_col=date_col)
+        for level in LEVELS:
+            for scope in SCOPES:
+                path = os.path.join(directory, f"{level}_{scope}.parquet")
+                if not os.path.exists(path):
+                    continue
+                flat = pd.read_parquet(path).set_index(cube._keys(scope) + [date_col])
+                flat.columns = pd.MultiIndex.from_tuples([tuple(col.split("|", 1)) for col in flat.columns])
+                cube.tables[(level, scope)] = flat
+                cube.kpis = list(flat['sum'].columns)
+        if cube.tables:
+            cube.levels = [level for level in LEVELS if any(key[0] == level for key in cube.tables)]
+            cube.scopes = [scope for scope in SCOPES if any(key[1] == scope for key in cube.tables)]
+        return cube
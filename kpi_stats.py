@@ -0,0 +1,208 @@
+import numpy as np
+import pandas as pd
+
+# ----------- Mergeable KPI statistics -----------
+
+HLL_PRECISION = 12  # 4096 registers per KPI, ~1.6 % error on distinct counts
+
+
+def _hll_estimate(registers):
+    """HyperLogLog cardinality estimate of each row of registers."""
+    m = registers.shape[1]
+    alpha = 0.7213 / (1 + 1.079 / m)
+    estimate = alpha * m * m / np.sum(np.ldexp(1.0, -registers.astype(np.int64)), axis=1)
+
+    # Small range correction (linear counting)
+    zeros = np.count_nonzero(registers == 0, axis=1)
+    with np.errstate(divide='ignore'):
+        linear = m * np.log(m / zeros)
+    small = (estimate <= 2.5 * m) & (zeros > 0)
+    estimate[small] = linear[small]
+    return np.rint(estimate).astype(np.int64)
+
+
+class KPIStats:
+    """
+    One-pass statistics of KPI columns that can be merged exactly.
+
+    Keeps, for every KPI, the count, mean and sum of squared deviations
+    (Welford / Chan), min, max, number of missing values and a HyperLogLog
+    sketch of the distinct values, plus the number of rows seen. Accumulators
+    built from chunks, days or worker processes are combined with `merge`; the
+    result is the same as one pass over all the rows (distinct counts are
+    approximate), also when the KPI columns differ between the parts: the rows
+    of a part without a KPI count as missing values of that KPI.
+
+    Args:
+        kpis (list): KPI columns
+        precision (int): HyperLogLog precision (2**precision registers per KPI)
+    """
+
+    def __init__(self, kpis=(), precision=HLL_PRECISION):
+        self.kpis = list(kpis)
+        self.precision = precision
+        k = len(self.kpis)
+        self.rows = 0
+        self.count = np.zeros(k, dtype=np.int64)
+        self.missing = np.zeros(k, dtype=np.int64)
+        self.mean = np.zeros(k)
+        self.m2 = np.zeros(k)
+        self.min = np.full(k, np.inf)
+        self.max = np.full(k, -np.inf)
+        self.registers = np.zeros((k, 2 ** precision), dtype=np.uint8)
+
+    @classmethod
+    def from_frame(cls, df, kpis=None, precision=HLL_PRECISION):
+        """
+        Statistics of the numeric columns of a DataFrame.
+
+        Args:
+            df (pd.DataFrame)
+            kpis (list): KPI columns (default: every numeric column)
+            precision (int): HyperLogLog precision
+
+        Returns:
+            stats (KPIStats)
+        """
+        if kpis is None:
+            kpis = df.select_dtypes(include=['float', 'int']).columns
+        stats = cls(kpis, precision)
+        stats.rows = len(df)
+        if not stats.kpis or df.empty:
+            stats.missing[:] = len(df)
+            return stats
+
+        # Column-major: every KPI is a contiguous block, with no per-row Python
+        values = np.asfortranarray(df[stats.kpis].to_numpy(dtype=np.float64))
+        shift = np.uint64(64 - precision)
+        low_bits = np.uint64((1 << (64 - precision)) - 1)
+
+        for i in range(len(stats.kpis)):
+            column = values[:, i]
+            present = column[~np.isnan(column)]
+            stats.count[i] = len(present)
+            stats.missing[i] = len(column) - len(present)
+            if not len(present):
+                continue
+
+            stats.mean[i] = present.sum() / len(present)
+            deviations = present - stats.mean[i]
+            stats.m2[i] = deviations @ deviations
+            stats.min[i] = present.min()
+            stats.max[i] = present.max()
+
+            # HyperLogLog: duplicates do not change the registers, so only the
+            # distinct values are hashed (+ 0.0 folds -0.0 into 0.0). The first
+            # bits of the hash pick the register, the register keeps the highest
+            # rank of the first set bit among the remaining ones.
+            hashes = pd.util.hash_array(pd.unique(present + 0.0), categorize=False)
+            remainder = hashes & low_bits
+            bit_length = (remainder.astype(np.float64).view(np.int64) >> 52) - 1022
+            rank = np.where(remainder == 0, 64 - precision + 1, 64 - precision - bit_length + 1)
+            np.maximum.at(stats.registers[i], (hashes >> shift).astype(np.int64), rank.astype(np.uint8))
+
+        return stats
+
+    def update(self, df):
+        """Adds the rows of a DataFrame (chunk, day, file) to the accumulator."""
+        return self.merge(KPIStats.from_frame(df, self.kpis or None, self.precision))
+
+    def _aligned(self, kpis):
+        """Arrays of the accumulator reindexed on `kpis` (every row is missing for absent KPIs)."""
+        positions = {kpi: i for i, kpi in enumerate(self.kpis)}
+        index = np.array([positions.get(kpi, -1) for kpi in kpis], dtype=np.int64)
+        known = index >= 0
+
+        aligned = KPIStats(kpis, self.precision)
+        aligned.rows = self.rows
+        aligned.missing[~known] = self.rows
+        for name in ['count', 'missing', 'mean', 'm2', 'min', 'max', 'registers']:
+            getattr(aligned, name)[known] = getattr(self, name)[index[known]]
+        return aligned
+
+    def merge(self, other):
+        """
+        Merges another accumulator into this one (Chan et al. parallel update).
+
+        Args:
+            other (KPIStats)
+
+        Returns:
+            self (KPIStats)
+        """
+        if other.precision != self.precision:
+            raise ValueError("Précisions HyperLogLog différentes")
+
+        kpis = self.kpis + [kpi for kpi in other.kpis if kpi not in self.kpis]
+        a, b = self._aligned(kpis), other._aligned(kpis)
+
+        count = a.count + b.count
+        delta = b.mean - a.mean
+        with np.errstate(invalid='ignore', divide='ignore'):
+            weight = np.where(count > 0, b.count / count, 0.0)
+
+        self.kpis = kpis
+        self.rows = a.rows + b.rows
+        self.count = count
+        self.missing = a.missing + b.missing
+        self.mean = a.mean + delta * weight
+        self.m2 = a.m2 + b.m2 + delta ** 2 * a.count * weight
+        self.min = np.fmin(a.min, b.min)
+        self.max = np.fmax(a.max, b.max)
+        self.registers = np.maximum(a.registers, b.registers)
+        return self
+
+    def summary(self, exclude_columns=None):
+        """
+        Statistical summary in the layout of `summarize_kpis`.
+
+        Args:
+            exclude_columns (list): KPIs not to be included
+
+        Returns:
+            summary_df (pd.DataFrame): mean, std, min, max, NaN count, count, distinct values
+        """
+        exclude_columns = set(exclude_columns or [])
+        keep = np.array([kpi not in exclude_columns for kpi in self.kpis], dtype=bool)
+        empty = self.count == 0
+
+        with np.errstate(invalid='ignore', divide='ignore'):
+            std = np.sqrt(self.m2 / (self.count - 1))
+        std[self.count < 2] = np.nan
+
+        summary_df = pd.DataFrame({
+            "KPI": self.kpis,
+            "Mean": np.where(empty, np.nan, self.mean),
+            "Std": std,
+            "Min": np.where(empty, np.nan, self.min),
+            "Max": np.where(empty, np.nan, self.max),
+            "Missing Values": self.missing,
+            "Count": self.count,
+            "Unique Values": _hll_estimate(self.registers),
+        })[keep]
+
+        summary_df.reset_index(drop=True, inplace=True)
+        summary_df.sort_values("Missing Values", ascending=False, inplace=True)
+        return summary_df
+
+    def save(self, path):
+        """Writes the accumulator to a .npz file."""
+        np.savez_compressed(
+            path, kpis=np.array(self.kpis, dtype=str), precision=self.precision, rows=self.rows,
+            count=self.count, missing=self.missing, mean=self.mean, m2=self.m2,
+            min=self.min, max=self.max, registers=self.registers
+        )
+
+    @classmethod
+    def load(cls, path):
+        """Reads an accumulator written by `save`."""
+        with np.load(path) as data:
+            stats = cls(data["kpis"].tolist(), int(data["precision"]))
+            for name in ['count', 'missing', 'mean', 'm2', 'min', 'max', 'registers']:
+                setattr(stats, name, data[name])
+            if "rows" in data:
+                stats.rows = int(data["rows"])
+            else:
+                # Written before the row count was stored: every KPI saw every row
+                stats.rows = int((stats.count + stats.missing).max()) if len(stats.kpis) else 0
+        return stats
@@ -0,0 +1,262 @@
+import os
+from datetime import date, datetime
+
+import pandas as pd
+
+from preprocessing import clean_data
+from kpi_stats import KPIStats
+from kpi_cube import KPICube
+
+# ----------- Date-partitioned KPI history store -----------
+
+STORE_DIR = os.path.join("data", "kpi_store")
+KEY_COLUMNS = ['Cell Name', 'Date']
+
+
+def _partition_path(root, technology, day):
+    return os.path.join(root, f"technology={technology}", f"date={day.isoformat()}", "part.parquet")
+
+
+def _stats_path(root, technology, day):
+    return os.path.join(root, f"technology={technology}", f"date={day.isoformat()}", "stats.npz")
+
+
+def _rollup_path(root, technology, day):
+    # File name written by KPICube.save for the ('day', 'cell') table
+    return os.path.join(root, f"technology={technology}", f"date={day.isoformat()}", "day_cell.parquet")
+
+
+def _day_rollup(day_df, site_col='eNodeB Name', cell_col='Cell Name', date_col='Date'):
+    """Cube with only the (cell, day) table of a partition (None without numeric KPI)."""
+    kpis = list(day_df.select_dtypes(include=['float', 'int']).columns)
+    if not kpis or site_col not in day_df.columns:
+        return None
+    return KPICube(day_df, kpis=kpis, site_col=site_col, cell_col=cell_col, date_col=date_col,
+                   levels=['day'], scopes=['cell'])
+
+
+def _as_day(value):
+    if isinstance(value, str):
+        return date.fromisoformat(value)
+    if isinstance(value, datetime):
+        return value.date()
+    return value
+
+
+def list_store_dates(technology="4G", root=STORE_DIR):
+    """
+    Days available in the store for a technology.
+
+    Args:
+        technology (str): e.g. "4G"
+        root (str): store directory
+
+    Returns:
+        days (list of datetime.date): sorted days
+    """
+    tech_dir = os.path.join(root, f"technology={technology}")
+    if not os.path.isdir(tech_dir):
+        return []
+
+    days = []
+    for name in os.listdir(tech_dir):
+        if name.startswith("date=") and os.path.exists(os.path.join(tech_dir, name, "part.parquet")):
+            days.append(date.fromisoformat(name[len("date="):]))
+    return sorted(days)
+
+
+def append_to_store(df, technology="4G", root=STORE_DIR, key_columns=KEY_COLUMNS):
+    """
+    Appends cleaned KPIs to the history store.
+
+    Rows are written to one Parquet partition per day. Only the partitions of the
+    days present in `df` are read and rewritten, so appending a daily export costs
+    time proportional to that day and not to the whole history. Rows are
+    deduplicated on `key_columns` (cell, timestamp); the most recent upload wins.
+    The KPI statistics and the (cell, day) rollup of each rewritten day are
+    stored next to its partition (see `summarize_store` and `load_store_cube`).
+
+    Args:
+        df (pd.DataFrame): cleaned data with a datetime64 'Date' column
+        technology (str): e.g. "4G"
+        root (str): store directory
+        key_columns (list): deduplication key
+
+    Returns:
+        n_rows (int): number of rows written in the touched partitions
+    """
+    date_col = key_columns[-1]
+    df = df.dropna(subset=[date_col])
+    n_rows = 0
+
+    for day, day_df in df.groupby(df[date_col].dt.date, sort=True):
+        path = _partition_path(root, technology, day)
+
+        if os.path.exists(path):
+            day_df = pd.concat([pd.read_parquet(path), day_df], ignore_index=True)
+
+        day_df = day_df.drop_duplicates(subset=key_columns, keep='last')
+        day_df = day_df.sort_values(date_col, kind='stable').reset_index(drop=True)
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        day_df.to_parquet(tmp_path, index=False)
+        os.replace(tmp_path, path)
+
+        stats_path = _stats_path(root, technology, day)
+        tmp_path = f"{stats_path}.{os.getpid()}.tmp.npz"
+        KPIStats.from_frame(day_df).save(tmp_path)
+        os.replace(tmp_path, stats_path)
+
+        day_cube = _day_rollup(day_df, cell_col=key_columns[0], date_col=date_col)
+        if day_cube is not None:
+            day_cube.save(os.path.dirname(path))
+
+        n_rows += len(day_df)
+
+    return n_rows
+
+
+def store_version(start=None, end=None, technology="4G", root=STORE_DIR):
+    """
+    Version tag of a date range of the store: the days and modification times
+    of their partitions. It changes whenever a partition of the range is
+    rewritten, so it can key caches of `query_store` results.
+    """
+    start, end = _as_day(start), _as_day(end)
+    parts = [
+        f"{day.isoformat()}@{os.stat(_partition_path(root, technology, day)).st_mtime_ns}"
+        for day in list_store_dates(technology, root)
+        if (start is None or day >= start) and (end is None or day <= end)
+    ]
+    return f"{technology}:" + ",".join(parts)
+
+
+def query_store(start=None, end=None, technology="4G", columns=None, sites=None, site_col='eNodeB Name', root=STORE_DIR):
+    """
+    Reads a date range from the history store without re-ingesting any export.
+
+    Only the partitions of the requested days are opened; `columns` and `sites`
+    are pushed down to the Parquet reader.
+
+    Args:
+        start (date or str): first day (inclusive), None for the beginning
+        end (date or str): last day (inclusive), None for the end
+        technology (str): e.g. "4G"
+        columns (list): columns to read (None for all)
+        sites (list): sites to keep (None for all)
+        site_col (str): site column
+        root (str): store directory
+
+    Returns:
+        df (pd.DataFrame): KPIs sorted by date
+    """
+    start, end = _as_day(start), _as_day(end)
+    days = [
+        day for day in list_store_dates(technology, root)
+        if (start is None or day >= start) and (end is None or day <= end)
+    ]
+
+    filters = [(site_col, 'in', list(sites))] if sites is not None else None
+    frames = [
+        pd.read_parquet(_partition_path(root, technology, day), columns=columns, filters=filters)
+        for day in days
+    ]
+
+    if not frames:
+        return pd.DataFrame(columns=columns)
+
+    df = pd.concat(frames, ignore_index=True)
+
+    # Each partition has its own categories: concat falls back to object
+    for col in frames[0].select_dtypes(include=['category']).columns:
+        df[col] = df[col].astype('category')
+
+    return df
+
+
+def summarize_store(start=None, end=None, technology="4G", exclude_columns=None, root=STORE_DIR):
+    """
+    Statistical summary of a date range, merged from the daily statistics.
+
+    No KPI row is read: the per-day partials written by `append_to_store` are
+    merged, so a summary over a year of history costs one small file per day.
+
+    Args:
+        start (date or str): first day (inclusive), None for the beginning
+        end (date or str): last day (inclusive), None for the end
+        technology (str): e.g. "4G"
+        exclude_columns (list): columns not to be included
+        root (str): store directory
+
+    Returns:
+        summary_df (pd.DataFrame): same layout as `summarize_kpis`
+    """
+    start, end = _as_day(start), _as_day(end)
+    stats = KPIStats()
+    for day in list_store_dates(technology, root):
+        if (start is None or day >= start) and (end is None or day <= end):
+            path = _stats_path(root, technology, day)
+            if os.path.exists(path):
+                stats.merge(KPIStats.load(path))
+            else:
+                # Partition written before the statistics were stored
+                stats.merge(KPIStats.from_frame(pd.read_parquet(_partition_path(root, technology, day))))
+
+    return stats.summary(exclude_columns)
+
+
+def load_store_cube(start=None, end=None, technology="4G", root=STORE_DIR):
+    """
+    Daily rollup per cell of a date range, read from the per-day rollups.
+
+    No KPI row is read: the (cell, day) tables written by `append_to_store` are
+    loaded with `KPICube.load` and stacked. Partitions written before the
+    rollups were stored are rolled up from their rows.
+
+    Args:
+        start (date or str): first day (inclusive), None for the beginning
+        end (date or str): last day (inclusive), None for the end
+        technology (str): e.g. "4G"
+        root (str): store directory
+
+    Returns:
+        cube (KPICube): cube with the ('day', 'cell') table only
+    """
+    start, end = _as_day(start), _as_day(end)
+    tables = []
+    for day in list_store_dates(technology, root):
+        if (start is None or day >= start) and (end is None or day <= end):
+            if os.path.exists(_rollup_path(root, technology, day)):
+                day_cube = KPICube.load(os.path.dirname(_rollup_path(root, technology, day)))
+            else:
+                day_cube = _day_rollup(pd.read_parquet(_partition_path(root, technology, day)))
+            if day_cube is not None:
+                tables.append(day_cube.table('day', 'cell'))
+
+    cube = KPICube(levels=['day'], scopes=['cell'])
+    if tables:
+        # Days are disjoint: the tables are stacked, not merged
+        table = pd.concat(tables).sort_index()
+        cube.tables[('day', 'cell')] = table
+        cube.kpis = list(table['sum'].columns.unique())
+    return cube
+
+
+def ingest_export(raw_df, technology="4G", root=STORE_DIR):
+    """
+    Cleans a raw OSS export and appends it to the history store.
+
+    The full-row `drop_duplicates` of the cleaning is skipped: the store
+    deduplicates on (cell, timestamp) instead.
+
+    Args:
+        raw_df (pd.DataFrame): export as read from the Excel file
+        technology (str): e.g. "4G"
+        root (str): store directory
+
+    Returns:
+        n_rows (int): number of rows written in the touched partitions
+    """
+    df = clean_data(raw_df, deduplicate=False, compact=True)
+    return append_to_store(df, technology=technology, root=root)
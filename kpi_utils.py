@@ -1,6 +1,9 @@
+import hashlib
+from collections import OrderedDict
+
 import pandas as pd
-import matplotlib.pyplot as plt
-import seaborn as sns
+import numpy as np
+
 def get_kpi_info(kpi_name):
 
     kpi_definitions = {
@@ -133,26 +136,211 @@ kpis_4G = [
     'Average RSRP Reported(dBm)'
 ]
 
-df_4G = pd.read_excel('data/cleaned_kpis.xlsx', sheet_name='4G_KPIs')
-
-corr_matrix = df_4G[kpis_4G].corr(method='pearson')
-
-plt.figure(figsize=(14, 10))
-sns.heatmap(
-    corr_matrix,
-    annot=True,
-    fmt=".2f",
-    cmap="coolwarm",
-    center=0,
-    linewidths=0.5,
-    cbar_kws={'label': 'Corrélation'}
-)
-plt.title("Matrice de Corrélation des KPIs 4G", fontsize=14)
-plt.xticks(rotation=45, ha='right')
-plt.tight_layout()
-plt.savefig('plots/heatmap_4G.png')
+# ----------- Correlation -----------
+
+CORRELATION_METHODS = ['pearson', 'spearman']
+CORR_CACHE_SIZE = 32
+_corr_cache = OrderedDict()
+
+
+def default_kpis(df):
+    """KPIs of `kpis_4G` present in df, or every numeric column if none is."""
+    kpis = [kpi for kpi in kpis_4G if kpi in df.columns]
+    return kpis or df.select_dtypes('number').columns.tolist()
+
+
+def _kpi_matrix(df, kpis):
+    """Float matrix of the KPIs (non-numeric values become NaN)."""
+    X = np.empty((len(df), len(kpis)))
+    for j, kpi in enumerate(kpis):
+        X[:, j] = pd.to_numeric(df[kpi], errors='coerce').to_numpy(dtype=np.float64)
+    return X
+
+
+def _pairwise_corr(X, min_periods=2):
+    """
+    Correlation of every pair of columns over the rows where both are present.
+
+    All the pairwise sums come from a few matrix products on the zero-filled
+    matrix and its validity mask, so the k x k matrix costs one pass over the
+    data instead of one masked copy per pair.
+    """
+    valid = ~np.isnan(X)
+    M = valid.astype(np.float64)
+    # Centring on the column means keeps the sums of squares well conditioned
+    counts = M.sum(axis=0)
+    means = np.where(valid, X, 0.0).sum(axis=0) / np.maximum(counts, 1)
+    Z = np.where(valid, X - means, 0.0)
+
+    n = M.T @ M                 # n[i, j]: rows where i and j are both present
+    sx = Z.T @ M                # sx[i, j]: sum of column i over those rows
+    sxx = (Z * Z).T @ M         # sxx[i, j]: sum of squares of column i over those rows
+    sxy = Z.T @ Z               # sxy[i, j]: sum of products
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        cov = sxy - sx * sx.T / n
+        var_i = sxx - sx * sx / n
+        corr = cov / np.sqrt(var_i * var_i.T)
+    corr[n < min_periods] = np.nan
+    return np.clip(corr, -1.0, 1.0)
+
+
+def _spearman_corr(X, min_periods=2):
+    """
+    Spearman correlation of every pair of columns, ranked over the rows where both are present.
+
+    As in `DataFrame.corr('spearman')`, a pair is ranked on its own common rows.
+    Columns with the same missing-value pattern share those rows, so the
+    columns of two patterns are ranked together once and correlated with one
+    matrix product: the cost grows with the number of patterns, which is 1
+    for complete data.
+    """
+    valid = ~np.isnan(X)
+    patterns, labels = np.unique(valid, axis=1, return_inverse=True)
+    labels = labels.ravel()
+    corr = np.full((X.shape[1], X.shape[1]), np.nan)
+
+    for a in range(patterns.shape[1]):
+        for b in range(a, patterns.shape[1]):
+            rows = patterns[:, a] & patterns[:, b]
+            if rows.sum() < min_periods:
+                continue
+            cols_a, cols_b = np.flatnonzero(labels == a), np.flatnonzero(labels == b)
+            cols = np.concatenate([cols_a, cols_b]) if a != b else cols_a
+            ranks = pd.DataFrame(X[np.ix_(rows, cols)]).rank(method='average').to_numpy()
+            ranks -= ranks.mean(axis=0)
+            cov = ranks.T @ ranks
+            with np.errstate(invalid='ignore', divide='ignore'):
+                block = cov / np.sqrt(np.outer(np.diag(cov), np.diag(cov)))
+            # Only the pairs whose common rows are exactly these ones
+            block = block[:len(cols_a), len(cols) - len(cols_b):]
+            corr[np.ix_(cols_a, cols_b)] = block
+            corr[np.ix_(cols_b, cols_a)] = block.T
+    return np.clip(corr, -1.0, 1.0)
+
+
+def _correlation(X, method, min_periods):
+    if method == 'spearman':
+        return _spearman_corr(X, min_periods)
+    return _pairwise_corr(X, min_periods)
+
+
+def _data_key(df, columns):
+    """Content hash of the columns used (memoization key)."""
+    hashes = pd.util.hash_pandas_object(df[columns], index=False).to_numpy()
+    return hashlib.sha256(hashes.tobytes() + "|".join(map(str, columns)).encode()).hexdigest()
+
+
+def _memoized(key, compute):
+    if key in _corr_cache:
+        _corr_cache.move_to_end(key)
+        return _corr_cache[key].copy()
+    result = compute()
+    _corr_cache[key] = result
+    if len(_corr_cache) > CORR_CACHE_SIZE:
+        _corr_cache.popitem(last=False)
+    return result.copy()
+
+
+def kpi_correlation(df, kpis=None, method='pearson', min_periods=2):
+    """
+    Correlation matrix of KPIs with pairwise handling of missing values.
+
+    Same result as `df[kpis].corr(method)`: every pair uses the rows where both
+    KPIs are present (Spearman ranks them on those rows). Results are memoized
+    on the content of the data.
+
+    Args:
+        df (pd.DataFrame): cleaned data
+        kpis (list): KPI columns (default: the `kpis_4G` present in df)
+        method (str): 'pearson' or 'spearman'
+        min_periods (int): minimum number of common rows for a pair
+
+    Returns:
+        corr (pd.DataFrame): kpis x kpis correlation matrix
+    """
+    if method not in CORRELATION_METHODS:
+        raise ValueError(f"Méthode de corrélation inconnue : {method}")
+    kpis = list(kpis) if kpis is not None else default_kpis(df)
+
+    def compute():
+        corr = _correlation(_kpi_matrix(df, kpis), method, min_periods)
+        return pd.DataFrame(corr, index=kpis, columns=kpis)
+
+    return _memoized((_data_key(df, kpis), method, min_periods, None, None), compute)
+
+
+def kpi_correlation_by(df, by=None, freq=None, kpis=None, method='pearson', min_periods=2, date_col='Date'):
+    """
+    One correlation matrix per site and/or per time window.
+
+    Args:
+        df (pd.DataFrame): cleaned data
+        by (str): grouping column, e.g. 'eNodeB Name' (optional)
+        freq (str): time window, e.g. 'D' or 'W-MON' (optional)
+        kpis (list): KPI columns (default: the `kpis_4G` present in df)
+        method (str): 'pearson' or 'spearman'
+        min_periods (int): minimum number of common rows for a pair
+        date_col (str): date column used by `freq`
+
+    Returns:
+        corr (pd.DataFrame): stacked matrices, indexed by (group..., KPI)
+    """
+    if method not in CORRELATION_METHODS:
+        raise ValueError(f"Méthode de corrélation inconnue : {method}")
+    if by is None and freq is None:
+        raise ValueError("Préciser un regroupement (by) et/ou une fenêtre (freq).")
+    kpis = list(kpis) if kpis is not None else default_kpis(df)
+    key_columns = kpis + [col for col in [by, date_col if freq else None] if col]
+
+    def compute():
+        keys = []
+        if by is not None:
+            keys.append(df[by])
+        if freq is not None:
+            keys.append(pd.to_datetime(df[date_col]).dt.to_period(freq).dt.start_time.rename(date_col))
+        X = _kpi_matrix(df, kpis)
+
+        frames, names = [], []
+        for name, rows in df.groupby(keys, sort=True, observed=True).indices.items():
+            frames.append(pd.DataFrame(_correlation(X[rows], method, min_periods), index=kpis, columns=kpis))
+            names.append(name)
+        if not frames:
+            return pd.DataFrame(columns=kpis)
+        return pd.concat(frames, keys=names, names=[key.name for key in keys] + ['KPI'])
+
+    return _memoized((_data_key(df, key_columns), method, min_periods, by, freq), compute)
+
+
+def save_correlation_heatmap(corr, path, title="Matrice de Corrélation des KPIs 4G"):
+    """Saves an annotated heatmap of a correlation matrix (seaborn, imported on use)."""
+    import matplotlib.pyplot as plt
+    import seaborn as sns
+
+    plt.figure(figsize=(14, 10))
+    sns.heatmap(
+        corr,
+        annot=True,
+        fmt=".2f",
+        cmap="coolwarm",
+        center=0,
+        linewidths=0.5,
+        cbar_kws={'label': 'Corrélation'}
+    )
+    plt.title(title, fontsize=14)
+    plt.xticks(rotation=45, ha='right')
+    plt.tight_layout()
+    plt.savefig(path)
+    plt.close()
+
 
 # Liste des KPIs à afficher ensemble 
 
 ['RRC Setup Fail', 'RRC_Succes_Rate']
-['DL User throughput', 'DL User throughput']
\ No newline at end of file
+['DL User throughput', 'DL User throughput']
+
+
+if __name__ == "__main__":
+    df_4G = pd.read_excel('data/cleaned_kpis.xlsx', sheet_name='4G_KPIs')
+    corr_matrix = kpi_correlation(df_4G, kpis_4G, method='pearson')
+    save_correlation_heatmap(corr_matrix, 'plots/heatmap_4G.png')
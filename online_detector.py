@@ -0,0 +1,190 @@
+import os
+
+import pandas as pd
+import numpy as np
+
+from anomaly_detector import load_threshold_config, normalize_direction
+from utils import labels_from_array, labels_to_array
+
+# ----------- Online (streaming) detection -----------
+
+CHECKPOINT_FILE = os.path.join(".cache", "online_detector.npz")
+
+
+class OnlineDetector:
+    """
+    Stateful detector for 15-minute feeds, fed with micro-batches as they arrive.
+
+    For every (cell, KPI) only an EWMA mean, an EWMA variance, a sample count and
+    the last processed timestamp of the cell are kept, so each new sample costs
+    O(1) and no history is re-read. A sample is flagged when:
+      - it breaks its rule of threshold_config.json (same semantics as
+        `detect_threshold_anomalies`), or
+      - it deviates from the EWMA by more than `z_threshold` standard deviations;
+        for KPIs of the config only in the direction of the rule (above for
+        "Maximum à ne pas dépasser", below for "Minimum à respecter").
+
+    Args:
+        kpis (list): KPI columns to follow
+        config (dict): output of `load_threshold_config()` (default: read from file)
+        alpha (float): EWMA smoothing factor
+        z_threshold (float): deviation threshold, in EWMA standard deviations
+        warmup (int): samples of a cell before the EWMA test is applied
+        cell_col (str): cell column
+        date_col (str): date column
+        site_col (str): site column (copied to the anomaly table)
+    """
+
+    def __init__(self, kpis, config=None, alpha=0.1, z_threshold=4.0, warmup=8,
+                 cell_col='Cell Name', date_col='Date', site_col='eNodeB Name'):
+        self.kpis = list(kpis)
+        self.alpha = alpha
+        self.z_threshold = z_threshold
+        self.warmup = warmup
+        self.cell_col = cell_col
+        self.date_col = date_col
+        self.site_col = site_col
+        self.set_config(load_threshold_config() if config is None else config)
+
+        k = len(self.kpis)
+        self.cells = pd.Index([], dtype=object)
+        self.mean = np.zeros((0, k))
+        self.var = np.zeros((0, k))
+        self.count = np.zeros((0, k), dtype=np.int64)
+        self.last_seen = np.zeros(0, dtype='datetime64[ns]')
+
+    def set_config(self, config):
+        """Reloads the threshold rules (e.g. after an edit in the dashboard)."""
+        rules = [config.get(kpi, {}) for kpi in self.kpis]
+        self.thresholds = np.array([float(rule.get("threshold") or np.nan) for rule in rules])
+        directions = [normalize_direction(rule.get("direction")) for rule in rules]
+        self.is_max = np.array([direction == "max" for direction in directions], dtype=bool)
+        self.is_min = np.array([direction == "min" for direction in directions], dtype=bool)
+        self.thresholds[~(self.is_max | self.is_min)] = np.nan
+
+    def _rows(self, cells):
+        """State rows of the cells of a batch; unknown cells get a fresh state."""
+        new_cells = pd.Index(pd.unique(cells)).difference(self.cells)
+        if len(new_cells):
+            k = len(self.kpis)
+            self.cells = self.cells.append(new_cells.astype(object))
+            self.mean = np.vstack([self.mean, np.zeros((len(new_cells), k))])
+            self.var = np.vstack([self.var, np.zeros((len(new_cells), k))])
+            self.count = np.vstack([self.count, np.zeros((len(new_cells), k), dtype=np.int64)])
+            self.last_seen = np.concatenate([self.last_seen, np.full(len(new_cells), np.datetime64('NaT'), dtype='datetime64[ns]')])
+        return self.cells.get_indexer(cells)
+
+    def _step(self, batch):
+        """Tests then learns one interval (each cell at most once)."""
+        rows = self._rows(batch[self.cell_col].to_numpy())
+        X = batch[self.kpis].apply(pd.to_numeric, errors='coerce').to_numpy(dtype=np.float64)
+        mean, var, count = self.mean[rows], self.var[rows], self.count[rows]
+        valid = ~np.isnan(X)
+
+        with np.errstate(invalid='ignore', divide='ignore'):
+            z = (X - mean) / np.sqrt(var)
+            z[~np.isfinite(z)] = 0.0
+            breach = np.where(self.is_max, X > self.thresholds, X < self.thresholds)
+        ready = valid & (count >= self.warmup)
+        deviation = np.where(self.is_max, z > self.z_threshold,
+                             np.where(self.is_min, z < -self.z_threshold, np.abs(z) > self.z_threshold))
+
+        # EWMA update (first sample of a cell initialises the mean)
+        delta = X - mean
+        first = valid & (count == 0)
+        new_mean = np.where(first, X, np.where(valid, mean + self.alpha * delta, mean))
+        new_var = np.where(first, 0.0, np.where(valid, (1 - self.alpha) * (var + self.alpha * delta * delta), var))
+        self.mean[rows] = new_mean
+        self.var[rows] = new_var
+        self.count[rows] = count + valid
+        self.last_seen[rows] = batch[self.date_col].to_numpy(dtype='datetime64[ns]')
+
+        return breach & valid, deviation & ready, X, mean, z
+
+    def process(self, batch):
+        """
+        Consumes a micro-batch of cleaned rows and returns its anomalies.
+
+        Rows already processed (date not after the last date seen for their
+        cell) are skipped, so replaying a batch after a restart is harmless.
+
+        Args:
+            batch (pd.DataFrame): new intervals (one or more timestamps)
+
+        Returns:
+            anomalies (pd.DataFrame): one row per anomaly with date, site, cell,
+                'KPI', 'Value', 'Method' ("Seuil" or "EWMA"), 'Reference'
+                (threshold or EWMA mean) and 'Score' (deviation in std)
+        """
+        id_columns = [col for col in [self.date_col, self.site_col, self.cell_col] if col in batch.columns]
+        batch = batch.dropna(subset=[self.date_col, self.cell_col])
+        batch = batch.drop_duplicates(subset=[self.cell_col, self.date_col], keep='last')
+
+        rows = self._rows(batch[self.cell_col].to_numpy())
+        dates = batch[self.date_col].to_numpy(dtype='datetime64[ns]')
+        last = self.last_seen[rows]
+        batch = batch[np.isnat(last) | (dates > last)]
+        batch = batch.sort_values(self.date_col, kind='stable')
+
+        frames = []
+        for _, step_df in batch.groupby(self.date_col, sort=True):
+            breach, deviation, X, mean, z = self._step(step_df)
+            for method, mask, reference, score in [
+                ("Seuil", breach, np.broadcast_to(self.thresholds, X.shape), np.full(X.shape, np.nan)),
+                ("EWMA", deviation, mean, z),
+            ]:
+                hit_rows, hit_cols = np.nonzero(mask)
+                if not len(hit_rows):
+                    continue
+                found = step_df[id_columns].take(hit_rows).reset_index(drop=True)
+                found["KPI"] = [self.kpis[col] for col in hit_cols]
+                found["Value"] = X[hit_rows, hit_cols]
+                found["Method"] = method
+                found["Reference"] = reference[hit_rows, hit_cols]
+                found["Score"] = score[hit_rows, hit_cols]
+                frames.append(found)
+
+        if not frames:
+            return batch[id_columns].iloc[:0].reset_index(drop=True).assign(
+                KPI=pd.Series(dtype=object), Value=pd.Series(dtype=np.float64), Method=pd.Series(dtype=object),
+                Reference=pd.Series(dtype=np.float64), Score=pd.Series(dtype=np.float64)
+            )
+        return pd.concat(frames, ignore_index=True)
+
+    def save(self, path=CHECKPOINT_FILE):
+        """Checkpoints the state to disk (atomic replace); cell labels keep their type."""
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp.npz"
+        np.savez_compressed(
+            tmp_path,
+            kpis=np.array(self.kpis, dtype=str), cells=labels_to_array(self.cells),
+            mean=self.mean, var=self.var, count=self.count, last_seen=self.last_seen,
+            params=np.array([self.alpha, self.z_threshold, self.warmup]),
+            columns=np.array([self.cell_col, self.date_col, self.site_col], dtype=str),
+        )
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path=CHECKPOINT_FILE, config=None):
+        """Restores a detector from its checkpoint."""
+        with np.load(path, allow_pickle=True) as data:
+            alpha, z_threshold, warmup = data["params"]
+            cell_col, date_col, site_col = data["columns"].tolist()
+            detector = cls(data["kpis"].tolist(), config=config, alpha=float(alpha), z_threshold=float(z_threshold),
+                           warmup=int(warmup), cell_col=cell_col, date_col=date_col, site_col=site_col)
+            detector.cells = labels_from_array(data["cells"])
+            detector.mean = data["mean"]
+            detector.var = data["var"]
+            detector.count = data["count"]
+            detector.last_seen = data["last_seen"]
+        return detector
+
+
+"""
+Usage (every 15 minutes, on the new export) :
+    detector = OnlineDetector.load() if os.path.exists(CHECKPOINT_FILE) else OnlineDetector(kpis)
+    anomalies = detector.process(clean_data(pd.read_excel(new_export)))
+    detector.save()
+"""
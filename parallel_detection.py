@@ -0,0 +1,201 @@
+import os
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+import numpy as np
+
+from anomaly_detector import (
+    MODEL_DIR, ROLLING_WINDOW, check_site_models, load_site_model, moving_average_mask, rolling_zscore_mask, threshold_rules
+)
+
+# ----------- Parallel detection by site -----------
+
+DETECTORS = ['threshold', 'zscore', 'moving_average']
+METHODS = ["Seuil", "Z-score", "Moving Average", "Isolation Forest"]
+TASKS_PER_WORKER = 4  # smaller tasks balance sites of different sizes
+
+
+def _shared_dir():
+    """Memory-backed directory for the shared arrays when available."""
+    return "/dev/shm" if os.path.isdir("/dev/shm") else None
+
+
+def _partition(site_bounds, n_tasks):
+    """Groups consecutive sites into about `n_tasks` tasks of similar row counts."""
+    n_rows = site_bounds[-1][2] if site_bounds else 0
+    target = max(n_rows / max(n_tasks, 1), 1)
+
+    tasks, current = [], []
+    for site, start, stop in site_bounds:
+        current.append((site, start, stop))
+        if stop - current[0][1] >= target:
+            tasks.append(current)
+            current = []
+    if current:
+        tasks.append(current)
+    return tasks
+
+
+def _detect_sites(paths, sites, params):
+    """
+    Worker: runs the detectors on a block of consecutive sites.
+
+    The KPI matrix, cell codes and dates are opened as read-only memory maps;
+    only the slice of the block is paged in. Returns the anomalies as arrays of
+    (global row, KPI index, method index, value, score).
+    """
+    start, stop = sites[0][1], sites[-1][2]
+    values = np.load(paths["values"], mmap_mode='r')[start:stop]
+    codes = np.load(paths["codes"], mmap_mode='r')[start:stop]
+    dates = np.load(paths["dates"], mmap_mode='r')[start:stop]
+
+    rows, cols, methods, hits, scores = [], [], [], [], []
+
+    def collect(mask, kpi_index, method, score):
+        found = np.flatnonzero(mask)
+        rows.append(found + start)
+        cols.append(np.full(len(found), kpi_index))
+        methods.append(np.full(len(found), METHODS.index(method)))
+        hits.append(values[found, kpi_index] if kpi_index >= 0 else np.full(len(found), np.nan))
+        scores.append(score[found])
+
+    for j in range(values.shape[1]):
+        column = np.asarray(values[:, j])
+
+        if 'threshold' in params["detectors"] and not np.isnan(params["thresholds"][j]):
+            with np.errstate(invalid='ignore'):
+                if params["is_max"][j]:
+                    mask = column > params["thresholds"][j]
+                else:
+                    mask = column < params["thresholds"][j]
+            collect(mask, j, "Seuil", np.full(len(column), np.nan))
+
+        if 'zscore' in params["detectors"]:
+            mask, z_scores = rolling_zscore_mask(column, codes, dates, params["zscore_threshold"], params["zscore_window"])
+            collect(mask, j, "Z-score", z_scores)
+
+        if 'moving_average' in params["detectors"]:
+            mask, deviations = moving_average_mask(column, codes, dates, params["moving_avg_thresh"], params["moving_avg_window"])
+            collect(mask, j, "Moving Average", deviations)
+
+    if 'isolation_forest' in params["detectors"]:
+        for site, site_start, site_stop in sites:
+            bundle = load_site_model(site, params["kpis"], params["window"], params["model_dir"])
+            if bundle is None:
+                continue
+            X = np.asarray(values[site_start - start:site_stop - start])
+            X = np.where(np.isnan(X), bundle["medians"], X)
+            site_scores = bundle["model"].score_samples(X)
+            mask = np.zeros(stop - start, dtype=bool)
+            score = np.full(stop - start, np.nan)
+            mask[site_start - start:site_stop - start] = site_scores < bundle["model"].offset_
+            score[site_start - start:site_stop - start] = site_scores
+            collect(mask, -1, "Isolation Forest", score)
+
+    if not rows:
+        empty = np.array([], dtype=np.int64)
+        return empty, empty, empty, np.array([]), np.array([])
+    return (np.concatenate(rows), np.concatenate(cols), np.concatenate(methods),
+            np.concatenate(hits), np.concatenate(scores))
+
+
+def detect_anomalies_parallel(df, config=None, kpis=None, detectors=DETECTORS, n_jobs=None,
+                              site_col='eNodeB Name', cell_col='Cell Name', date_col='Date',
+                              zscore_threshold=3.0, zscore_window=ROLLING_WINDOW,
+                              moving_avg_thresh=2.0, moving_avg_window=5,
+                              window=None, model_dir=MODEL_DIR):
+    """
+    Runs several detectors over the whole network on all cores, partitioned by site.
+
+    Rows are ordered by site, cell and date once; the KPI matrix, the cell codes
+    and the dates are written to memory-mapped .npy files (in /dev/shm when
+    available) that the worker processes open read-only, so no DataFrame is
+    pickled. Each task covers consecutive whole sites and returns its anomalies
+    as arrays, merged here into one table.
+
+    Args:
+        df (pd.DataFrame): cleaned data of the whole network
+        config (dict): output of `load_threshold_config()` (needed by 'threshold')
+        kpis (list): KPI columns (default: the KPIs of config)
+        detectors (list): among 'threshold', 'zscore', 'moving_average', 'isolation_forest'
+        n_jobs (int): number of worker processes (default: number of CPUs)
+        site_col, cell_col, date_col (str): column names
+        zscore_threshold, zscore_window: see `detect_rolling_zscore_anomalies`
+        moving_avg_thresh, moving_avg_window: see `detect_moving_average_anomalies`
+        window, model_dir: Isolation Forest models of `train_isolation_forests`
+            (sites without a model are reported by `check_site_models`)
+
+    Returns:
+        anomalies (pd.DataFrame): one row per anomaly with date, site, cell,
+            'KPI' (empty for Isolation Forest), 'Method', 'Value' and 'Score'
+    """
+    config = config or {}
+    if kpis is None:
+        kpis = [kpi for kpi in config if kpi in df.columns]
+    kpis = list(kpis)
+
+    if 'isolation_forest' in detectors and window is None:
+        raise ValueError("Fenêtre d'entraînement requise pour l'Isolation Forest (voir train_isolation_forests).")
+
+    rule_kpis, rule_thresholds, rule_is_max = threshold_rules(config, kpis)
+    thresholds = np.full(len(kpis), np.nan)
+    is_max = np.zeros(len(kpis), dtype=bool)
+    for kpi, threshold, maximum in zip(rule_kpis, rule_thresholds, rule_is_max):
+        thresholds[kpis.index(kpi)] = threshold
+        is_max[kpis.index(kpi)] = maximum
+
+    # Site, cell, date order: every site is one contiguous block
+    site_codes, sites = pd.factorize(df[site_col])
+    cell_codes = pd.factorize(df[cell_col])[0]
+    dates = pd.to_datetime(df[date_col]).to_numpy(dtype='datetime64[ns]').view(np.int64)
+    order = np.lexsort((dates, cell_codes, site_codes))
+    order = order[site_codes[order] >= 0]
+    sorted_sites = site_codes[order]
+    bounds = np.flatnonzero(np.r_[True, sorted_sites[1:] != sorted_sites[:-1], True]) if len(order) else np.array([0])
+    site_bounds = [(sites[sorted_sites[a]], int(a), int(b)) for a, b in zip(bounds[:-1], bounds[1:])]
+
+    params = {
+        "detectors": list(detectors), "kpis": kpis, "thresholds": thresholds, "is_max": is_max,
+        "zscore_threshold": zscore_threshold, "zscore_window": zscore_window,
+        "moving_avg_thresh": moving_avg_thresh, "moving_avg_window": moving_avg_window,
+        "window": window, "model_dir": model_dir,
+    }
+    if 'isolation_forest' in detectors:
+        check_site_models([site for site, _, _ in site_bounds], kpis, window, model_dir)
+
+    n_jobs = n_jobs or os.cpu_count() or 1
+    tasks = _partition(site_bounds, n_jobs * TASKS_PER_WORKER)
+
+    with tempfile.TemporaryDirectory(dir=_shared_dir(), prefix="kpi-detect-") as tmp_dir:
+        paths = {name: os.path.join(tmp_dir, f"{name}.npy") for name in ["values", "codes", "dates"]}
+
+        # Written column block by column block to bound the temporary memory
+        values = np.lib.format.open_memmap(paths["values"], mode='w+', dtype=np.float64, shape=(len(order), len(kpis)))
+        for j, kpi in enumerate(kpis):
+            values[:, j] = pd.to_numeric(df[kpi], errors='coerce').to_numpy(dtype=np.float64)[order]
+        values.flush()
+        del values
+        np.save(paths["codes"], cell_codes[order])
+        np.save(paths["dates"], dates[order])
+
+        if n_jobs == 1 or len(tasks) <= 1:
+            results = [_detect_sites(paths, task, params) for task in tasks]
+        else:
+            with ProcessPoolExecutor(max_workers=n_jobs) as pool:
+                results = list(pool.map(_detect_sites, [paths] * len(tasks), tasks, [params] * len(tasks)))
+
+    empty = np.array([], dtype=np.int64)
+    rows, cols, methods, hits, scores = (
+        np.concatenate([result[i] for result in results] or [empty]) for i in range(5)
+    )
+    rank = np.lexsort((methods, cols, rows))
+    rows, cols, methods, hits, scores = rows[rank], cols[rank], methods[rank], hits[rank], scores[rank]
+
+    id_columns = [col for col in [date_col, site_col, cell_col] if col in df.columns]
+    anomalies = df[id_columns].take(order[rows]).reset_index(drop=True)
+    anomalies["KPI"] = pd.Categorical.from_codes(cols.astype(np.int64), categories=kpis)
+    anomalies["Method"] = pd.Categorical.from_codes(methods.astype(np.int64), categories=METHODS)
+    anomalies["Value"] = hits.astype(np.float64)
+    anomalies["Score"] = scores.astype(np.float64)
+    return anomalies
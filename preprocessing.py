@@ -1,163 +1,384 @@
+from collections import OrderedDict
+
 import pandas as pd
 import numpy as np
 import matplotlib.pyplot as plt
 
+from kpi_stats import KPIStats
+
+# Bump whenever the cleaning rules change so that cached cleaned files are rebuilt
+CLEANING_VERSION = "3"
+
+# ----------- Export formats -----------
+
+# Registry of the OSS export templates, tried in order. Each entry declares:
+# - required_columns: columns that identify the template
+# - identifier_columns: non-numeric columns (excluded from the numeric "/0" filter)
+# - date_column: timestamp column of the raw export, parsed once to datetime64
+# - renames: column renames applied after cleaning
+# - reset_index / verbose: options of the cleaning engine
+EXPORT_FORMATS = {
+    "4G cell": {  # Nettoyage classique
+        "required_columns": ['eNodeB Name', 'Cell Name', 'LocalCell Id'],
+        "identifier_columns": ['Date', 'eNodeB Name', 'eNodeB Function Name', 'Cell Name', 'Cell FDD TDD Indication'],
+        "date_column": 'Date',
+        "renames": {},
+        "reset_index": True,
+        "verbose": True,
+    },
+    "Stade": {  # Nouveau format détecté (ex: Stade)
+        "required_columns": ['Time', 'Game time', 'Sector'],
+        "identifier_columns": ['Time', 'Game time', 'eNodeB Name', 'Cell Name', 'Cell FDD TDD Indication', 'sector', 'Beam', 'LocalCell Id', 'eNodeB Function Name', 'Frequency band', 'LTECell Tx and Rx Mode', 'eNodeB identity'],
+        "date_column": 'Time',
+        "renames": {'Time': 'Date'},
+        "reset_index": False,
+        "verbose": False,
+    },
+}
+
+# Cleaning plans already computed, by schema fingerprint (least recently used evicted first)
+PLAN_CACHE_SIZE = 64
+_PLAN_CACHE = OrderedDict()
+
+
+def register_export_format(name, required_columns, identifier_columns, date_column, renames=None, reset_index=False, verbose=False):
+    """
+    Adds (or replaces) an OSS export template in the registry.
 
-def clean_data(df):
+    Args:
+        name (str): name of the template
+        required_columns (list): columns that identify the template
+        identifier_columns (list): non-numeric columns
+        date_column (str): timestamp column of the raw export
+        renames (dict): column renames applied after cleaning
+        reset_index (bool): renumber the rows of the cleaned frame
+        verbose (bool): print the columns that could not be converted to numeric
     """
-    Route to the correct cleaning function based on the detected columns.
+    EXPORT_FORMATS[name] = {
+        "required_columns": list(required_columns),
+        "identifier_columns": list(identifier_columns),
+        "date_column": date_column,
+        "renames": dict(renames or {}),
+        "reset_index": reset_index,
+        "verbose": verbose,
+    }
+    _PLAN_CACHE.clear()
+
+
+def schema_fingerprint(columns):
     """
-    columns = df.columns
+    Fingerprint of the column set of an export (independent of the column order).
 
-    if 'eNodeB Name' in columns and 'Cell Name' in columns and 'LocalCell Id' in columns:
-        return clean_data1(df)  # Nettoyage classique
-    elif 'Time' in columns and 'Game time' in columns and 'Sector' in columns:
-        return clean_data2(df)  # Nouveau format détecté (ex: Stade)
-    else:
-        raise ValueError("Structure du fichier non reconnue. Ajoutez une nouvelle fonction de nettoyage.")
+    Args:
+        columns (iterable): column names
 
-# ----------- Data cleaning 1-----------
+    Returns:
+        fingerprint (frozenset)
+    """
+    return frozenset(columns)
 
-def clean_data1(df):
+
+def get_cleaning_plan(columns, format_name=None):
     """
-    - Applies a basic cleanup to the DataFrame
-    - Removes duplicates
-    - Keeps rows and columns with at least 1 non-zero value
-    - Replaces decimal commas with periods
-    - Deletes % symbols
-    - Converts object columns to float if possible
-    - Removes rows with "/0" values in numeric columns
+    Detects the export format of a column set and returns its cleaning plan.
+
+    Plans are cached by schema fingerprint, so detection runs once per template
+    and not on every file (or every batch in streaming mode). Plans hold no
+    state learnt from the data: the cleaned output never depends on the files
+    cleaned before.
 
     Args:
-        df (pd.DataFrame)
+        columns (iterable): column names of the raw export
+        format_name (str): force a format instead of detecting it
 
     Returns:
-        df_clean (pd.DataFrame)
+        plan (dict): format name, identifier columns, date column and options
+    """
+    fingerprint = schema_fingerprint(columns)
+    key = (fingerprint, format_name)
+    if key in _PLAN_CACHE:
+        _PLAN_CACHE.move_to_end(key)
+        return _PLAN_CACHE[key]
+
+    if format_name is None:
+        for name, export_format in EXPORT_FORMATS.items():
+            if all(col in fingerprint for col in export_format["required_columns"]):
+                format_name = name
+                break
+        else:
+            raise ValueError("Structure du fichier non reconnue. Ajoutez un nouveau format avec register_export_format.")
+
+    export_format = EXPORT_FORMATS[format_name]
+    plan = {
+        "format": format_name,
+        "identifier_columns": frozenset(export_format["identifier_columns"]),
+        "raw_date_column": export_format["date_column"],
+        "date_column": export_format["renames"].get(export_format["date_column"], export_format["date_column"]),
+        "renames": export_format["renames"],
+        "reset_index": export_format["reset_index"],
+        "verbose": export_format["verbose"],
+    }
+    _PLAN_CACHE[key] = plan
+    if len(_PLAN_CACHE) > PLAN_CACHE_SIZE:
+        _PLAN_CACHE.popitem(last=False)
+
+    return plan
+
+
+def clean_data(df, format_name=None, compact=False, deduplicate=True):
     """
-    df_clean = df.copy()
+    Route to the correct cleaning plan based on the detected columns.
 
-    # Deleting duplicates
-    df_clean = df_clean.drop_duplicates()
+    With `compact=True` the cleaned frame is converted with `compact_frame`.
+    With `deduplicate=False` the full-row duplicates are kept (the history store
+    deduplicates on (cell, timestamp) instead).
+    """
+    plan = get_cleaning_plan(df.columns, format_name)
 
-    # Delete rows and columns if all values are missing
-    df_clean = df_clean.dropna(axis='columns', how='all')
+    df_clean = clean_frame(df, plan["identifier_columns"], date_column=plan["raw_date_column"], reset_index=plan["reset_index"], verbose=plan["verbose"], deduplicate=deduplicate)
 
-    # First identify which columns should be numeric (exclude obvious non-numeric columns)
-    non_numeric_cols = ['Date', 'eNodeB Name', 'eNodeB Function Name', 'Cell Name', 'Cell FDD TDD Indication']
-    numeric_cols = [col for col in df_clean.columns if col not in non_numeric_cols]
-
-    # Remove rows with "/0" in numeric columns before conversion
-    for col in numeric_cols:
-        if df_clean[col].dtype == 'object':
-            # Remove rows with "/0"
-            mask = df_clean[col].astype(str).str.contains('/0', regex=False)
-            df_clean = df_clean[~mask]
-
-    for col in df_clean.columns :
-        if df_clean[col].dtype == 'object':
-            
-            # Replacing decimal commas with periods and deleting %
-            df_clean[col] = (
-                df_clean[col]
-                .astype(str)
-                .str.replace(',', '.', regex=False)
-                .str.replace('%', '', regex=False)
-                .str.replace(' ', '', regex=False)
-                .replace('', np.nan)
-            )
-
-            # Converting object columns to float
-            try:
-                df_clean[col] = pd.to_numeric(df_clean[col], errors='raise')
-            except ValueError as e:
-                print(f"Could not convert column {col} to numeric: {e}")
-                # Keep original if conversion fails
-                df_clean[col] = df_clean[col]
-    
-    df_clean.reset_index(drop=True, inplace=True)
+    # Standardiser les noms de colonnes si nécessaire
+    if plan["renames"]:
+        df_clean = df_clean.rename(columns=plan["renames"])
+
+    if compact:
+        identifiers = [plan["renames"].get(col, col) for col in plan["identifier_columns"]]
+        categorical_columns = [col for col in identifiers if col != plan["date_column"]]
+        df_clean, saved = compact_frame(df_clean, categorical_columns)
+        if plan["verbose"]:
+            print(f"Compact mode: {saved / 1024 ** 2:.1f} MB saved")
 
     return df_clean
 
+# ----------- Cleaning engine -----------
+
+def parse_timestamps(values):
+    """
+    Parses a timestamp column to datetime64 (unparseable values become NaT).
+
+    Each distinct value is parsed only once. Strings whose date and time were glued
+    together by an older cleaning ("YYYY-MM-DDHH:MM") are repaired first.
+
+    Args:
+        values (pd.Series)
+
+    Returns:
+        timestamps (pd.Series): datetime64 values
+    """
+    if pd.api.types.is_datetime64_any_dtype(values):
+        return values
+
+    codes, uniques = pd.factorize(values)
+    uniques = pd.Series(np.asarray(uniques))
+    if uniques.dtype == 'object':
+        uniques = uniques.astype(str).str.replace(r'(\d{4}-\d{2}-\d{2})(\d{2}:\d{2})', r'\1 \2', regex=True)
+
+    parsed = pd.to_datetime(uniques, errors='coerce')
+    # Exports mixing several layouts: parse the leftovers value by value
+    leftovers = parsed.isna() & (uniques.astype(str) != 'nan')
+    if leftovers.any():
+        parsed[leftovers] = pd.to_datetime(uniques[leftovers], format='mixed', errors='coerce')
+
+    return pd.Series(parsed.array.take(codes, allow_fill=True), index=values.index, name=values.name)
 
-def clean_data2(df):
-    df_clean = df.copy()
 
-    df_clean = df_clean.drop_duplicates()
+def clean_frame(df, non_numeric_cols, date_column=None, reset_index=False, verbose=False, deduplicate=True):
+    """
+    Cleaning engine shared by every export format.
+
+    All object columns are stringified and normalised in one batched pass over a
+    single stacked array (each distinct string only once), the "/0" rows of every
+    numeric column are dropped with one combined mask, and the columns are then
+    converted to numbers, each distinct string of a column once. The output is
+    identical to the historical column-by-column implementation (see
+    benchmark.py).
+
+    Args:
+        df (pd.DataFrame)
+        non_numeric_cols (list): identifier columns excluded from the "/0" filter
+        date_column (str): timestamp column, parsed to datetime64 (instead of being
+            normalised as text) and used to sort the rows
+        reset_index (bool): renumber the rows of the cleaned frame
+        verbose (bool): print the columns that could not be converted to numeric
+        deduplicate (bool): remove full-row duplicates
+
+    Returns:
+        df_clean (pd.DataFrame)
+    """
+    df_clean = df.drop_duplicates() if deduplicate else df
     df_clean = df_clean.dropna(axis='columns', how='all')
 
-    # First identify which columns should be numeric (exclude obvious non-numeric columns)
-    non_numeric_cols = ['Time', 'Game time', 'eNodeB Name', 'Cell Name', 'Cell FDD TDD Indication', 'Cell Name', 'sector', 'Beam', 'LocalCell Id', 'eNodeB Function Name', 'Frequency band', 'LTECell Tx and Rx Mode', 'eNodeB identity']
-    numeric_cols = [col for col in df_clean.columns if col not in non_numeric_cols]
-
-    # Remove rows with "/0" in numeric columns before conversion
-    for col in numeric_cols:
-        if df_clean[col].dtype == 'object':
-            # Remove rows with "/0"
-            mask = df_clean[col].astype(str).str.contains('/0', regex=False)
-            df_clean = df_clean[~mask]
-
-    for col in df_clean.columns:
-        if df_clean[col].dtype == 'object':
-            df_clean[col] = (
-                df_clean[col]
-                .astype(str)
-                .str.replace(',', '.', regex=False)
-                .str.replace('%', '', regex=False)
-                .str.replace(' ', '', regex=False)
-                .replace('', np.nan)
-            )
+    object_cols = [col for col in df_clean.columns if df_clean[col].dtype == 'object' and col != date_column]
+
+    if object_cols:
+        # One stacked pass over every object cell (column-major); each distinct
+        # string is normalised once and broadcast back through its code
+        shape = (len(df_clean), len(object_cols))
+        stacked = pd.Series(df_clean[object_cols].to_numpy().ravel(order='F')).astype(str)
+        codes, uniques = pd.factorize(stacked)
+        uniques = uniques.to_numpy()
+
+        unique_div_zero = np.fromiter(('/0' in value for value in uniques), dtype=bool, count=len(uniques))
+        unique_normalized = np.array(
+            [value.replace(',', '.').replace('%', '').replace(' ', '') for value in uniques],
+            dtype=object
+        )
+        unique_normalized[unique_normalized == ''] = np.nan
+
+        has_div_zero = unique_div_zero[codes].reshape(shape, order='F')
+        codes = codes.reshape(shape, order='F')
+
+        # Remove rows with "/0" in any numeric column
+        numeric_positions = [i for i, col in enumerate(object_cols) if col not in non_numeric_cols]
+        keep = ~has_div_zero[:, numeric_positions].any(axis=1)
+        if not keep.all():
+            df_clean = df_clean[keep]
+            codes = codes[keep]
+
+        converted = {}
+        position = np.empty(len(uniques), dtype=np.int64)
+        for i, col in enumerate(object_cols):
+            # to_numeric on the distinct strings of the column: it fails, and picks
+            # the dtype, from the set of values alone, so broadcasting the result
+            # back is the legacy conversion of the whole column
+            column_codes = pd.unique(codes[:, i])
+            position[column_codes] = np.arange(len(column_codes))
             try:
-                df_clean[col] = pd.to_numeric(df_clean[col], errors='raise')
+                numbers = pd.to_numeric(pd.Series(unique_normalized[column_codes]), errors='raise')
+                converted[col] = pd.Series(numbers.to_numpy()[position[codes[:, i]]], index=df_clean.index, name=col)
+                continue
             except ValueError:
-                pass  # Keep as-is if not convertible
+                pass
 
-    # Standardiser les noms de colonnes si nécessaire
-    if 'Time' in df_clean.columns:
-        df_clean = df_clean.rename(columns={'Time': 'Date'})
+            values = pd.Series(unique_normalized[codes[:, i]], index=df_clean.index, name=col)
+            try:
+                # Same call as the legacy cleaning (and the same message)
+                converted[col] = pd.to_numeric(values, errors='raise')
+            except ValueError as e:
+                if verbose:
+                    print(f"Could not convert column {col} to numeric: {e}")
+                # Keep the normalised strings if conversion fails
+                converted[col] = values
+
+        df_clean = df_clean.copy()
+        for col, values in converted.items():
+            df_clean[col] = values
+    else:
+        df_clean = df_clean.copy()
+
+    if date_column in df_clean.columns:
+        df_clean[date_column] = parse_timestamps(df_clean[date_column])
+        df_clean.sort_values(date_column, kind='stable', inplace=True)
+
+    if reset_index:
+        df_clean.reset_index(drop=True, inplace=True)
 
     return df_clean
 
 
+# ----------- Compact representation -----------
+
+# Largest rounding error accepted when a KPI is stored as float32 (half of the 4th decimal)
+FLOAT32_ATOL = 5e-5
+
+
+def compact_frame(df, categorical_columns, float32_atol=FLOAT32_ATOL):
+    """
+    Reduces the memory footprint of a cleaned DataFrame.
+
+    - Identifier columns (site, cell, ...) become categoricals
+    - float64 KPIs are downcast to float32 when every value survives the round
+      trip within `float32_atol`; the others stay float64
+
+    Args:
+        df (pd.DataFrame): cleaned data
+        categorical_columns (list): identifier columns to convert
+        float32_atol (float): largest accepted rounding error
+
+    Returns:
+        (df_compact, saved_bytes): compact DataFrame and memory saved in bytes
+    """
+    before = df.memory_usage(deep=True).sum()
+    converted = {}
+
+    for col in categorical_columns:
+        if col in df.columns and df[col].dtype == 'object':
+            converted[col] = df[col].astype('category')
+
+    for col in df.select_dtypes(include=['float64']).columns:
+        values = df[col].to_numpy()
+        values32 = values.astype(np.float32)
+        with np.errstate(over='ignore', invalid='ignore'):
+            error = np.abs(values32.astype(np.float64) - values)
+        if np.all(np.isnan(values) | (error <= float32_atol)):
+            converted[col] = pd.Series(values32, index=df.index, name=col)
+
+    df_compact = df.copy()
+    for col, values in converted.items():
+        df_compact[col] = values
+
+    saved = int(before - df_compact.memory_usage(deep=True).sum())
+
+    return df_compact, saved
+
+
+# ----------- Data cleaning 1-----------
+
+def clean_data1(df):
+    """
+    - Applies a basic cleanup to the DataFrame
+    - Removes duplicates
+    - Keeps rows and columns with at least 1 non-zero value
+    - Replaces decimal commas with periods
+    - Deletes % symbols
+    - Converts object columns to float if possible
+    - Removes rows with "/0" values in numeric columns
+
+    Args:
+        df (pd.DataFrame)
+
+    Returns:
+        df_clean (pd.DataFrame)
+    """
+    return clean_data(df, format_name="4G cell")
+
+
+def clean_data2(df):
+    return clean_data(df, format_name="Stade")
+
+
 # ----------- KPIs in the dataset -----------
 
-def summarize_kpis(df, exclude_columns=None):
+def summarize_kpis(df, exclude_columns=None, stats=None):
     """
     Calculates descriptive statistics for numeric columns (KPIs) in DataFrame.
 
+    All KPIs are summarized in one vectorized pass (see `KPIStats`). Partial
+    statistics of other chunks or days can be merged beforehand and passed as
+    `stats`, in which case df is not read.
+
     Args:
         df (pd.DataFrame)
         exclude_columns (list) : columns not to be included (e.g. ['Date', 'Site'])
+        stats (KPIStats): precomputed (merged) statistics
 
     Returns:
         summary_df (pd.DataFrame) : statistical summary (mean, std, min, max, NaN count, etc.).
+            Unique values are estimated (HyperLogLog).
     """
     if exclude_columns is None:
         exclude_columns = []
 
-    # Numerical columns for analysis
-    numeric_cols = df.select_dtypes(include=['float', 'int']).columns
-    numeric_cols = [col for col in numeric_cols if col not in exclude_columns]
-
-    summary_data = []
-    for col in numeric_cols:
-        summary_data.append({
-            "KPI": col,
-            "Mean": df[col].mean(),
-            "Std": df[col].std(),
-            "Min": df[col].min(),
-            "Max": df[col].max(),
-            "Missing Values": df[col].isna().sum(),
-            "Count": df[col].count(),
-            "Unique Values": df[col].nunique()
-        })
-
-    summary_df = pd.DataFrame(summary_data)
-    summary_df.sort_values("Missing Values", ascending=False, inplace=True)
+    if stats is None:
+        # Numerical columns for analysis
+        numeric_cols = df.select_dtypes(include=['float', 'int']).columns
+        numeric_cols = [col for col in numeric_cols if col not in exclude_columns]
+        stats = KPIStats.from_frame(df, numeric_cols)
 
-    return summary_df
+    return stats.summary(exclude_columns)
 
 # ----------- Time aggregation : daily average KPIs -----------
-def aggregate_by_day(df, date_column='Date', exclude_columns=None):
+def aggregate_by_day(df, date_column='Date', exclude_columns=None, cube=None):
     """
     Aggregates KPIs numerically by day.
 
@@ -165,6 +386,8 @@ def aggregate_by_day(df, date_column='Date', exclude_columns=None):
         df (pd.DataFrame)
         date_column (str): name of the date column
         exclude_columns (list): columns to be excluded
+        cube (KPICube): pre-aggregated KPIs of df; the daily network level is read
+            instead of grouping the raw rows again
 
     Returns:
         df_daily (pd.DataFrame) : daily average KPIs
@@ -172,20 +395,27 @@ def aggregate_by_day(df, date_column='Date', exclude_columns=None):
     if exclude_columns is None:
         exclude_columns = []
 
-    df[date_column] = pd.to_datetime(df[date_column], errors='coerce')
-    df = df.dropna(subset=[date_column])  # supprime les dates invalides
+    if cube is not None:
+        numeric_cols = [col for col in cube.kpis if col not in exclude_columns]
+        df_daily = cube.mean('day', 'network', numeric_cols)
+        df_daily.index = pd.DatetimeIndex(df_daily.index, name=date_column)
+        return df_daily
+
+    dates = df[date_column]
+    if not pd.api.types.is_datetime64_any_dtype(dates):
+        dates = pd.to_datetime(dates, errors='coerce')
+    valid = dates.notna()  # supprime les dates invalides
 
     numeric_cols = df.select_dtypes(include=['float', 'int']).columns
     numeric_cols = [col for col in numeric_cols if col not in exclude_columns]
 
-    df_daily = df.groupby(df[date_column].dt.date)[numeric_cols].mean()
-    df_daily.index = pd.to_datetime(df_daily.index)
+    df_daily = df.loc[valid, numeric_cols].groupby(dates[valid].dt.normalize().rename(date_column)).mean()
 
     return df_daily
 
 
 # ----------- Daily average by site -----------
-def aggregate_by_site_and_day(df, site_col='eNodeB Name', date_col='Date', exclude_columns=None):
+def aggregate_by_site_and_day(df, site_col='eNodeB Name', date_col='Date', exclude_columns=None, cube=None):
     """
     Aggregates data by site and day
 
@@ -194,6 +424,8 @@ def aggregate_by_site_and_day(df, site_col='eNodeB Name', date_col='Date', exclu
         site_col (str): name of the site column
         date_col (str): name of the date column
         exclude_columns (list): columns to be excluded
+        cube (KPICube): pre-aggregated KPIs of df; the daily site level is read
+            instead of grouping the raw rows again
 
     Returns:
         df_site_day (pd.DataFrame): Multi-indexed DataFrame (site, day) with KPI averages
@@ -201,14 +433,24 @@ def aggregate_by_site_and_day(df, site_col='eNodeB Name', date_col='Date', exclu
     if exclude_columns is None:
         exclude_columns = []
 
-    df[date_col] = pd.to_datetime(df[date_col], errors='coerce')
-    df = df.dropna(subset=[date_col, site_col])
+    if cube is not None:
+        numeric_cols = [col for col in cube.kpis if col not in exclude_columns]
+        df_grouped = cube.mean('day', 'site', numeric_cols)
+    else:
+        dates = df[date_col]
+        if not pd.api.types.is_datetime64_any_dtype(dates):
+            dates = pd.to_datetime(dates, errors='coerce')
+        valid = dates.notna() & df[site_col].notna()
 
-    numeric_cols = df.select_dtypes(include=['float', 'int']).columns
-    numeric_cols = [col for col in numeric_cols if col not in exclude_columns]
+        numeric_cols = df.select_dtypes(include=['float', 'int']).columns
+        numeric_cols = [col for col in numeric_cols if col not in exclude_columns]
+
+        df_grouped = df.loc[valid, numeric_cols].groupby([df.loc[valid, site_col], dates[valid].dt.normalize()], observed=True).mean()
 
-    df_grouped = df.groupby([site_col, df[date_col].dt.date])[numeric_cols].mean()
-    df_grouped.index.set_names(['Site', 'Date'], inplace=True)
+    df_grouped.index = pd.MultiIndex.from_arrays(
+        [df_grouped.index.get_level_values(0), df_grouped.index.get_level_values(1).date],
+        names=['Site', 'Date']
+    )
     
     return df_grouped
 
@@ -258,5 +500,11 @@ with pd.ExcelWriter("data/cleaned_kpis.xlsx") as writer:
     df_clean.to_excel(writer, sheet_name="4G_KPIs", index=False)
 
 df_grouped = aggregate_by_site_and_day(df_clean, exclude_columns=exclude_columns)
+
+# Same aggregates read from the pre-aggregated cube
+from kpi_cube import KPICube
+cube = KPICube(df_clean)
+daily_agg = aggregate_by_day(df_clean, exclude_columns=exclude_columns, cube=cube)
+df_grouped = aggregate_by_site_and_day(df_clean, exclude_columns=exclude_columns, cube=cube)
 plot_kpi_trend(df_grouped, site='CoMPT_AGA1114_999_Stade', kpi='RRC_Succes_Rate')
 """
\ No newline at end of file
@@ -5,6 +5,8 @@ import tempfile
 
 from datetime import datetime
 
+from anomaly_store import ANOMALY_DB, query_anomalies
+
 def generate_anomaly_summary(df, kpi, threshold, direction):
     if direction == "Maximum à ne pas dépasser":
         anomalies = df[df[kpi] > threshold]
@@ -19,11 +21,40 @@ def generate_anomaly_summary(df, kpi, threshold, direction):
     for _, row in anomalies.iterrows():
         date = row['Date']
         value = row[kpi]
-        # Assuming your date is in format 'YYYY-MM-DD'
-        date_obj = datetime.strptime(date, '%Y-%m-%d')
+        # Cleaned data carries timestamps; raw strings are in format 'YYYY-MM-DD'
+        date_obj = date if isinstance(date, datetime) else datetime.strptime(date, '%Y-%m-%d')
         summary += f"• Le {date_obj.strftime('%Y-%m-%d')}, valeur = {value:.2f}\n"
     return summary
 
+def generate_store_summary(site_name, kpi, cells=None, start=None, end=None, detector=None, path=ANOMALY_DB):
+    """
+    Same summary as `generate_anomaly_summary`, read from the anomaly store
+    (see anomaly_store.py) instead of recomputed from the KPI data.
+
+    Args:
+        site_name: site of the report
+        kpi: KPI of the report
+        cells: optional list of cell names
+        start, end: optional date range
+        detector: optional detector name(s) ("Seuil", "Z-score", ...)
+        path: anomaly database
+
+    Returns:
+        summary (str)
+    """
+    anomalies = query_anomalies(start, end, site=site_name, cells=cells, kpi=kpi, detector=detector, path=path)
+
+    if anomalies.empty:
+        return f"Aucune anomalie détectée sur le KPI {kpi}."
+
+    summary = f"{len(anomalies)} anomalies détectées sur le KPI {kpi}.\n"
+    for method, count in anomalies['Method'].value_counts().items():
+        summary += f"Détecteur {method} : {count}\n"
+    summary += "\n"
+    for date, cell, value, method in zip(anomalies['Date'], anomalies['Cell Name'], anomalies['Value'], anomalies['Method']):
+        summary += f"• Le {date.strftime('%Y-%m-%d %H:%M')}, cellule {cell}, valeur = {value:.2f} ({method})\n"
+    return summary
+
 def generate_pdf_report(site_name, kpi_name, cell_name, summary_text, image_files):
     styles = getSampleStyleSheet()
     elements = []
@@ -63,9 +94,8 @@ uploaded_images = st.file_uploader(
 
 if uploaded_images and selected_kpis:
         kpi = selected_kpis[0]
-        threshold = thresholds.get(kpi, None)
-        direction = threshold_direction.get(kpi, None)
-        summary_text = generate_anomaly_summary(df_site, kpi, threshold, direction)
+        cells = [cell for cell in selected_cells if cell in df_site["Cell Name"].values] or None
+        summary_text = generate_store_summary(selected_site, kpi, cells=cells)
         image_paths = [img for img in uploaded_images]
 
         pdf_path = generate_pdf_report(selected_site, kpi, selected_cells, summary_text, image_paths)
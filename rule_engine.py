@@ -0,0 +1,277 @@
+import json
+import os
+import re
+
+import pandas as pd
+import numpy as np
+
+from anomaly_detector import ID_COLUMNS, normalize_direction
+
+# ----------- Rules -----------
+
+RULES_FILE = "rules_config.json"
+OPERATORS = ['>', '>=', '<', '<=']
+# One condition, then a connector or the end: a connector only counts after a
+# complete "kpi op value", so KPI names may contain "et" / "ou"
+_CONDITION = re.compile(
+    r"\s*(?P<kpi>.+?)\s*(?P<op>>=|<=|>|<)\s*(?P<value>-?\d+(?:[.,]\d+)?)"
+    r"(?:\s+(?P<connector>AND|ET|OR|OU)\s+|\s*$)",
+    re.IGNORECASE,
+)
+CONNECTORS = {"and": "and", "et": "and", "or": "or", "ou": "or"}
+_CONSECUTIVE = re.compile(r"\s+(?:for|pendant)\s+(\d+)\s*(?:consecutive\s+)?(?:intervals?|intervalles?(?:\s+consécutifs)?)?\s*$", re.IGNORECASE)
+
+
+def parse_rule(text, name=None):
+    """
+    Parses a rule written as text.
+
+    Example: "DL PRB Usage(%) > 80 AND DL User throughput < 2 FOR 3 intervals"
+
+    Args:
+        text (str): conditions joined by AND / OR or ET / OU (any case, not both),
+            optionally followed by "FOR n intervals" (or "pendant n intervalles");
+            a connector is only read between complete conditions
+        name (str): rule name (default: the text)
+
+    Returns:
+        rule (dict): {"name", "conditions": [{"kpi", "op", "value"}], "combine", "consecutive"}
+    """
+    consecutive = 1
+    match = _CONSECUTIVE.search(text)
+    body = text
+    if match:
+        consecutive = int(match.group(1))
+        body = text[:match.start()]
+
+    conditions, combines, position = [], set(), 0
+    while True:
+        found = _CONDITION.match(body, position)
+        if not found:
+            raise ValueError(f"Condition non reconnue : {body[position:].strip()}")
+        conditions.append({
+            "kpi": found.group("kpi"),
+            "op": found.group("op"),
+            "value": float(found.group("value").replace(",", ".")),
+        })
+        if found.group("connector") is None:
+            break
+        combines.add(CONNECTORS[found.group("connector").lower()])
+        position = found.end()
+
+    if len(combines) > 1:
+        raise ValueError(f"Règle ambiguë (AND et OR mélangés) : {text}")
+    combine = combines.pop() if combines else "and"
+
+    return {"name": name or text, "conditions": conditions, "combine": combine, "consecutive": consecutive}
+
+
+def rules_from_threshold_config(config):
+    """
+    One single-condition rule per KPI of threshold_config.json.
+
+    The direction labels are normalised ("Maximum à ne pas dépasser" becomes
+    "value > threshold"); a threshold of 0 means no threshold, as in the
+    dashboard.
+    """
+    rules = []
+    for kpi, rule in config.items():
+        direction = normalize_direction(rule.get("direction"))
+        if rule.get("threshold") and direction:
+            rules.append({
+                "name": kpi,
+                "conditions": [{"kpi": kpi, "op": ">" if direction == "max" else "<", "value": float(rule["threshold"])}],
+                "combine": "and",
+                "consecutive": 1,
+            })
+    return rules
+
+
+def load_rules(path=RULES_FILE):
+    """Loads compound rules from a JSON list (dicts, or texts for `parse_rule`)."""
+    if not os.path.exists(path):
+        return []
+    with open(path, "r") as f:
+        entries = json.load(f)
+    return [parse_rule(entry) if isinstance(entry, str) else entry for entry in entries]
+
+
+# ----------- Compiled evaluation plan -----------
+
+class RulePlan:
+    """
+    Rules compiled once into array operations over the KPI matrix.
+
+    Compilation resolves every condition to a column of the matrix of the KPIs
+    used by the rules, groups the conditions by operator and sorts them by rule.
+    Evaluation then costs one broadcast comparison per operator, one
+    `reduceat` per combination type (AND / OR) and, for rules with a duration,
+    one run-length pass per cell, whatever the number of rules.
+
+    Args:
+        rules (list): rule dicts (see `parse_rule`, `rules_from_threshold_config`)
+    """
+
+    def __init__(self, rules):
+        self.rules = [self._normalise(rule) for rule in rules]
+        self.names = [rule["name"] for rule in self.rules]
+        self.kpis = list(dict.fromkeys(cond["kpi"] for rule in self.rules for cond in rule["conditions"]))
+
+        # Conditions sorted by rule: rule i owns conditions offsets[i]:offsets[i + 1]
+        conditions = [cond for rule in self.rules for cond in rule["conditions"]]
+        counts = [len(rule["conditions"]) for rule in self.rules]
+        self.offsets = np.r_[0, np.cumsum(counts)].astype(np.int64)
+        self.condition_kpis = np.array([self.kpis.index(cond["kpi"]) for cond in conditions], dtype=np.int64)
+        self.condition_values = np.array([cond["value"] for cond in conditions], dtype=np.float64)
+        self.by_operator = {
+            op: np.array([i for i, cond in enumerate(conditions) if cond["op"] == op], dtype=np.int64)
+            for op in OPERATORS
+        }
+
+        self.is_or = np.array([rule["combine"] == "or" for rule in self.rules], dtype=bool)
+        self.consecutive = np.array([rule["consecutive"] for rule in self.rules], dtype=np.int64)
+
+    @staticmethod
+    def _normalise(rule):
+        if isinstance(rule, str):
+            rule = parse_rule(rule)
+        if not rule.get("conditions"):
+            raise ValueError(f"Règle sans condition : {rule.get('name')}")
+        conditions = []
+        for cond in rule["conditions"]:
+            op = cond.get("op")
+            if op not in OPERATORS:
+                # Direction labels of threshold_config.json are accepted too
+                direction = normalize_direction(op or cond.get("direction"))
+                if direction is None:
+                    raise ValueError(f"Opérateur non reconnu : {op}")
+                op = ">" if direction == "max" else "<"
+            conditions.append({"kpi": cond["kpi"], "op": op, "value": float(cond["value"])})
+        combine = str(rule.get("combine", "and")).lower()
+        if combine not in ("and", "or"):
+            raise ValueError(f"Combinaison non reconnue : {combine}")
+        return {
+            "name": rule.get("name") or " ".join(f"{c['kpi']} {c['op']} {c['value']}" for c in conditions),
+            "conditions": conditions,
+            "combine": combine,
+            "consecutive": max(int(rule.get("consecutive", 1)), 1),
+        }
+
+    def matches(self, X, cell_codes=None):
+        """
+        Evaluates all the rules on a KPI matrix.
+
+        Args:
+            X (np.ndarray): (rows x self.kpis) float matrix, rows of each cell in date order
+            cell_codes (np.ndarray): cell of each row (needed by rules with a duration)
+
+        Returns:
+            matched (np.ndarray): (rows x rules) boolean matrix
+        """
+        n_rows = X.shape[0]
+        holds = np.zeros((n_rows, len(self.condition_values)), dtype=bool)
+        with np.errstate(invalid='ignore'):
+            for op, index in self.by_operator.items():
+                if not len(index):
+                    continue
+                left = X[:, self.condition_kpis[index]]
+                right = self.condition_values[index]
+                if op == '>':
+                    holds[:, index] = left > right
+                elif op == '>=':
+                    holds[:, index] = left >= right
+                elif op == '<':
+                    holds[:, index] = left < right
+                else:
+                    holds[:, index] = left <= right
+
+        if not n_rows or not len(self.rules):
+            return np.zeros((n_rows, len(self.rules)), dtype=bool)
+
+        starts = self.offsets[:-1]
+        matched = np.where(
+            self.is_or,
+            np.logical_or.reduceat(holds, starts, axis=1),
+            np.logical_and.reduceat(holds, starts, axis=1),
+        )
+
+        durable = np.flatnonzero(self.consecutive > 1)
+        if len(durable):
+            if cell_codes is None:
+                raise ValueError("Les règles avec durée ont besoin des cellules (cell_codes).")
+            matched[:, durable] = self._held_for(matched[:, durable], cell_codes, self.consecutive[durable])
+        return matched
+
+    @staticmethod
+    def _held_for(matched, cell_codes, durations):
+        """True from the n-th consecutive matching row of the same cell on."""
+        n_rows = matched.shape[0]
+        count = np.cumsum(matched, axis=0)
+        before = count - matched
+
+        # The run restarts after every non-matching row and at every new cell
+        cell_start = np.r_[True, cell_codes[1:] != cell_codes[:-1]]
+        reset = np.where(~matched, count, 0)
+        reset[cell_start] = before[cell_start]
+        run = count - np.maximum.accumulate(reset, axis=0)
+        return run >= durations[np.newaxis, :] if n_rows else matched
+
+    def evaluate(self, df, cell_col='Cell Name', date_col='Date', id_columns=None):
+        """
+        Runs the rules over a cleaned frame (whole fleet at once).
+
+        Duration conditions ("for n intervals") count consecutive rows of a cell
+        in date order; the interval that completes the n-th match and the
+        following ones are reported.
+
+        Args:
+            df (pd.DataFrame): cleaned data
+            cell_col (str): cell column
+            date_col (str): date column
+            id_columns (list): columns copied to the result (default: date, site, cell)
+
+        Returns:
+            anomalies (pd.DataFrame): one row per (row, rule) match with the id
+                columns, 'Rule', 'KPI' (first KPI of the rule) and 'Value' (its value)
+        """
+        if id_columns is None:
+            id_columns = [col for col in ID_COLUMNS if col in df.columns]
+
+        missing = [kpi for kpi in self.kpis if kpi not in df.columns]
+        if missing:
+            raise KeyError(f"KPI absents des données : {missing}")
+
+        codes = pd.factorize(df[cell_col])[0]
+        dates = pd.to_datetime(df[date_col]).to_numpy(dtype='datetime64[ns]').view(np.int64)
+        order = np.lexsort((dates, codes))
+
+        X = np.empty((len(df), len(self.kpis)))
+        for j, kpi in enumerate(self.kpis):
+            X[:, j] = pd.to_numeric(df[kpi], errors='coerce').to_numpy(dtype=np.float64)[order]
+
+        positions, rules = np.nonzero(self.matches(X, codes[order]))
+        values = X[positions, self.condition_kpis[self.offsets[:-1]][rules]]
+        rows = order[positions]
+        rank = np.lexsort((rules, rows))
+        rows, rules, values = rows[rank], rules[rank], values[rank]
+
+        first_kpis = np.array([rule["conditions"][0]["kpi"] for rule in self.rules], dtype=object)
+        anomalies = df[id_columns].take(rows).reset_index(drop=True)
+        anomalies["Rule"] = np.array(self.names, dtype=object)[rules]
+        anomalies["KPI"] = first_kpis[rules]
+        anomalies["Value"] = values
+        return anomalies
+
+
+def compile_rules(rules):
+    """Compiles rules into a `RulePlan` (compile once, evaluate on every batch)."""
+    return RulePlan(rules)
+
+
+"""
+Usage :
+    plan = compile_rules(rules_from_threshold_config(load_threshold_config()) + [
+        "DL PRB Usage(%) > 80 AND DL User throughput < 2 FOR 3 intervals",
+    ])
+    anomalies = plan.evaluate(df_clean)
+"""
@@ -0,0 +1,360 @@
+import glob
+import os
+import shutil
+import tempfile
+import time
+import warnings
+import weakref
+
+import pandas as pd
+import numpy as np
+
+from utils import labels_from_array, labels_to_array
+
+# ----------- Seasonal (hour-of-week) baseline -----------
+
+PROFILE_FILE = os.path.join(".cache", "seasonal_baseline.npz")
+SLOTS = 7 * 24  # hour of week, Monday 00h = 0
+WEEK_NS = 7 * 24 * 3600 * 10 ** 9
+MAD_SCALE = 1.4826  # MAD -> standard deviation for normal data
+RING_BLOCK = 1024  # cells per ring file
+RING_DTYPES = {"mean": np.float32, "m2": np.float32, "count": np.uint8, "week": np.int32}
+
+
+def _slots_and_weeks(dates):
+    """Hour-of-week slot and absolute week number (weeks start on Monday)."""
+    ns = pd.to_datetime(dates).to_numpy(dtype='datetime64[ns]').view(np.int64)
+    # 1970-01-05 is a Monday
+    since_monday = ns - np.datetime64('1970-01-05', 'ns').view(np.int64)
+    weeks = np.floor_divide(since_monday, WEEK_NS)
+    slots = np.floor_divide(since_monday - weeks * WEEK_NS, 3600 * 10 ** 9)
+    return slots.astype(np.int64), weeks.astype(np.int64)
+
+
+class SeasonalBaseline:
+    """
+    Robust hour-of-week profile per cell and KPI, learnt from history.
+
+    For every (cell, hour of week, KPI) the hourly means of the last `weeks`
+    weeks are kept in a ring buffer (float32 mean and within-hour sum of
+    squared deviations, uint8 sample count). The profile is the median of the
+    ring; its scale combines the MAD of the weekly means with the median
+    within-hour variance, since new samples are 15-minute values. New data is
+    scored as the robust deviation from the profile slot of its timestamp, so
+    busy hours are compared with the same hour of the previous weeks instead
+    of the global mean of the KPI.
+
+    Only the profiles (median and scale, 8 bytes per cell, slot and KPI) are
+    kept in memory, with a capacity that doubles as cells appear. The rings are
+    memory-mapped .npy files in `ring_dir`, one file per array and block of
+    RING_BLOCK cells: only the pages of the touched slots are read, and new
+    cells add a block file instead of copying the existing rings.
+
+    `update` only rewrites the ring slots of the hours it receives and only
+    refreshes the profiles of those (cell, hour) pairs; the state can be
+    checkpointed with `save` and grown day after day.
+
+    Args:
+        kpis (list): KPI columns to profile
+        weeks (int): weeks kept per slot
+        min_weeks (int): weeks of history needed before a slot is scored
+        min_relative_scale (float): scale floor, as a fraction of the profile
+            level (avoids flagging tiny moves of flat KPIs)
+        cell_col (str): cell column
+        date_col (str): date column
+        site_col (str): site column (copied to the anomaly table)
+        ring_dir (str): working directory of the rings (default: a temporary
+            directory removed with the baseline)
+    """
+
+    def __init__(self, kpis, weeks=6, min_weeks=3, min_relative_scale=0.05,
+                 cell_col='Cell Name', date_col='Date', site_col='eNodeB Name', ring_dir=None):
+        self.kpis = list(kpis)
+        self.weeks = weeks
+        self.min_weeks = min_weeks
+        self.min_relative_scale = min_relative_scale
+        self.cell_col = cell_col
+        self.date_col = date_col
+        self.site_col = site_col
+        self.ring_dir = ring_dir
+        self.ring_block = RING_BLOCK
+
+        k = len(self.kpis)
+        self.cells = pd.Index([], dtype=object)
+        self._median = np.full((0, SLOTS, k), np.nan, dtype=np.float32)
+        self._scale = np.full((0, SLOTS, k), np.nan, dtype=np.float32)
+        self._blocks = []  # ring arrays of each block of `ring_block` cells
+
+    @property
+    def median(self):
+        """Profile median, (cells x slots x kpis)."""
+        return self._median[:len(self.cells)]
+
+    @property
+    def scale(self):
+        """Profile scale, (cells x slots x kpis)."""
+        return self._scale[:len(self.cells)]
+
+    def _ring_path(self, name, block):
+        if self.ring_dir is None:
+            self.ring_dir = tempfile.mkdtemp(prefix="seasonal-rings-")
+            weakref.finalize(self, shutil.rmtree, self.ring_dir, True)
+        return os.path.join(self.ring_dir, f"{name}-{block:05d}.npy")
+
+    def _open_block(self, block, create):
+        """Memory maps of the ring arrays of a block (created empty if `create`)."""
+        if not create:
+            return {name: np.load(self._ring_path(name, block), mmap_mode='r+') for name in RING_DTYPES}
+        ring = {}
+        for name, dtype in RING_DTYPES.items():
+            shape = (self.ring_block, SLOTS) + ((self.weeks,) if name == "week" else (len(self.kpis), self.weeks))
+            ring[name] = np.lib.format.open_memmap(self._ring_path(name, block), mode='w+', dtype=dtype, shape=shape)
+        ring["week"][:] = -1
+        return ring
+
+    def _block_ranges(self, rows):
+        """(block, start, stop) of the runs of sorted state rows that share a ring block."""
+        blocks = rows // self.ring_block
+        bounds = np.flatnonzero(np.r_[True, blocks[1:] != blocks[:-1], True]) if len(rows) else np.array([0])
+        return [(int(blocks[a]), a, b) for a, b in zip(bounds[:-1], bounds[1:])]
+
+    def _rows(self, cells, create=True):
+        """State rows of cells; unknown cells get an empty ring (or -1 if not `create`)."""
+        new_cells = pd.Index(pd.unique(cells)).difference(self.cells)
+        if len(new_cells) and create:
+            n_cells = len(self.cells) + len(new_cells)
+            if n_cells > len(self._median):
+                # Doubling capacity: each profile row is copied O(1) times on average
+                capacity = max(n_cells, 2 * len(self._median))
+                self._median = _grow(self._median, capacity)
+                self._scale = _grow(self._scale, capacity)
+            while len(self._blocks) * self.ring_block < n_cells:
+                self._blocks.append(self._open_block(len(self._blocks), create=True))
+            self.cells = self.cells.append(new_cells.astype(object))
+        return self.cells.get_indexer(cells)
+
+    def _prepare(self, df, create):
+        df = df.dropna(subset=[self.cell_col, self.date_col])
+        rows = self._rows(df[self.cell_col].to_numpy(), create=create)
+        slots, weeks = _slots_and_weeks(df[self.date_col])
+        X = np.empty((len(df), len(self.kpis)))
+        for j, kpi in enumerate(self.kpis):
+            X[:, j] = pd.to_numeric(df[kpi], errors='coerce').to_numpy(dtype=np.float64)
+        return df, rows, slots, weeks, X
+
+    def update(self, df):
+        """
+        Adds history to the ring buffers and refreshes the touched profiles.
+
+        Samples of a week older than the ring content of their slot are ignored;
+        samples of a week already in the ring are merged into its hourly mean.
+
+        Args:
+            df (pd.DataFrame): cleaned data (any number of intervals)
+        """
+        df, rows, slots, weeks, X = self._prepare(df, create=True)
+        if not len(df):
+            return
+
+        # Hourly count, mean and sum of squared deviations per (cell, week, slot)
+        valid = ~np.isnan(X)
+        keys = [rows, weeks, slots]
+        grouped = pd.DataFrame(np.where(valid, X, 0.0)).groupby(keys)
+        sums = grouped.sum()
+        key_rows, key_weeks, key_slots = (sums.index.get_level_values(i).to_numpy() for i in range(3))
+        counts = pd.DataFrame(valid.astype(np.int64)).groupby(keys).sum().to_numpy()
+        with np.errstate(invalid='ignore', divide='ignore'):
+            means = np.where(counts > 0, sums.to_numpy() / counts, 0.0)
+        squares = pd.DataFrame(np.where(valid, X * X, 0.0)).groupby(keys).sum().to_numpy()
+        m2s = np.maximum(squares - counts * means * means, 0.0)
+
+        # Groups come out sorted by state row, so each ring block is one run
+        for block, a, b in self._block_ranges(key_rows):
+            self._merge(self._blocks[block], key_rows[a:b] - block * self.ring_block,
+                        key_weeks[a:b], key_slots[a:b], counts[a:b], means[a:b], m2s[a:b])
+
+        self._refresh(key_rows, key_slots)
+
+    def _merge(self, ring, rows, weeks, slots, counts, means, m2s):
+        """Merges hourly statistics into the ring of one block (rows local to the block)."""
+        # One pass per week: different weeks of a batch may share a ring position
+        for week in np.unique(weeks):
+            sel = weeks == week
+            r, s, pos = rows[sel], slots[sel], week % self.weeks
+            stored = ring["week"][r, s, pos]
+
+            newer = stored < week
+            ring["week"][r[newer], s[newer], pos] = week
+            ring["mean"][r[newer], s[newer], :, pos] = 0.0
+            ring["m2"][r[newer], s[newer], :, pos] = 0.0
+            ring["count"][r[newer], s[newer], :, pos] = 0
+
+            keep = stored <= week
+            r, s = r[keep], s[keep]
+            old_count = ring["count"][r, s, :, pos].astype(np.int64)
+            old_mean = ring["mean"][r, s, :, pos].astype(np.float64)
+            count, mean, m2 = counts[sel][keep], means[sel][keep], m2s[sel][keep]
+
+            # Chan merge of the stored and the new samples of the hour
+            new_count = old_count + count
+            delta = mean - old_mean
+            with np.errstate(invalid='ignore', divide='ignore'):
+                merged_mean = old_mean + delta * count / new_count
+                merged_m2 = ring["m2"][r, s, :, pos] + m2 + delta * delta * old_count * count / new_count
+            ring["mean"][r, s, :, pos] = np.where(new_count > 0, merged_mean, 0.0)
+            ring["m2"][r, s, :, pos] = np.where(new_count > 0, merged_m2, 0.0)
+            ring["count"][r, s, :, pos] = np.minimum(new_count, np.iinfo(np.uint8).max)
+
+    def _refresh(self, rows, slots):
+        """Recomputes median and scale of the given (cell, slot) pairs."""
+        pairs = np.unique(np.stack([rows, slots]), axis=1)
+        for block, a, b in self._block_ranges(pairs[0]):
+            ring = self._blocks[block]
+            r, s = pairs[0, a:b], pairs[1, a:b]
+            local = r - block * self.ring_block
+            count = ring["count"][local, s].astype(np.float64)
+            values = np.where(count > 0, ring["mean"][local, s], np.nan)
+            n_weeks = (count > 0).sum(axis=-1)
+
+            with warnings.catch_warnings():
+                # Empty slots (no history yet) are expected
+                warnings.simplefilter("ignore", RuntimeWarning)
+                within = np.where(count > 1, ring["m2"][local, s] / (count - 1), np.nan)
+                median = np.nanmedian(values, axis=-1)
+                mad = np.nanmedian(np.abs(values - median[..., np.newaxis]), axis=-1)
+                within_var = np.nan_to_num(np.nanmedian(within, axis=-1))
+            scale = np.sqrt((MAD_SCALE * mad) ** 2 + within_var)
+            scale = np.maximum(scale, self.min_relative_scale * np.abs(median))
+
+            enough = n_weeks >= self.min_weeks
+            self._median[r, s] = np.where(enough, median, np.nan)
+            self._scale[r, s] = np.where(enough & (scale > 0), scale, np.nan)
+
+    def _deviation(self, df):
+        df, rows, slots, _, X = self._prepare(df, create=False)
+        known = rows >= 0
+        reference = np.full(X.shape, np.nan)
+        scale = np.full(X.shape, np.nan)
+        reference[known] = self._median[rows[known], slots[known]]
+        scale[known] = self._scale[rows[known], slots[known]]
+        with np.errstate(invalid='ignore'):
+            return (X - reference) / scale, reference, X
+
+    def score(self, df):
+        """
+        Robust deviation of every value from its hour-of-week profile.
+
+        Args:
+            df (pd.DataFrame): cleaned data to score (not learnt)
+
+        Returns:
+            scores (np.ndarray): (rows x kpis) deviations in robust standard
+                deviations; NaN without a profile (unknown cell, short history)
+        """
+        return self._deviation(df)[0]
+
+    def detect(self, df, threshold=3.5):
+        """
+        Scores new data and returns the anomalies.
+
+        Score before `update` so that the new samples are not part of their own
+        baseline.
+
+        Args:
+            df (pd.DataFrame): cleaned data
+            threshold (float): deviation threshold, in robust standard deviations
+
+        Returns:
+            anomalies (pd.DataFrame): one row per anomaly with date, site, cell,
+                'KPI', 'Value', 'Method' ("Saisonnier"), 'Reference' (profile
+                median) and 'Score'
+        """
+        df = df.dropna(subset=[self.cell_col, self.date_col])
+        z, reference, X = self._deviation(df)
+        with np.errstate(invalid='ignore'):
+            hit_rows, hit_cols = np.nonzero(np.abs(z) > threshold)
+
+        id_columns = [col for col in [self.date_col, self.site_col, self.cell_col] if col in df.columns]
+        anomalies = df[id_columns].take(hit_rows).reset_index(drop=True)
+        anomalies["KPI"] = np.array(self.kpis, dtype=object)[hit_cols]
+        anomalies["Value"] = X[hit_rows, hit_cols]
+        anomalies["Method"] = "Saisonnier"
+        anomalies["Reference"] = reference[hit_rows, hit_cols]
+        anomalies["Score"] = z[hit_rows, hit_cols]
+        return anomalies
+
+    def profile(self, cell, kpi):
+        """Median and scale of the 168 hour-of-week slots of a cell (Monday 00h first)."""
+        row, col = self.cells.get_loc(cell), self.kpis.index(kpi)
+        return pd.DataFrame({"Median": self.median[row, :, col], "Scale": self.scale[row, :, col]},
+                            index=pd.RangeIndex(SLOTS, name="Hour of week"))
+
+    def save(self, path=PROFILE_FILE):
+        """
+        Checkpoints the profiles and the ring buffers to disk.
+
+        The profiles go to `path`, the ring files to a new directory next to it
+        whose name is recorded in `path`: replacing `path` switches both at once
+        (atomic replace), then the rings of the previous checkpoint are removed.
+        """
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        ring_path = f"{path}.rings-{time.time_ns()}"
+        os.makedirs(ring_path)
+        for block, ring in enumerate(self._blocks):
+            for name, array in ring.items():
+                array.flush()
+                shutil.copyfile(array.filename, os.path.join(ring_path, os.path.basename(array.filename)))
+
+        tmp_path = f"{path}.{os.getpid()}.tmp.npz"
+        np.savez_compressed(
+            tmp_path,
+            kpis=np.array(self.kpis, dtype=str), cells=labels_to_array(self.cells),
+            median=self.median, scale=self.scale, rings=np.array(os.path.basename(ring_path)),
+            params=np.array([self.weeks, self.min_weeks, self.min_relative_scale, self.ring_block]),
+            columns=np.array([self.cell_col, self.date_col, self.site_col], dtype=str),
+        )
+        os.replace(tmp_path, path)
+        for old_path in glob.glob(f"{glob.escape(path)}.rings-*"):
+            if old_path != ring_path:
+                shutil.rmtree(old_path, ignore_errors=True)
+
+    @classmethod
+    def load(cls, path=PROFILE_FILE, ring_dir=None):
+        """Restores a baseline from its checkpoint (the rings are copied to `ring_dir`)."""
+        with np.load(path, allow_pickle=True) as data:
+            weeks, min_weeks, min_relative_scale, ring_block = data["params"]
+            cell_col, date_col, site_col = data["columns"].tolist()
+            baseline = cls(data["kpis"].tolist(), weeks=int(weeks), min_weeks=int(min_weeks),
+                           min_relative_scale=float(min_relative_scale),
+                           cell_col=cell_col, date_col=date_col, site_col=site_col, ring_dir=ring_dir)
+            baseline.ring_block = int(ring_block)
+            baseline.cells = labels_from_array(data["cells"])
+            baseline._median, baseline._scale = data["median"], data["scale"]
+            ring_path = os.path.join(os.path.dirname(path), str(data["rings"]))
+
+        # The checkpoint is left untouched by later updates
+        n_blocks = -(-len(baseline.cells) // baseline.ring_block)
+        for block in range(n_blocks):
+            for name in RING_DTYPES:
+                target = baseline._ring_path(name, block)
+                shutil.copyfile(os.path.join(ring_path, os.path.basename(target)), target)
+            baseline._blocks.append(baseline._open_block(block, create=False))
+        return baseline
+
+
+def _grow(array, capacity):
+    """Copy of a profile array with `capacity` rows, the new ones NaN."""
+    grown = np.full((capacity,) + array.shape[1:], np.nan, dtype=array.dtype)
+    grown[:len(array)] = array
+    return grown
+
+
+"""
+Usage (every day, after the new export has been added to the history store) :
+    baseline = SeasonalBaseline.load() if os.path.exists(PROFILE_FILE) else SeasonalBaseline(kpis)
+    anomalies = baseline.detect(df_today)
+    baseline.update(df_today)
+    baseline.save()
+"""
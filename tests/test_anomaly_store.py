@@ -0,0 +1,58 @@
+import pandas as pd
+import pytest
+
+from anomaly_store import query_anomalies, save_anomalies
+
+
+def _anomalies(method, sites=("S1", "S2"), day="2024-01-02", value=1.0):
+    return pd.DataFrame({
+        "Date": pd.Timestamp(f"{day} 10:00"),
+        "eNodeB Name": list(sites),
+        "Cell Name": [f"{site}_1" for site in sites],
+        "KPI": "CSSR(%)",
+        "Method": method,
+        "Value": value,
+    })
+
+
+@pytest.fixture
+def db(tmp_path):
+    path = str(tmp_path / "anomalies.sqlite")
+    table = pd.concat([_anomalies("Seuil"), _anomalies("Z-score"), _anomalies("Seuil", day="2024-01-05")])
+    save_anomalies(table, path=path)
+    return path
+
+
+def test_same_anomaly_saved_twice_keeps_the_latest(db):
+    save_anomalies(_anomalies("Seuil", sites=["S1"], value=2.0), path=db)
+    found = query_anomalies("2024-01-02", "2024-01-02", site="S1", detector="Seuil", path=db)
+    assert found["Value"].tolist() == [2.0]
+
+
+def test_rerun_without_hits_clears_the_stated_detectors(db):
+    save_anomalies(_anomalies("Seuil").iloc[0:0], start="2024-01-01", end="2024-01-03",
+                   detectors=["Seuil"], path=db)
+    found = query_anomalies(path=db)
+    # Only the window and the detector that was run are cleared
+    assert set(zip(found["Method"], found["Date"].dt.day)) == {("Z-score", 2), ("Seuil", 5)}
+
+
+def test_replace_needs_every_detector_of_the_table(db):
+    with pytest.raises(ValueError):
+        save_anomalies(_anomalies("Seuil"), start="2024-01-01", end="2024-01-03", path=db)
+    with pytest.raises(ValueError, match="Z-score"):
+        save_anomalies(pd.concat([_anomalies("Seuil"), _anomalies("Z-score")]),
+                       start="2024-01-01", end="2024-01-03", detectors=["Seuil"], path=db)
+    # Nothing was deleted by the rejected calls
+    assert len(query_anomalies(path=db)) == 6
+
+
+def test_replace_limited_to_the_rerun_sites(db):
+    save_anomalies(_anomalies("Seuil", sites=["S1"]).iloc[0:0], start="2024-01-01", end="2024-01-03",
+                   detectors=["Seuil"], sites=["S1"], path=db)
+    found = query_anomalies("2024-01-02", "2024-01-02", detector="Seuil", path=db)
+    assert found["eNodeB Name"].tolist() == ["S2"]
+
+    with pytest.raises(ValueError, match="S2"):
+        save_anomalies(_anomalies("Seuil"), start="2024-01-01", end="2024-01-03",
+                       detectors=["Seuil"], sites=["S1"], path=db)
@@ -0,0 +1,59 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from kpi_cube import KPICube, STATS
+
+
+@pytest.fixture
+def frame():
+    rng = np.random.default_rng(1)
+    dates = pd.date_range("2024-01-01", periods=24 * 10, freq="h")
+    rows = [(site, f"{site}_{cell}", date) for site in ["S1", "S2"] for cell in range(3) for date in dates]
+    df = pd.DataFrame(rows, columns=["eNodeB Name", "Cell Name", "Date"])
+    df["A"] = rng.normal(50, 10, len(df))
+    df["B"] = rng.normal(size=len(df))
+    df.loc[df.sample(frac=0.1, random_state=1).index, "A"] = np.nan
+    return df
+
+
+def _direct(df, keys, freq):
+    buckets = df["Date"].dt.floor(freq) if freq == "h" else df["Date"].dt.normalize()
+    grouped = df[["A", "B"]].groupby([df[key] for key in keys] + [buckets.rename("Date")]).agg(STATS)
+    return grouped.swaplevel(axis=1)[STATS]
+
+
+def _assert_tables_equal(result, expected):
+    pd.testing.assert_frame_equal(
+        result.sort_index().sort_index(axis=1), expected.sort_index().sort_index(axis=1), check_dtype=False
+    )
+
+
+@pytest.mark.parametrize("scope, keys", [("cell", ["eNodeB Name", "Cell Name"]), ("site", ["eNodeB Name"])])
+def test_tables_match_groupby(frame, scope, keys):
+    cube = KPICube(frame, kpis=["A", "B"])
+    _assert_tables_equal(cube.table("day", scope), _direct(frame, keys, "D"))
+    _assert_tables_equal(cube.table("hour", scope), _direct(frame, keys, "h"))
+
+
+def test_updates_match_one_build(frame):
+    full = KPICube(frame, kpis=["A", "B"])
+    # The split falls in the middle of a day: that bucket is merged from both parts
+    split = frame["Date"] < "2024-01-05 13:00"
+    cube = KPICube(frame[split], kpis=["A", "B"])
+    cube.update(frame[~split])
+    for key, table in full.tables.items():
+        _assert_tables_equal(cube.tables[key], table)
+    pd.testing.assert_frame_equal(cube.mean("week", "network"), full.mean("week", "network"))
+
+
+def test_restricted_levels_and_save_load(frame, tmp_path):
+    full = KPICube(frame, kpis=["A", "B"])
+    cube = KPICube(frame, kpis=["A", "B"], levels=["day"], scopes=["cell"])
+    assert list(cube.tables) == [("day", "cell")]
+    _assert_tables_equal(cube.table("day", "cell"), full.table("day", "cell"))
+
+    cube.save(tmp_path)
+    loaded = KPICube.load(tmp_path)
+    assert loaded.levels == ["day"] and loaded.scopes == ["cell"]
+    _assert_tables_equal(loaded.table("day", "cell"), full.table("day", "cell"))
@@ -0,0 +1,45 @@
+import numpy as np
+import pandas as pd
+
+from kpi_stats import KPIStats
+
+
+def _parts():
+    rng = np.random.default_rng(0)
+    first = pd.DataFrame({'A': rng.normal(50, 5, 200), 'B': rng.normal(size=200)})
+    first.loc[::7, 'A'] = np.nan
+    second = pd.DataFrame({'A': rng.normal(60, 2, 120), 'C': rng.integers(0, 10, 120).astype(float)})
+    return first, second
+
+
+def _compare(merged, full):
+    columns = ['Mean', 'Std', 'Min', 'Max', 'Missing Values', 'Count']
+    result = merged.summary().set_index('KPI').sort_index()[columns]
+    expected = KPIStats.from_frame(full).summary().set_index('KPI').sort_index()[columns]
+    pd.testing.assert_frame_equal(result, expected)
+
+
+def test_merge_matches_one_pass():
+    first, second = _parts()
+    full = pd.concat([first, second], ignore_index=True)
+    merged = KPIStats.from_frame(first).merge(KPIStats.from_frame(second))
+    _compare(merged, full)
+
+    summary = merged.summary().set_index('KPI')
+    assert np.isclose(summary.loc['A', 'Mean'], np.nanmean(full['A']))
+    assert summary.loc['B', 'Missing Values'] == len(second)
+    assert summary.loc['C', 'Missing Values'] == len(first)
+
+
+def test_update_by_chunks_and_save_load(tmp_path):
+    first, second = _parts()
+    full = pd.concat([first, second], ignore_index=True)
+    stats = KPIStats()
+    for start in range(0, len(full), 50):
+        stats.update(full.iloc[start:start + 50])
+    _compare(stats, full)
+
+    stats.save(tmp_path / "stats.npz")
+    loaded = KPIStats.load(tmp_path / "stats.npz")
+    assert loaded.rows == len(full)
+    _compare(loaded, full)
@@ -0,0 +1,44 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from kpi_utils import kpi_correlation, kpi_correlation_by
+
+KPIS = ["A", "B", "C", "D"]
+
+
+@pytest.fixture
+def frame():
+    rng = np.random.default_rng(2)
+    n = 300
+    df = pd.DataFrame({"eNodeB Name": rng.choice(["S1", "S2", "S3"], n)})
+    df["A"] = rng.normal(size=n)
+    df["B"] = df["A"] * 2 + rng.normal(size=n)
+    df["C"] = np.exp(df["A"]) + rng.normal(scale=0.1, size=n)
+    df["D"] = rng.integers(0, 5, n).astype(float)  # ties for the ranks
+    # Different missing-value patterns, so every pair has its own common rows
+    df.loc[rng.random(n) < 0.2, "B"] = np.nan
+    df.loc[rng.random(n) < 0.3, "C"] = np.nan
+    df.loc[:40, "D"] = np.nan
+    return df
+
+
+@pytest.mark.parametrize("method", ["pearson", "spearman"])
+@pytest.mark.parametrize("min_periods", [2, 200])
+def test_kpi_correlation_matches_pandas(frame, method, min_periods):
+    result = kpi_correlation(frame, KPIS, method=method, min_periods=min_periods)
+    expected = frame[KPIS].corr(method=method, min_periods=min_periods)
+    pd.testing.assert_frame_equal(result, expected, atol=1e-12)
+
+
+@pytest.mark.parametrize("method", ["pearson", "spearman"])
+def test_kpi_correlation_by_matches_groupby(frame, method):
+    result = kpi_correlation_by(frame, by="eNodeB Name", kpis=KPIS, method=method)
+    expected = frame.groupby("eNodeB Name")[KPIS].corr(method=method)
+    expected.index.names = ["eNodeB Name", "KPI"]
+    pd.testing.assert_frame_equal(result, expected, atol=1e-12)
+
+
+def test_unknown_method_raises(frame):
+    with pytest.raises(ValueError):
+        kpi_correlation(frame, KPIS, method="kendall")
@@ -0,0 +1,46 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from benchmark import make_oss_export, legacy_clean_data1, legacy_clean_data2
+from preprocessing import clean_data, parse_timestamps
+
+
+def _legacy(df, legacy=legacy_clean_data1, reset_index=True):
+    """Legacy cleaning with its glued timestamps parsed and sorted, as in benchmark.py."""
+    expected = legacy(df)
+    expected['Date'] = parse_timestamps(expected['Date'])
+    expected = expected.sort_values('Date', kind='stable')
+    return expected.reset_index(drop=True) if reset_index else expected
+
+
+@pytest.fixture
+def exports():
+    raw = make_oss_export(n_sites=4, n_intervals=12, n_kpis=6)
+    kpis = [col for col in raw.columns if col.startswith('KPI')]
+    complete = raw.copy()
+    complete[kpis] = complete[kpis].ffill().bfill()
+    gaps = raw.copy()
+    gaps.loc[gaps.index[::5], kpis[0]] = np.nan
+    return complete, gaps, kpis
+
+
+def test_clean_data_matches_legacy(exports):
+    complete, gaps, _ = exports
+    for raw in [complete, gaps]:
+        pd.testing.assert_frame_equal(clean_data(raw), _legacy(raw))
+
+
+def test_clean_data_stadium_format_matches_legacy(exports):
+    raw = exports[1].rename(columns={'Date': 'Time', 'LocalCell Id': 'Sector'})
+    raw.insert(1, 'Game time', "1st half")
+    pd.testing.assert_frame_equal(clean_data(raw), _legacy(raw, legacy_clean_data2, reset_index=False))
+
+
+@pytest.mark.parametrize("first", [0, 1])
+def test_clean_data_does_not_depend_on_files_cleaned_before(exports, first):
+    complete, gaps, kpis = exports
+    order = [complete, gaps] if first == 0 else [gaps, complete]
+    for raw in order:
+        pd.testing.assert_frame_equal(clean_data(raw), _legacy(raw))
+    assert clean_data(complete)[kpis[0]].dtype == np.float64
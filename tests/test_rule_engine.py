@@ -0,0 +1,71 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from rule_engine import compile_rules, parse_rule
+
+
+def test_parse_compound_rule():
+    rule = parse_rule("DL PRB Usage(%) > 80 AND DL User throughput < 2 FOR 3 intervals")
+    assert rule["conditions"] == [
+        {"kpi": "DL PRB Usage(%)", "op": ">", "value": 80.0},
+        {"kpi": "DL User throughput", "op": "<", "value": 2.0},
+    ]
+    assert rule["combine"] == "and"
+    assert rule["consecutive"] == 3
+
+
+def test_parse_french_rule_with_decimal_comma():
+    rule = parse_rule("Taux de succès >= 98,5 ou Taux de coupure <= -0,5 pendant 2 intervalles consécutifs")
+    assert [cond["kpi"] for cond in rule["conditions"]] == ["Taux de succès", "Taux de coupure"]
+    assert [cond["value"] for cond in rule["conditions"]] == [98.5, -0.5]
+    assert rule["combine"] == "or"
+    assert rule["consecutive"] == 2
+
+
+def test_connectors_inside_kpi_names():
+    rule = parse_rule("Call Setup et Drop Rate > 5 et Handover ou Reselection < 90")
+    assert [cond["kpi"] for cond in rule["conditions"]] == ["Call Setup et Drop Rate", "Handover ou Reselection"]
+    assert rule["combine"] == "and"
+
+
+@pytest.mark.parametrize("connector, combine", [("and", "and"), ("Or", "or"), ("ET", "and"), ("Ou", "or")])
+def test_connectors_are_case_insensitive(connector, combine):
+    rule = parse_rule(f"A > 1 {connector} B < 2")
+    assert len(rule["conditions"]) == 2
+    assert rule["combine"] == combine
+
+
+@pytest.mark.parametrize("text", ["A > 1 AND B < 2 OR C > 3", "A > 1 et B < 2 ou C > 3"])
+def test_mixed_connectors_raise(text):
+    with pytest.raises(ValueError, match="ambiguë"):
+        parse_rule(text)
+
+
+@pytest.mark.parametrize("text", ["A > 1 AND", "A >", "A = 1", "A > 1 AND B"])
+def test_incomplete_rule_raises(text):
+    with pytest.raises(ValueError, match="non reconnue"):
+        parse_rule(text)
+
+
+def test_evaluate_counts_consecutive_intervals_per_cell():
+    dates = pd.date_range("2024-01-01", periods=5, freq="h")
+    df = pd.DataFrame({
+        "Date": list(dates) * 2,
+        "eNodeB Name": "S1",
+        "Cell Name": ["C1"] * 5 + ["C2"] * 5,
+        "A": [90, 90, 90, 10, 90, 90, 90, 10, 90, 90],
+        "B": [1.0] * 10,
+    })
+    # Shuffled rows: the duration follows the date order of each cell
+    df = df.sample(frac=1, random_state=0).reset_index(drop=True)
+    plan = compile_rules(["A > 80 AND B < 2 FOR 2 intervals", "A < 20"])
+    anomalies = plan.evaluate(df)
+
+    found = set(zip(anomalies["Cell Name"], anomalies["Date"].dt.hour, anomalies["Rule"]))
+    durable = "A > 80 AND B < 2 FOR 2 intervals"
+    assert found == {
+        ("C1", 1, durable), ("C1", 2, durable), ("C1", 3, "A < 20"),
+        ("C2", 1, durable), ("C2", 2, "A < 20"), ("C2", 4, durable),
+    }
+    assert np.all(anomalies.loc[anomalies["Rule"] == durable, "Value"] == 90)
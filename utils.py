@@ -35,6 +35,122 @@ def get_sites_list(df):
     else:
         return [], None
 
+
+# ----------- Site / cell index -----------
+
+def _segments(sorted_codes):
+    """Start and stop positions of the runs of equal values in a sorted array."""
+    n = len(sorted_codes)
+    if n == 0:
+        return np.array([], dtype=np.int64), np.array([], dtype=np.int64)
+    boundaries = np.flatnonzero(np.diff(sorted_codes)) + 1
+    return np.r_[0, boundaries], np.r_[boundaries, n]
+
+
+class SiteIndex:
+    """
+    Index of a cleaned DataFrame by site and by (site, cell).
+
+    The rows are ordered once by site, cell and date, and the range of every site
+    and every (site, cell) pair in that order is stored, so that selecting a site
+    or a cell is a slice of positions instead of a boolean mask over the whole
+    table. Only the positions are kept (8 bytes per row), not a sorted copy of
+    the frame: selections are taken from `df` itself.
+
+    Args:
+        df (pd.DataFrame): cleaned data
+        site_col (str): site column
+        cell_col (str): cell column
+        date_col (str): date column (optional, used to sort the rows of each cell)
+    """
+
+    def __init__(self, df, site_col='eNodeB Name', cell_col='Cell Name', date_col='Date'):
+        self.site_col = site_col
+        self.cell_col = cell_col
+
+        site_codes, site_uniques = pd.factorize(df[site_col], sort=True)
+        if cell_col in df.columns:
+            cell_codes, cell_uniques = pd.factorize(df[cell_col], sort=True)
+        else:
+            cell_codes, cell_uniques = np.zeros(len(df), dtype=np.int64), []
+
+        # np.lexsort sorts on the last key first: site, then cell, then date
+        sort_keys = [cell_codes, site_codes]
+        if date_col in df.columns:
+            date_codes, _ = pd.factorize(df[date_col], sort=True)
+            sort_keys.insert(0, date_codes)
+        order = np.lexsort(sort_keys)
+
+        self.df = df
+        self.order = order
+        site_codes = site_codes[order]
+        cell_codes = cell_codes[order]
+
+        # site -> (start, stop)
+        self.site_ranges = {}
+        for start, stop in zip(*_segments(site_codes)):
+            if site_codes[start] >= 0:
+                self.site_ranges[site_uniques[site_codes[start]]] = (int(start), int(stop))
+
+        # (site, cell) -> (start, stop), and site -> cells
+        self.cell_ranges = {}
+        self.site_cells = {}
+        pair_codes = site_codes.astype(np.int64) * (len(cell_uniques) + 1) + cell_codes
+        for start, stop in zip(*_segments(pair_codes)):
+            if site_codes[start] >= 0 and cell_codes[start] >= 0:
+                key = (site_uniques[site_codes[start]], cell_uniques[cell_codes[start]])
+                self.cell_ranges[key] = (int(start), int(stop))
+                self.site_cells.setdefault(key[0], []).append(key[1])
+
+    @property
+    def sites(self):
+        """List of the indexed sites."""
+        return list(self.site_ranges)
+
+    def cells(self, site):
+        """List of the cells of a site."""
+        return list(self.site_cells.get(site, []))
+
+    def site_frame(self, site):
+        """Rows of a site (empty frame if the site is unknown)."""
+        start, stop = self.site_ranges.get(site, (0, 0))
+        return self.df.take(self.order[start:stop])
+
+    def cell_frame(self, site, cell):
+        """Rows of one cell of a site (empty frame if the cell is unknown)."""
+        start, stop = self.cell_ranges.get((site, cell), (0, 0))
+        return self.df.take(self.order[start:stop])
+
+    def cells_frame(self, site, cells):
+        """Rows of several cells of a site."""
+        ranges = [self.cell_ranges[(site, cell)] for cell in cells if (site, cell) in self.cell_ranges]
+        if not ranges:
+            return self.df.iloc[0:0]
+        positions = np.concatenate([self.order[start:stop] for start, stop in ranges])
+        return self.df.take(positions)
+
+
+# ----------- Checkpoint labels -----------
+
+def labels_to_array(labels):
+    """
+    Cell / site labels as an array for a .npz checkpoint, keeping their type.
+
+    Strings are stored as text and numbers as numbers, so that the labels read
+    back by `labels_from_array` still match the values of the data. Mixed
+    types are stored as an object array (read back with allow_pickle).
+    """
+    values = pd.Index(list(labels)).to_numpy()
+    if values.dtype == object and all(isinstance(value, str) for value in values):
+        return values.astype(str)
+    return values
+
+
+def labels_from_array(values):
+    """Index of the labels written by `labels_to_array` (Python str / int / float values)."""
+    return pd.Index(values.tolist(), dtype=object)
+
+
 """
 df = pd.read_excel('data/raw/4G_KPI.xlsx')
 sites, site_col = get_sites_list(df)